@@ -1,9 +1,84 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, Canvas
-from PIL import Image, ImageTk
+from tkinter import messagebox, Canvas
 import os
+import sys
+import time
 from pathlib import Path
-from io import BytesIO
+
+import engine
+import profiling
+from batch import BatchRunner, format_duration
+from estimator import SizeEstimator
+from prefetch import Prefetcher
+from thumbnails import THUMBNAIL_SIZE, ThumbnailCache
+from manifest import Manifest
+from outputstore import STORE_MB, OutputStore
+from scanner import FolderScan, output_folder_for
+from writer import MAX_PENDING_WRITES, BackgroundWriter
+
+# Wait this long after the last settings change before estimating output size
+ESTIMATE_DEBOUNCE_MS = 250
+
+# Images decoded ahead of / behind the current one, and the decoded-image
+# cache limit. Set SSRESIZER_CACHE_STATS=1 to print hit/miss stats for tuning.
+PREFETCH_AHEAD = int(os.environ.get("SSRESIZER_PREFETCH_AHEAD", 2))
+PREFETCH_BEHIND = int(os.environ.get("SSRESIZER_PREFETCH_BEHIND", 1))
+IMAGE_CACHE_MB = int(os.environ.get("SSRESIZER_IMAGE_CACHE_MB", 512))
+SHOW_CACHE_STATS = bool(os.environ.get("SSRESIZER_CACHE_STATS"))
+
+# Crop slider events are coalesced into one preview redraw per idle cycle,
+# at most once per frame interval (60 fps). Set SSRESIZER_FRAME_STATS=1 to
+# print redraw times every FRAME_STATS_EVERY frames
+FRAME_INTERVAL_MS = 16
+SHOW_FRAME_STATS = bool(os.environ.get("SSRESIZER_FRAME_STATS"))
+FRAME_STATS_EVERY = 120
+
+# Size limit of the persistent thumbnail cache in the XDG cache dir
+THUMBNAIL_CACHE_MB = int(os.environ.get("SSRESIZER_THUMBNAIL_CACHE_MB", 100))
+
+# Resampling strategies (see engine.RESAMPLING) for the on-screen preview
+# and for saved images
+PREVIEW_RESAMPLE = os.environ.get("SSRESIZER_PREVIEW_RESAMPLE", engine.PREVIEW_STRATEGY)
+EXPORT_RESAMPLE = os.environ.get("SSRESIZER_RESAMPLE", "best")
+
+# Inputs that would decode to more than this are read in memory-bounded bands
+MEMORY_BUDGET_MB = int(os.environ.get("SSRESIZER_MEMORY_MB", engine.MEMORY_BUDGET // (1024 * 1024)))
+
+# Set SSRESIZER_PROFILE=1 to time each stage of Process All and add a
+# summary to the completion dialog, or to a .json/.csv path to also log
+# every image's timings there
+PROFILE = os.environ.get("SSRESIZER_PROFILE", "")
+
+# Set SSRESIZER_DEDUP=1 (or to a folder) to let Process All reuse outputs
+# rendered before from identical source bytes and settings
+DEDUP = os.environ.get("SSRESIZER_DEDUP", "")
+DEDUP_MB = int(os.environ.get("SSRESIZER_DEDUP_MB", STORE_MB))
+
+# Process & Next saves in the background; this many saves can be queued
+# before the next click waits for one to finish
+WRITE_QUEUE = int(os.environ.get("SSRESIZER_WRITE_QUEUE", MAX_PENDING_WRITES))
+
+def save_image(image, img_path, output_path, settings, manifest):
+    """Save one Process & Next image on the writer thread; returns the max file size traces"""
+    traces = []
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    engine.export(image, output_path, settings, traces)
+    manifest.record(img_path, output_path, settings)
+    return traces
+
+
+def save_presets(image, img_path, output_folder, presets, relative_dir, manifest):
+    """save_image at every fan-out preset; without image, img_path is decoded again"""
+    traces = []
+    if image is None:
+        output_paths = engine.process_presets(img_path, output_folder, presets, relative_dir,
+                                              traces, MEMORY_BUDGET_MB * 1024 * 1024)
+    else:
+        output_paths = engine.export_presets(image, img_path, output_folder, presets,
+                                             relative_dir, traces)
+    manifest.record(img_path, output_paths, presets)
+    return traces
+
 
 class ModernButton(Canvas):
     """Custom button widget using Canvas for full color control"""
@@ -68,6 +143,10 @@ class ModernButton(Canvas):
         if not self.is_hovered:
             self.configure(bg=color)
 
+    def set_text(self, text):
+        self.text = text
+        self.itemconfigure(self.text_id, text=text)
+
 class ImageResizerApp:
     def __init__(self, root):
         self.root = root
@@ -98,25 +177,47 @@ class ImageResizerApp:
         self.root.configure(bg=self.colors['bg'])
         
         # Resolution presets
-        self.resolutions = {
-            "480P": {"landscape": (854, 480), "portrait": (480, 854)},
-            "720P": {"landscape": (1280, 720), "portrait": (720, 1280)},
-            "1080P": {"landscape": (1920, 1080), "portrait": (1080, 1920)},
-            "2K": {"landscape": (2560, 1440), "portrait": (1440, 2560)},
-            "4K": {"landscape": (3840, 2160), "portrait": (2160, 3840)}
-        }
+        self.resolutions = engine.RESOLUTIONS
         
         self.folder_path = None
         self.image_files = []
         self.current_index = 0
         self.current_image = None
+        self.original_size = None
+        self.decoded_scale = 1
         self.output_folder = None
+        self.manifest = None
+
+        # Background folder scan; image_files is its growing list of paths
+        # relative to folder_path
+        self.scan = None
+        self.info_suffix = ""
+
+        # Quality search of the last image saved with a max file size
+        self.last_search = ""
+
+        # Canvas-sized copy of current_image that the crop preview runs against
+        self.preview_proxy = None
+        self.proxy_bounds = None
+        self.overlay_thumb = None
+
+        # Preview canvas items and the PhotoImages they show are created once
+        # and updated in place; redraw_id is a scheduled coalesced redraw
+        self.photo = None
+        self.photo_key = None
+        self.photo_item = None
+        self.overlay_photo_source = None
+        self.overlay_items = None
+        self.redraw_id = None
+        self.last_frame = 0.0
+        self.frame_times = profiling.FrameTimes()
 
         # Default settings
         self.selected_resolution = "1080P"
         self.selected_orientation = "landscape"
         self.output_format = "JPEG"
         self.jpeg_quality = 85
+        self.encoder_profile = "balanced"
         self.crop_x = 0
         self.crop_y = 0
 
@@ -124,8 +225,36 @@ class ImageResizerApp:
         self.res_buttons = {}
         self.orient_buttons = {}
         self.format_buttons = {}
+        self.encoder_buttons = {}
+
+        # Running "Process All" job, if any
+        self.batch = None
+
+        # Process & Next saves; failed ones are kept by image path until it saves
+        self.writer = BackgroundWriter(WRITE_QUEUE)
+        self.write_failures = {}
+        self.writes_polling = False
+        # (label, save, args) of a Process & Next save waiting for room in the queue
+        self.waiting_write = None
+
+        # Background decoding of the neighbouring images
+        self.prefetcher = Prefetcher(ahead=PREFETCH_AHEAD, behind=PREFETCH_BEHIND,
+                                     max_bytes=IMAGE_CACHE_MB * 1024 * 1024,
+                                     memory_budget=MEMORY_BUDGET_MB * 1024 * 1024)
+
+        # Persistent thumbnails for the uncropped overlay
+        self.thumbnails = ThumbnailCache(max_bytes=THUMBNAIL_CACHE_MB * 1024 * 1024,
+                                         memory_budget=MEMORY_BUDGET_MB * 1024 * 1024)
+
+        # Background output-size estimate for the info bar
+        self.estimator = SizeEstimator()
+        self.estimate_after_id = None
+        self.estimate_future = None
 
         self.create_widgets()
+
+        # Finish queued saves before the window goes away
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
     def create_widgets(self):
         # Main container with sidebar layout
@@ -152,6 +281,141 @@ class ImageResizerApp:
         settings_container = tk.Frame(sidebar, bg=self.colors['sidebar'])
         settings_container.pack(fill=tk.BOTH, expand=True, padx=20)
         
+        # Filled in by create_settings_panel once the welcome screen is up
+        self.settings_container = settings_container
+        self.settings_built = False
+
+        # Right Content Area
+        content_area = tk.Frame(main_container, bg=self.colors['bg'])
+        content_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # Top bar with info
+        top_bar = tk.Frame(content_area, bg=self.colors['card'], height=60)
+        top_bar.pack(fill=tk.X, padx=20, pady=(20, 10))
+        top_bar.pack_propagate(False)
+        
+        self.info_label = tk.Label(top_bar, text="", font=("Segoe UI", 10), 
+                                   bg=self.colors['card'], fg='white',
+                                   anchor='w', padx=20)
+        self.info_label.pack(fill=tk.BOTH, expand=True)
+        
+        # Image preview area
+        preview_container = tk.Frame(content_area, bg=self.colors['bg'])
+        preview_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 10))
+
+        self.canvas_frame = tk.Frame(preview_container, bg=self.colors['card'],
+                                     highlightbackground=self.colors['border'],
+                                     highlightthickness=1)
+        self.canvas_frame.pack(fill=tk.BOTH, expand=True)
+
+        self.canvas = tk.Canvas(self.canvas_frame, bg=self.colors['bg'],
+                               highlightthickness=0, bd=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True, padx=1, pady=1)
+
+        # Small preview of uncropped image (top right corner)
+        self.preview_overlay_frame = tk.Frame(self.canvas, bg=self.colors['card'],
+                                             highlightbackground=self.colors['primary'],
+                                             highlightthickness=2)
+
+        # Header for the preview
+        preview_header = tk.Frame(self.preview_overlay_frame, bg=self.colors['sidebar'], height=25)
+        preview_header.pack(fill=tk.X)
+        preview_header.pack_propagate(False)
+
+        tk.Label(preview_header, text="Original (Uncropped)",
+                font=("Segoe UI", 9, "bold"), bg=self.colors['sidebar'],
+                fg='white', padx=8).pack(side=tk.LEFT, fill=tk.Y)
+
+        # Canvas for the small preview
+        self.preview_canvas = tk.Canvas(self.preview_overlay_frame,
+                                       bg=self.colors['bg'],
+                                       width=200, height=150,
+                                       highlightthickness=0, bd=0)
+        self.preview_canvas.pack(padx=2, pady=2)
+
+        # Initially hidden
+        self.preview_overlay_frame.place_forget()
+
+        # Welcome screen (shown when no folder is selected)
+        self.welcome_frame = tk.Frame(self.canvas, bg=self.colors['bg'])
+
+        welcome_content = tk.Frame(self.welcome_frame, bg=self.colors['bg'])
+        welcome_content.place(relx=0.5, rely=0.5, anchor='center')
+
+        tk.Label(welcome_content, text="🖼️", font=("Segoe UI", 72),
+                bg=self.colors['bg'], fg=self.colors['primary']).pack(pady=(0, 20))
+
+        tk.Label(welcome_content, text="Welcome to Image Resizer Pro",
+                font=("Segoe UI", 24, "bold"), bg=self.colors['bg'],
+                fg='white').pack(pady=(0, 10))
+
+        tk.Label(welcome_content, text="Select a folder to get started",
+                font=("Segoe UI", 12), bg=self.colors['bg'],
+                fg=self.colors['text_dim']).pack(pady=(0, 30))
+
+        select_folder_btn = ModernButton(welcome_content, "📁 Select Folder",
+                                        self.select_folder,
+                                        bg_color=self.colors['primary'],
+                                        hover_color=self.colors['primary_hover'],
+                                        font_size=16, bold=True, width=250, height=60)
+        select_folder_btn.pack()
+
+        self.recursive_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(welcome_content, text="Include subfolders",
+                       variable=self.recursive_var, font=("Segoe UI", 10),
+                       bg=self.colors['bg'], fg=self.colors['text_dim'],
+                       selectcolor=self.colors['card'], activebackground=self.colors['bg'],
+                       activeforeground='white', highlightthickness=0, bd=0).pack(pady=(15, 0))
+
+        # Show welcome screen initially; the settings panel is built after its first paint
+        self.welcome_frame.bind('<Expose>', self.on_welcome_expose)
+        self.show_welcome_screen()
+        
+        # Bottom action bar
+        action_bar = tk.Frame(content_area, bg=self.colors['bg'], height=80)
+        action_bar.pack(fill=tk.X, padx=20, pady=(0, 20))
+        action_bar.pack_propagate(False)
+        
+        btn_container = tk.Frame(action_bar, bg=self.colors['bg'])
+        btn_container.pack(expand=True)
+        
+        # Navigation buttons with modern style
+        prev_btn = ModernButton(btn_container, "← Previous", self.previous_image,
+                               bg_color=self.colors['bg'],
+                               hover_color=self.colors['sidebar'],
+                               font_size=14, bold=True, width=150)
+        prev_btn.pack(side=tk.LEFT, padx=5)
+        
+        skip_btn = ModernButton(btn_container, "Skip →", self.skip_image,
+                               bg_color=self.colors['bg'],
+                               hover_color=self.colors['sidebar'],
+                               font_size=14, bold=True, width=150)
+        skip_btn.pack(side=tk.LEFT, padx=5)
+        
+        process_btn = ModernButton(btn_container, "✓ Process & Next", self.process_and_next,
+                                  bg_color=self.colors['primary'],
+                                  hover_color=self.colors['primary_hover'],
+                                  font_size=16, bold=True, width=200, height=50)
+        process_btn.pack(side=tk.LEFT, padx=5)
+        
+        self.batch_btn = ModernButton(btn_container, "⚡ Process All", self.process_all,
+                                     bg_color=self.colors['accent'],
+                                     hover_color='#7c3aed',
+                                     font_size=14, bold=True, width=180)
+        self.batch_btn.pack(side=tk.LEFT, padx=5)
+        
+    def on_welcome_expose(self, event):
+        # Queued behind the drawing of the welcome screen, so it's on screen first
+        if not self.settings_built:
+            self.root.after_idle(self.create_settings_panel)
+
+    def create_settings_panel(self):
+        """Build the sidebar's settings sections; a no-op once built"""
+        if self.settings_built:
+            return
+        self.settings_built = True
+        settings_container = self.settings_container
+
         # Resolution Card (Dropdown)
         self.create_section_header(settings_container, "Resolution")
         res_card = self.create_card(settings_container)
@@ -211,6 +475,30 @@ class ImageResizerApp:
         self.resolution_menu.bind('<Leave>', on_leave)
         
         self.resolution_menu.pack(fill=tk.X)
+
+        # Fan-out: write every ticked preset per image, each into its own
+        # subfolder, from a single decode
+        tk.Label(res_card, text="Fan-out to presets (one subfolder each)",
+                font=("Segoe UI", 9, "bold"), bg=self.colors['card'],
+                fg='white').pack(anchor='w', pady=(10, 0))
+        fan_out_frame = tk.Frame(res_card, bg=self.colors['card'])
+        fan_out_frame.pack(fill=tk.X)
+        self.fan_out_vars = {}
+        for res in self.resolutions:
+            var = tk.BooleanVar(value=False)
+            tk.Checkbutton(fan_out_frame, text=res, variable=var, command=self.on_fan_out_change,
+                           font=("Segoe UI", 9), bg=self.colors['card'], fg=self.colors['text_dim'],
+                           selectcolor=self.colors['bg'], activebackground=self.colors['card'],
+                           activeforeground='white', highlightthickness=0,
+                           bd=0).pack(side=tk.LEFT, padx=(0, 2))
+            self.fan_out_vars[res] = var
+        self.fan_out_both_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(res_card, text="Both orientations", variable=self.fan_out_both_var,
+                       command=self.on_fan_out_change,
+                       font=("Segoe UI", 9), bg=self.colors['card'], fg=self.colors['text_dim'],
+                       selectcolor=self.colors['bg'], activebackground=self.colors['card'],
+                       activeforeground='white', highlightthickness=0, bd=0,
+                       anchor='w').pack(fill=tk.X)
         
         # Orientation Card
         self.create_section_header(settings_container, "Orientation", 15)
@@ -325,13 +613,26 @@ class ImageResizerApp:
                                font_size=10, bold=True, width=90)
         webp_btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(3, 0))
         self.format_buttons['WEBP'] = webp_btn
-        
-        # JPEG Quality slider (shown only for JPEG)
+
+        # Encoder profile: encode speed vs. file size (see engine.ENCODER_PROFILES)
+        encoder_frame = tk.Frame(format_card, bg=self.colors['card'])
+        encoder_frame.pack(fill=tk.X, pady=(8, 0))
+        for i, profile in enumerate(engine.ENCODER_PROFILES):
+            btn = ModernButton(encoder_frame, profile.capitalize(),
+                               lambda p=profile: self.on_encoder_change(p),
+                               bg_color=self.colors['bg'],
+                               hover_color=self.colors['sidebar'],
+                               font_size=9, bold=False, width=90, height=34)
+            padx = (0, 3) if i == 0 else (3, 0) if i == len(engine.ENCODER_PROFILES) - 1 else (3, 3)
+            btn.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=padx)
+            self.encoder_buttons[profile] = btn
+
+        # Quality slider (shown for JPEG and WEBP)
         self.quality_frame = tk.Frame(format_card, bg=self.colors['card'])
         
         q_label_frame = tk.Frame(self.quality_frame, bg=self.colors['card'])
         q_label_frame.pack(fill=tk.X, pady=(10, 0))
-        tk.Label(q_label_frame, text="JPEG Quality", font=("Segoe UI", 9, "bold"), 
+        tk.Label(q_label_frame, text="Quality", font=("Segoe UI", 9, "bold"), 
                 bg=self.colors['card'], fg='white').pack(side=tk.LEFT)
         self.quality_value_label = tk.Label(q_label_frame, text=str(self.jpeg_quality), 
                                            font=("Segoe UI", 9), 
@@ -348,118 +649,33 @@ class ImageResizerApp:
         self.quality_scale.pack(fill=tk.X, pady=(5, 0))
         
         self.update_format_buttons()
-        
-        # Right Content Area
-        content_area = tk.Frame(main_container, bg=self.colors['bg'])
-        content_area.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        
-        # Top bar with info
-        top_bar = tk.Frame(content_area, bg=self.colors['card'], height=60)
-        top_bar.pack(fill=tk.X, padx=20, pady=(20, 10))
-        top_bar.pack_propagate(False)
-        
-        self.info_label = tk.Label(top_bar, text="", font=("Segoe UI", 10), 
-                                   bg=self.colors['card'], fg='white',
-                                   anchor='w', padx=20)
-        self.info_label.pack(fill=tk.BOTH, expand=True)
-        
-        # Image preview area
-        preview_container = tk.Frame(content_area, bg=self.colors['bg'])
-        preview_container.pack(fill=tk.BOTH, expand=True, padx=20, pady=(0, 10))
-
-        self.canvas_frame = tk.Frame(preview_container, bg=self.colors['card'],
-                                     highlightbackground=self.colors['border'],
-                                     highlightthickness=1)
-        self.canvas_frame.pack(fill=tk.BOTH, expand=True)
-
-        self.canvas = tk.Canvas(self.canvas_frame, bg=self.colors['bg'],
-                               highlightthickness=0, bd=0)
-        self.canvas.pack(fill=tk.BOTH, expand=True, padx=1, pady=1)
-
-        # Small preview of uncropped image (top right corner)
-        self.preview_overlay_frame = tk.Frame(self.canvas, bg=self.colors['card'],
-                                             highlightbackground=self.colors['primary'],
-                                             highlightthickness=2)
-
-        # Header for the preview
-        preview_header = tk.Frame(self.preview_overlay_frame, bg=self.colors['sidebar'], height=25)
-        preview_header.pack(fill=tk.X)
-        preview_header.pack_propagate(False)
-
-        tk.Label(preview_header, text="Original (Uncropped)",
-                font=("Segoe UI", 9, "bold"), bg=self.colors['sidebar'],
-                fg='white', padx=8).pack(side=tk.LEFT, fill=tk.Y)
-
-        # Canvas for the small preview
-        self.preview_canvas = tk.Canvas(self.preview_overlay_frame,
-                                       bg=self.colors['bg'],
-                                       width=200, height=150,
-                                       highlightthickness=0, bd=0)
-        self.preview_canvas.pack(padx=2, pady=2)
-
-        # Initially hidden
-        self.preview_overlay_frame.place_forget()
-
-        # Welcome screen (shown when no folder is selected)
-        self.welcome_frame = tk.Frame(self.canvas, bg=self.colors['bg'])
-
-        welcome_content = tk.Frame(self.welcome_frame, bg=self.colors['bg'])
-        welcome_content.place(relx=0.5, rely=0.5, anchor='center')
-
-        tk.Label(welcome_content, text="🖼️", font=("Segoe UI", 72),
-                bg=self.colors['bg'], fg=self.colors['primary']).pack(pady=(0, 20))
-
-        tk.Label(welcome_content, text="Welcome to Image Resizer Pro",
-                font=("Segoe UI", 24, "bold"), bg=self.colors['bg'],
-                fg='white').pack(pady=(0, 10))
-
-        tk.Label(welcome_content, text="Select a folder to get started",
-                font=("Segoe UI", 12), bg=self.colors['bg'],
-                fg=self.colors['text_dim']).pack(pady=(0, 30))
+        self.update_encoder_buttons()
 
-        select_folder_btn = ModernButton(welcome_content, "📁 Select Folder",
-                                        self.select_folder,
-                                        bg_color=self.colors['primary'],
-                                        hover_color=self.colors['primary_hover'],
-                                        font_size=16, bold=True, width=250, height=60)
-        select_folder_btn.pack()
+        # Max file size: quality is searched downwards from the slider to fit
+        max_size_frame = tk.Frame(format_card, bg=self.colors['card'])
+        max_size_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(8, 0))
+        tk.Label(max_size_frame, text="Max file size (KB)", font=("Segoe UI", 9, "bold"),
+                bg=self.colors['card'], fg='white').pack(side=tk.LEFT)
+        tk.Label(max_size_frame, text="JPEG/WEBP", font=("Segoe UI", 8),
+                bg=self.colors['card'], fg=self.colors['text_dim']).pack(side=tk.LEFT, padx=(6, 0))
+        self.max_size_var = tk.StringVar(value="")
+        max_size_entry = tk.Entry(max_size_frame, textvariable=self.max_size_var, width=8,
+                                  font=("Segoe UI", 9), bg=self.colors['bg'], fg='white',
+                                  insertbackground='white', relief=tk.FLAT,
+                                  highlightthickness=1, highlightbackground=self.colors['border'],
+                                  highlightcolor=self.colors['primary'])
+        max_size_entry.pack(side=tk.RIGHT)
+        max_size_entry.bind('<KeyRelease>', lambda e: self.update_info())
+
+        # Size estimate mode: sampled prediction (fast) or full encode (exact)
+        self.exact_estimate_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(format_card, text="Exact size estimate (slower)",
+                       variable=self.exact_estimate_var, command=self.on_estimate_mode_change,
+                       font=("Segoe UI", 9), bg=self.colors['card'], fg=self.colors['text_dim'],
+                       selectcolor=self.colors['bg'], activebackground=self.colors['card'],
+                       activeforeground='white', highlightthickness=0, bd=0,
+                       anchor='w').pack(side=tk.BOTTOM, fill=tk.X, pady=(8, 0))
 
-        # Show welcome screen initially
-        self.show_welcome_screen()
-        
-        # Bottom action bar
-        action_bar = tk.Frame(content_area, bg=self.colors['bg'], height=80)
-        action_bar.pack(fill=tk.X, padx=20, pady=(0, 20))
-        action_bar.pack_propagate(False)
-        
-        btn_container = tk.Frame(action_bar, bg=self.colors['bg'])
-        btn_container.pack(expand=True)
-        
-        # Navigation buttons with modern style
-        prev_btn = ModernButton(btn_container, "← Previous", self.previous_image,
-                               bg_color=self.colors['bg'],
-                               hover_color=self.colors['sidebar'],
-                               font_size=14, bold=True, width=150)
-        prev_btn.pack(side=tk.LEFT, padx=5)
-        
-        skip_btn = ModernButton(btn_container, "Skip →", self.skip_image,
-                               bg_color=self.colors['bg'],
-                               hover_color=self.colors['sidebar'],
-                               font_size=14, bold=True, width=150)
-        skip_btn.pack(side=tk.LEFT, padx=5)
-        
-        process_btn = ModernButton(btn_container, "✓ Process & Next", self.process_and_next,
-                                  bg_color=self.colors['primary'],
-                                  hover_color=self.colors['primary_hover'],
-                                  font_size=16, bold=True, width=200, height=50)
-        process_btn.pack(side=tk.LEFT, padx=5)
-        
-        batch_btn = ModernButton(btn_container, "⚡ Process All", self.process_all,
-                                bg_color=self.colors['accent'],
-                                hover_color='#7c3aed',
-                                font_size=14, bold=True, width=180)
-        batch_btn.pack(side=tk.LEFT, padx=5)
-        
     def create_section_header(self, parent, text, top_pad=20):
         tk.Label(parent, text=text, font=("Segoe UI", 11, "bold"), 
                 bg=self.colors['sidebar'], fg='white').pack(anchor='w', pady=(top_pad, 8))
@@ -475,11 +691,18 @@ class ImageResizerApp:
     
     def on_resolution_change(self, resolution):
         self.selected_resolution = resolution
-        self.display_preview()
-        self.update_info()
+        self.refresh_current_image()
     
     def on_resolution_dropdown_change(self, resolution):
         self.selected_resolution = resolution
+        self.refresh_current_image()
+
+    def refresh_current_image(self):
+        """Redraw after a target change, re-decoding if the loaded scale is now too small"""
+        if (self.current_image and
+                engine.max_scale(self.original_size, self.get_settings()) < self.decoded_scale):
+            self.load_image()
+            return
         self.display_preview()
         self.update_info()
     
@@ -496,8 +719,7 @@ class ImageResizerApp:
         self.selected_orientation = orientation
         self.update_orientation_buttons()
         self.update_crop_sliders()
-        self.display_preview()
-        self.update_info()
+        self.refresh_current_image()
     
     def update_orientation_buttons(self):
         for orient, btn in self.orient_buttons.items():
@@ -536,17 +758,39 @@ class ImageResizerApp:
                 btn.set_bg(self.colors['bg'])
                 btn.hover_color = self.colors['sidebar']
         
-        # Show/hide JPEG quality slider
-        if self.output_format == "JPEG":
+        # Show/hide the quality slider; PNG is lossless
+        if self.output_format != "PNG":
             self.quality_frame.pack(fill=tk.X, pady=(5, 5))
         else:
             self.quality_frame.pack_forget()
     
+    def on_encoder_change(self, profile):
+        self.encoder_profile = profile
+        self.update_encoder_buttons()
+        self.update_info()
+
+    def update_encoder_buttons(self):
+        for profile, btn in self.encoder_buttons.items():
+            if profile == self.encoder_profile:
+                btn.set_bg(self.colors['primary'])
+                btn.hover_color = self.colors['primary_hover']
+            else:
+                btn.set_bg(self.colors['bg'])
+                btn.hover_color = self.colors['sidebar']
+
     def on_quality_change(self, val):
         self.jpeg_quality = int(float(val))
         self.quality_value_label.config(text=str(self.jpeg_quality))
         self.update_info()
 
+    def on_fan_out_change(self):
+        if self.current_image and not self.batch:
+            self.render_info()
+
+    def on_estimate_mode_change(self):
+        self.estimator.exact = self.exact_estimate_var.get()
+        self.update_info()
+
     def show_welcome_screen(self):
         """Show the welcome screen"""
         self.welcome_frame.place(relx=0, rely=0, relwidth=1, relheight=1)
@@ -557,20 +801,39 @@ class ImageResizerApp:
 
     def reset_to_welcome(self):
         """Reset the app state and return to welcome screen"""
+        # Saves still queued belong to this folder
+        self.flush_writes()
+
         # Clear current state
         self.folder_path = None
         self.image_files = []
         self.current_index = 0
         self.current_image = None
+        self.original_size = None
+        self.preview_proxy = None
+        self.overlay_thumb = None
         self.output_folder = None
+        self.last_search = ""
 
         # Clear the canvas
+        self.cancel_redraw()
         self.canvas.delete("all")
+        self.photo = None
+        self.photo_key = None
+        self.photo_item = None
 
         # Hide the preview overlay
         self.preview_overlay_frame.place_forget()
 
+        # Stop scanning and drop decoded images from the previous folder
+        if self.scan:
+            self.scan.stop()
+            self.scan = None
+        self.thumbnails.cancel_fill()
+        self.prefetcher.clear()
+
         # Clear info label
+        self.cancel_estimate()
         self.info_label.config(text="")
 
         # Show welcome screen
@@ -581,63 +844,167 @@ class ImageResizerApp:
         self.root.lift()
         self.root.focus_force()
 
+        from tkinter import filedialog
+        self.create_settings_panel()
         self.folder_path = filedialog.askdirectory(title="Select Folder with Images")
         if not self.folder_path:
             # User cancelled - just return without quitting
             return
 
-        # Get all image files
-        extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp')
-        self.image_files = [f for f in os.listdir(self.folder_path)
-                           if f.lower().endswith(extensions)]
-        self.image_files.sort()
+        # Scan in the background; the first image shows as soon as it's found
+        self.scan = FolderScan(self.folder_path, recursive=self.recursive_var.get()).start()
+        self.image_files = self.scan.files
+        self.wait_for_first_image(self.scan)
 
+    def wait_for_first_image(self, scan):
+        if scan is not self.scan:
+            return
         if not self.image_files:
+            if not scan.done:
+                self.root.after(50, self.wait_for_first_image, scan)
+                return
+            self.scan = None
             messagebox.showerror("No Images", "No images found in the selected folder.")
             return
 
         # Create output folder
-        self.output_folder = os.path.join(self.folder_path, "SSResized")
+        self.output_folder = os.path.join(self.folder_path, engine.OUTPUT_FOLDER_NAME)
         os.makedirs(self.output_folder, exist_ok=True)
+        self.manifest = Manifest(self.output_folder)
 
         # Hide welcome screen and show first image
         self.hide_welcome_screen()
         self.current_index = 0
         self.load_image()
+        self.poll_scan(scan)
+
+        # Build thumbnails in the background from here on, following the scan, as many
+        # as fit in the thumbnail cache
+        self.thumbnails.fill(self.remaining_paths(self.current_index))
+
+    def poll_scan(self, scan):
+        """Keep the image count current while the scan runs"""
+        if scan is not self.scan:
+            return
+        if self.current_image and not self.batch:
+            self.render_info()
+        if not scan.done:
+            self.root.after(250, self.poll_scan, scan)
+
+    def scanning(self):
+        return self.scan is not None and not self.scan.done
+
+    def image_path(self, index):
+        return os.path.join(self.folder_path, self.image_files[index])
+
+    def remaining_paths(self, start):
+        """Image paths from start on, following the folder scan while it runs"""
+        scan = self.scan
+        index = start
+        while True:
+            done = scan is None or scan.done
+            if index < len(self.image_files):
+                yield self.image_path(index)
+                index += 1
+            elif done:
+                return
+            else:
+                time.sleep(0.05)
         
     def load_image(self):
+        if self.current_index >= len(self.image_files) and self.scanning():
+            # Skipped past what the scan has found so far
+            self.info_label.config(text="Scanning folder…")
+            self.root.after(100, self.load_image)
+            return
         if self.current_index >= len(self.image_files):
             messagebox.showinfo("Complete", "All images have been processed!")
             self.reset_to_welcome()
             return
 
-        img_path = os.path.join(self.folder_path, self.image_files[self.current_index])
-        self.current_image = Image.open(img_path)
+        img_path = self.image_path(self.current_index)
+        settings = self.get_settings()
+        proxy_bounds = self.get_canvas_size()
+
+        # Decode only as many pixels as the selected target needs; usually
+        # this was already done in the background
+        decoded = self.prefetcher.get(img_path, settings, proxy_bounds)
+        self.current_image = decoded.image
+        self.original_size = decoded.original_size
+        self.preview_proxy = decoded.proxy
+        self.proxy_bounds = decoded.proxy_bounds
+        self.decoded_scale = max(1, round(self.original_size[0] / self.current_image.size[0]))
+        self.overlay_thumb = None
         self.display_preview()
         self.update_info()
-        
-    def display_preview(self):
-        if not self.current_image:
-            return
-        
-        # Get target resolution
-        target_width, target_height = self.get_target_resolution()
-        
-        # Calculate crop
-        cropped = self.get_cropped_image()
-        
-        # Resize to target
-        resized = cropped.resize((target_width, target_height), Image.Resampling.LANCZOS)
-        
-        # Scale for display
+        self.prefetch_neighbours(settings, proxy_bounds)
+
+    def prefetch_neighbours(self, settings, proxy_bounds):
+        first = max(0, self.current_index - PREFETCH_BEHIND)
+        last = min(len(self.image_files), self.current_index + PREFETCH_AHEAD + 1)
+        paths = [self.image_path(i) for i in range(first, last)]
+        self.prefetcher.prefetch_around(paths, self.current_index - first, settings, proxy_bounds)
+
+        if SHOW_CACHE_STATS:
+            stats = self.prefetcher.stats()
+            print(f"image cache: {stats['hits']} hits, {stats['waits']} waited, "
+                  f"{stats['misses']} misses ({stats['hit_rate']:.0%}), "
+                  f"{stats['cached_images']} images / {stats['cached_mb']:.0f} MB, "
+                  f"{stats['evictions']} evictions", file=sys.stderr)
+        
+    def get_canvas_size(self):
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
         
         if canvas_width <= 1 or canvas_height <= 1:
             canvas_width = 960
             canvas_height = 540
+        return canvas_width, canvas_height
+
+    def get_preview_proxy(self, canvas_width, canvas_height):
+        """Cached canvas-resolution copy of the current image, rebuilt if the canvas grows"""
+        if (self.preview_proxy is None or canvas_width > self.proxy_bounds[0]
+                or canvas_height > self.proxy_bounds[1]):
+            self.proxy_bounds = (canvas_width, canvas_height)
+            self.preview_proxy = engine.make_proxy(self.current_image, self.proxy_bounds)
+            self.overlay_thumb = None
+        return self.preview_proxy
+
+    def request_preview(self):
+        """Redraw the preview once pending events are handled, so a burst of them shares a frame"""
+        self.frame_times.requests += 1
+        if self.redraw_id is not None:
+            return
+        wait_ms = FRAME_INTERVAL_MS - (time.perf_counter() - self.last_frame) * 1000
+        if wait_ms > 0:
+            self.redraw_id = self.root.after(int(wait_ms) + 1, self.draw_requested_preview)
+        else:
+            self.redraw_id = self.root.after_idle(self.draw_requested_preview)
+
+    def draw_requested_preview(self):
+        self.redraw_id = None
+        self.display_preview()
+
+    def cancel_redraw(self):
+        if self.redraw_id is not None:
+            self.root.after_cancel(self.redraw_id)
+            self.redraw_id = None
+
+    def display_preview(self):
+        # A direct redraw covers any requested one
+        self.cancel_redraw()
+        if not self.current_image:
+            return
+        start = time.perf_counter()
+        self.last_frame = start
         
-        img_ratio = resized.width / resized.height
+        # Scale for display
+        canvas_width, canvas_height = self.get_canvas_size()
+        proxy = self.get_preview_proxy(canvas_width, canvas_height)
+        
+        # Fit the target aspect ratio inside the canvas
+        target_width, target_height = self.get_target_resolution()
+        img_ratio = target_width / target_height
         canvas_ratio = canvas_width / canvas_height
         
         if img_ratio > canvas_ratio:
@@ -647,15 +1014,34 @@ class ImageResizerApp:
             display_height = canvas_height
             display_width = int(canvas_height * img_ratio)
         
-        display_image = resized.resize((display_width, display_height), Image.Resampling.LANCZOS)
+        # Crop and scale the proxy; full-resolution pixels are only touched on export
+        display_image = engine.render_preview(proxy, self.get_settings(),
+                                              (display_width, display_height), PREVIEW_RESAMPLE)
         
-        self.photo = ImageTk.PhotoImage(display_image)
-        self.canvas.delete("all")
-        self.canvas.create_image(canvas_width // 2, canvas_height // 2, image=self.photo, anchor=tk.CENTER)
+        from PIL import ImageTk
+
+        # Paste into the current PhotoImage while the shape is unchanged (crop drags),
+        # rather than creating a Tk image and canvas item per frame
+        key = (display_image.mode, display_image.size)
+        if key == self.photo_key and self.photo is not None and self.photo_item is not None:
+            self.photo.paste(display_image)
+        else:
+            self.photo = ImageTk.PhotoImage(display_image)
+            self.photo_key = key
+        center = (canvas_width // 2, canvas_height // 2)
+        if self.photo_item is None:
+            self.photo_item = self.canvas.create_image(*center, image=self.photo, anchor=tk.CENTER)
+        else:
+            self.canvas.coords(self.photo_item, *center)
+            self.canvas.itemconfigure(self.photo_item, image=self.photo)
 
         # Update the small uncropped preview
         self.update_uncropped_preview()
 
+        self.frame_times.record(time.perf_counter() - start)
+        if SHOW_FRAME_STATS and self.frame_times.frames % FRAME_STATS_EVERY == 0:
+            print(self.frame_times.format(), file=sys.stderr)
+
     def update_uncropped_preview(self):
         """Display a small preview of the uncropped original image"""
         if not self.current_image:
@@ -663,27 +1049,20 @@ class ImageResizerApp:
             return
 
         # Show the preview overlay
-        self.preview_overlay_frame.place(relx=1.0, rely=0.0, anchor='ne', x=-10, y=10)
+        if not self.preview_overlay_frame.place_info():
+            self.preview_overlay_frame.place(relx=1.0, rely=0.0, anchor='ne', x=-10, y=10)
+
+        # Small version of the original image, from the on-disk thumbnail cache.
+        # It doesn't depend on the crop, so it's fetched once per image.
+        preview_width, preview_height = THUMBNAIL_SIZE
+        if self.overlay_thumb is None:
+            img_path = self.image_path(self.current_index)
+            self.overlay_thumb = self.thumbnails.get_or_create(img_path, source=self.preview_proxy)
+        small_image = self.overlay_thumb
+        small_width, small_height = small_image.size
 
-        # Create a small version of the original image
-        preview_width = 200
-        preview_height = 150
-
-        # Calculate scaling to fit in preview box
         img_width, img_height = self.current_image.size
         img_ratio = img_width / img_height
-        preview_ratio = preview_width / preview_height
-
-        if img_ratio > preview_ratio:
-            # Image is wider
-            small_width = preview_width
-            small_height = int(preview_width / img_ratio)
-        else:
-            # Image is taller
-            small_height = preview_height
-            small_width = int(preview_height * img_ratio)
-
-        small_image = self.current_image.resize((small_width, small_height), Image.Resampling.LANCZOS)
 
         # Draw the crop area rectangle on the preview
         # Calculate what portion is being cropped
@@ -714,193 +1093,306 @@ class ImageResizerApp:
         rect_x2 = (x_offset + new_width) * scale_x
         rect_y2 = (y_offset + new_height) * scale_y
 
-        # Create the preview with rectangle overlay
-        self.preview_photo = ImageTk.PhotoImage(small_image)
-        self.preview_canvas.delete("all")
-
         # Center the image in the preview canvas
         canvas_center_x = preview_width // 2
         canvas_center_y = preview_height // 2
-
-        self.preview_canvas.create_image(canvas_center_x, canvas_center_y,
-                                        image=self.preview_photo, anchor=tk.CENTER)
-
-        # Draw the crop rectangle
         offset_x = (preview_width - small_width) // 2
         offset_y = (preview_height - small_height) // 2
 
-        self.preview_canvas.create_rectangle(
-            offset_x + rect_x1, offset_y + rect_y1,
-            offset_x + rect_x2, offset_y + rect_y2,
-            outline=self.colors['primary'], width=2
+        # The thumbnail only changes with the image; the rectangles move with the crop
+        from PIL import ImageTk
+        if self.overlay_items is None:
+            self.preview_photo = ImageTk.PhotoImage(small_image)
+            self.overlay_items = {
+                'image': self.preview_canvas.create_image(canvas_center_x, canvas_center_y,
+                                                          image=self.preview_photo,
+                                                          anchor=tk.CENTER),
+                # Semi-transparent overlay for cropped-out areas
+                **{side: self.preview_canvas.create_rectangle(0, 0, 0, 0, fill='black',
+                                                              stipple='gray50', outline='')
+                   for side in ('top', 'bottom', 'left', 'right')},
+                'crop': self.preview_canvas.create_rectangle(0, 0, 0, 0,
+                                                             outline=self.colors['primary'],
+                                                             width=2),
+            }
+        elif small_image is not self.overlay_photo_source:
+            self.preview_photo = ImageTk.PhotoImage(small_image)
+            self.preview_canvas.itemconfigure(self.overlay_items['image'], image=self.preview_photo)
+        self.overlay_photo_source = small_image
+
+        # Draw the crop rectangle; shades with nothing cropped on their side are empty
+        # and draw nothing
+        left, top = offset_x + rect_x1, offset_y + rect_y1
+        right, bottom = offset_x + rect_x2, offset_y + rect_y2
+        coords = {
+            'crop': (left, top, right, bottom),
+            'top': (offset_x, offset_y, offset_x + small_width, top),
+            'bottom': (offset_x, bottom, offset_x + small_width, offset_y + small_height),
+            'left': (offset_x, top, left, bottom),
+            'right': (right, top, offset_x + small_width, bottom),
+        }
+        for name, box in coords.items():
+            self.preview_canvas.coords(self.overlay_items[name], *box)
+
+    def get_settings(self):
+        """Snapshot of the current sidebar settings for the engine"""
+        return engine.ResizeSettings(
+            resolution=self.selected_resolution,
+            orientation=self.selected_orientation,
+            output_format=self.output_format,
+            jpeg_quality=self.jpeg_quality,
+            crop_x=self.crop_x,
+            crop_y=self.crop_y,
+            max_bytes=self.get_max_bytes(),
+            resample=EXPORT_RESAMPLE,
+            encoder=self.encoder_profile,
         )
 
-        # Add semi-transparent overlay for cropped-out areas
-        # Top
-        if rect_y1 > 0:
-            self.preview_canvas.create_rectangle(
-                offset_x, offset_y,
-                offset_x + small_width, offset_y + rect_y1,
-                fill='black', stipple='gray50', outline=''
-            )
-        # Bottom
-        if rect_y2 < small_height:
-            self.preview_canvas.create_rectangle(
-                offset_x, offset_y + rect_y2,
-                offset_x + small_width, offset_y + small_height,
-                fill='black', stipple='gray50', outline=''
-            )
-        # Left
-        if rect_x1 > 0:
-            self.preview_canvas.create_rectangle(
-                offset_x, offset_y + rect_y1,
-                offset_x + rect_x1, offset_y + rect_y2,
-                fill='black', stipple='gray50', outline=''
-            )
-        # Right
-        if rect_x2 < small_width:
-            self.preview_canvas.create_rectangle(
-                offset_x + rect_x2, offset_y + rect_y1,
-                offset_x + small_width, offset_y + rect_y2,
-                fill='black', stipple='gray50', outline=''
-            )
+    def get_max_bytes(self):
+        """Max file size from the sidebar in bytes, or None if unset or not applicable"""
+        if self.output_format not in engine.SIZE_MODEL_SLOPE:
+            return None
+        try:
+            kilobytes = float(self.max_size_var.get())
+        except ValueError:
+            return None
+        return int(kilobytes * 1024) if kilobytes > 0 else None
+
+    def get_presets(self):
+        """Fan-out presets ticked in the sidebar, largest first, or None"""
+        resolutions = [res for res, var in self.fan_out_vars.items() if var.get()]
+        if not resolutions:
+            return None
+        orientations = engine.ORIENTATIONS if self.fan_out_both_var.get() else None
+        return engine.fan_out(self.get_settings(), resolutions, orientations)
 
     def get_target_resolution(self):
         return self.resolutions[self.selected_resolution][self.selected_orientation]
         
     def get_cropped_image(self):
-        target_width, target_height = self.get_target_resolution()
-        target_ratio = target_width / target_height
-        
-        img_width, img_height = self.current_image.size
-        img_ratio = img_width / img_height
-        
-        if img_ratio > target_ratio:
-            # Image is wider, crop width
-            new_width = int(img_height * target_ratio)
-            new_height = img_height
-        else:
-            # Image is taller, crop height
-            new_width = img_width
-            new_height = int(img_width / target_ratio)
-        
-        # Apply crop offset (percentage of available crop space)
-        x_offset = int((img_width - new_width) / 2 * (1 + self.crop_x / 100))
-        y_offset = int((img_height - new_height) / 2 * (1 + self.crop_y / 100))
-        
-        # Ensure crop stays within bounds
-        x_offset = max(0, min(x_offset, img_width - new_width))
-        y_offset = max(0, min(y_offset, img_height - new_height))
-        
-        return self.current_image.crop((x_offset, y_offset, x_offset + new_width, y_offset + new_height))
+        return engine.get_cropped_image(self.current_image, self.get_settings())
         
     def on_crop_change(self, val):
         self.crop_x = self.crop_x_scale.get()
         self.crop_y = self.crop_y_scale.get()
         self.h_value_label.config(text=str(self.crop_x))
         self.v_value_label.config(text=str(self.crop_y))
-        self.display_preview()
+        self.request_preview()
         
     def reset_crop(self):
         self.crop_x_scale.set(0)
         self.crop_y_scale.set(0)
         self.crop_x = 0
         self.crop_y = 0
-        self.display_preview()
+        self.request_preview()
         
     def update_info(self):
         # Don't update info if no folder is selected yet
         if not self.folder_path or not self.image_files or not self.current_image:
+            self.cancel_estimate()
             self.info_label.config(text="")
             return
 
-        info = f"📁 Image {self.current_index + 1}/{len(self.image_files)}  •  "
+        # The estimate encodes the output, so it runs in the background
+        self.info_suffix = "Est. Size: estimating…"
+        self.render_info()
+        self.schedule_estimate()
+
+    def render_info(self):
+        count = f"{len(self.image_files)}+" if self.scanning() else f"{len(self.image_files)}"
+        info = f"📁 Image {self.current_index + 1}/{count}  •  "
         info += f"📄 {self.image_files[self.current_index]}  •  "
-        info += f"Original: {self.current_image.size[0]}×{self.current_image.size[1]}  •  "
+        info += f"Original: {self.original_size[0]}×{self.original_size[1]}  •  "
         target = self.get_target_resolution()
         info += f"Output: {target[0]}×{target[1]}  •  "
+        presets = self.get_presets()
+        if presets:
+            info += f"Fan-out: {len(presets)} presets  •  "
+        info += self.info_suffix
+        if self.last_search:
+            info += f"  •  {self.last_search}"
+        if self.waiting_write:
+            info += f"  •  💾 Waiting for {self.writer.pending} earlier saves…"
+        elif self.writer.pending:
+            info += f"  •  💾 {self.writer.pending} saving"
+        if self.write_failures:
+            path, error = list(self.write_failures.items())[-1]
+            info += f"  •  ⚠ {len(self.write_failures)} not saved ({os.path.basename(path)}: {error})"
+        self.info_label.config(text=info)
 
-        # Calculate estimated file size
-        estimated_size = self.estimate_output_size()
-        info += f"Est. Size: {estimated_size}"
+    def schedule_estimate(self):
+        """Debounce estimates so a burst of setting changes only encodes once"""
+        self.cancel_estimate()
+        self.estimate_after_id = self.root.after(ESTIMATE_DEBOUNCE_MS, self.start_estimate)
+
+    def cancel_estimate(self):
+        if self.estimate_after_id:
+            self.root.after_cancel(self.estimate_after_id)
+            self.estimate_after_id = None
+        self.estimate_future = None
+        self.estimator.cancel()
+
+    def start_estimate(self):
+        self.estimate_after_id = None
+        if not self.current_image or self.batch:
+            return
+        img_path = self.image_path(self.current_index)
+        self.estimate_future = self.estimator.submit(self.current_image, self.get_settings(),
+                                                     key=(img_path, os.path.getmtime(img_path)))
+        self.poll_estimate(self.estimate_future)
+
+    def poll_estimate(self, future):
+        # A newer request replaced this one
+        if future is not self.estimate_future:
+            return
+        if not future.done():
+            self.root.after(50, self.poll_estimate, future)
+            return
 
-        self.info_label.config(text=info)
+        self.estimate_future = None
+        if future.cancelled():
+            return
+        self.info_suffix = f"Est. Size: {self.estimate_output_size(future)}"
+        self.render_info()
     
-    def estimate_output_size(self):
-        """Estimate output file size based on resolution and format by actually encoding the image"""
-        if not self.current_image:
-            return "N/A"
-
+    def estimate_output_size(self, future):
+        """Format a finished estimate from the background worker"""
         try:
-            # Get the processed image (cropped and resized)
-            target_width, target_height = self.get_target_resolution()
-            cropped = self.get_cropped_image()
-            resized = cropped.resize((target_width, target_height), Image.Resampling.LANCZOS)
-
-            # Save to memory buffer to get actual size
-            buffer = BytesIO()
-
-            if self.output_format == "JPEG":
-                # Convert to RGB if necessary (JPEG doesn't support transparency)
-                if resized.mode in ('RGBA', 'LA', 'P'):
-                    rgb_image = Image.new('RGB', resized.size, (255, 255, 255))
-                    if resized.mode == 'P':
-                        resized = resized.convert('RGBA')
-                    rgb_image.paste(resized, mask=resized.split()[-1] if resized.mode in ('RGBA', 'LA') else None)
-                    resized = rgb_image
-                resized.save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
-            elif self.output_format == "PNG":
-                resized.save(buffer, format='PNG', optimize=True)
-            else:  # WEBP
-                resized.save(buffer, format='WEBP', quality=85)
-
-            # Get the size in bytes
-            estimated_bytes = buffer.tell()
-
-            # Convert to human-readable format
-            if estimated_bytes < 1024:
-                return f"{estimated_bytes:.0f} B"
-            elif estimated_bytes < 1024 * 1024:
-                return f"{estimated_bytes / 1024:.1f} KB"
-            else:
-                return f"{estimated_bytes / (1024 * 1024):.2f} MB"
+            size = engine.format_size(future.result())
+        except ValueError:
+            return "over max size even at the lowest quality"
         except Exception as e:
             return "N/A"
+        # Sampled predictions are approximate; max size searches encode for real
+        exact = self.estimator.exact or self.get_max_bytes() is not None
+        return size if exact else f"~{size}"
         
     def process_current_image(self):
-        target_width, target_height = self.get_target_resolution()
-        cropped = self.get_cropped_image()
-        resized = cropped.resize((target_width, target_height), Image.Resampling.LANCZOS)
-        
-        # Get file extension based on format
-        original_name = os.path.splitext(self.image_files[self.current_index])[0]
-        if self.output_format == "JPEG":
-            output_filename = f"{original_name}.jpg"
-        elif self.output_format == "PNG":
-            output_filename = f"{original_name}.png"
-        else:  # WEBP
-            output_filename = f"{original_name}.webp"
-        
-        output_path = os.path.join(self.output_folder, output_filename)
-        
-        # Save with appropriate format and settings
-        if self.output_format == "JPEG":
-            resized.save(output_path, format='JPEG', quality=self.jpeg_quality, optimize=True)
-        elif self.output_format == "PNG":
-            resized.save(output_path, format='PNG', optimize=True)
-        else:  # WEBP
-            resized.save(output_path, format='WEBP', quality=85)
-        
+        """Queue the current image's save with a snapshot of the current settings; False if
+        it's waiting for room in the queue (see queue_write)"""
+        presets = self.get_presets()
+        if presets:
+            return self.process_current_presets(presets)
+        settings = self.get_settings()
+        relative_path = self.image_files[self.current_index]
+        # Subfolders are mirrored under the output folder
+        output_folder = output_folder_for(relative_path, self.output_folder)
+        output_path = os.path.join(output_folder, engine.output_filename(relative_path, settings))
+        img_path = self.image_path(self.current_index)
+        return self.queue_write(img_path, save_image, self.current_image, img_path, output_path,
+                                settings, self.manifest)
+
+    def show_search(self, traces):
+        """Remember the last max file size search for the info bar"""
+        if traces:
+            encodes = sum(trace.encodes for trace in traces)
+            elapsed = sum(trace.elapsed for trace in traces)
+            qualities = "/".join(f"q{trace.quality}" for trace in traces)
+            self.last_search = f"Last save: {qualities}, {encodes} encodes in {elapsed * 1000:.0f} ms"
+        else:
+            self.last_search = ""
+        
+    def process_current_presets(self, presets):
+        """Queue the current image's save at every fan-out preset"""
+        img_path = self.image_path(self.current_index)
+        relative_dir = os.path.dirname(self.image_files[self.current_index])
+        scale = min(engine.max_scale(self.original_size, p) for p in presets)
+        # The biggest preset may need more pixels than the preview decoded
+        image = self.current_image if scale >= self.decoded_scale else None
+        return self.queue_write(img_path, save_presets, image, img_path, self.output_folder,
+                                presets, relative_dir, self.manifest)
+
+    def queue_write(self, img_path, save, *args):
+        """Hand a save to the background writer; False if its queue is full.
+
+        A save that doesn't fit waits in waiting_write, and retry_write()
+        submits it from the event loop once an earlier save has finished.
+        """
+        if self.writer.full:
+            self.waiting_write = (img_path, save, args)
+            self.render_info()
+            self.root.after(50, self.retry_write)
+            return False
+        self.write_failures.pop(img_path, None)
+        self.writer.submit(img_path, save, *args)
+        if not self.writes_polling:
+            self.writes_polling = True
+            self.root.after(100, self.poll_writes)
+        return True
+
+    def retry_write(self):
+        """Submit the waiting save once there's room, then move on to the next image"""
+        if self.waiting_write is None:
+            return  # flush_writes() submitted it already
+        if self.writer.full:
+            self.collect_writes()
+            self.root.after(50, self.retry_write)
+            return
+        img_path, save, args = self.waiting_write
+        self.waiting_write = None
+        self.queue_write(img_path, save, *args)
+        self.next_image()
+
+    def poll_writes(self):
+        """Show finished and failed saves in the info bar while any are queued"""
+        self.collect_writes()
+        if self.current_image and not self.batch:
+            self.render_info()
+        if self.writer.pending:
+            self.root.after(100, self.poll_writes)
+        else:
+            self.writes_polling = False
+
+    def collect_writes(self):
+        for img_path, traces in self.writer.take_results():
+            self.show_search(traces)
+        for img_path, error in self.writer.take_failures():
+            self.write_failures[img_path] = error
+
+    def flush_writes(self):
+        """Wait for every queued save, then report the ones that failed"""
+        while not self.writer.flush(0.1) or self.waiting_write is not None:
+            if self.waiting_write is not None and not self.writer.full:
+                img_path, save, args = self.waiting_write
+                self.waiting_write = None
+                self.queue_write(img_path, save, *args)
+                continue
+            self.info_label.config(text=f"💾 Finishing {self.writer.pending} queued saves…")
+            self.root.update_idletasks()
+        self.collect_writes()
+        if self.write_failures:
+            failed = "\n".join(f"{os.path.basename(path)}: {error}"
+                               for path, error in self.write_failures.items())
+            messagebox.showerror("Not Saved",
+                f"{len(self.write_failures)} images couldn't be saved:\n\n{failed}")
+            self.write_failures = {}
+
+    def on_close(self):
+        self.flush_writes()
+        self.writer.shutdown()
+        self.root.destroy()
+
     def process_and_next(self):
-        self.process_current_image()
+        # Until a waiting save fits in the queue, the buttons do nothing
+        if self.batch or self.waiting_write:
+            return
+        # The save runs in the background; failures show up in the info bar.
+        # With the queue full, retry_write() moves on once the save is queued
+        if self.process_current_image():
+            self.next_image()
+
+    def next_image(self):
         self.current_index += 1
         self.load_image()
         
     def skip_image(self):
-        self.current_index += 1
-        self.load_image()
+        if self.batch or self.waiting_write:
+            return
+        self.next_image()
         
     def previous_image(self):
+        if self.batch or self.waiting_write:
+            return
         if self.current_index > 0:
             self.current_index -= 1
             self.load_image()
@@ -908,13 +1400,116 @@ class ImageResizerApp:
             messagebox.showinfo("First Image", "This is the first image.")
             
     def process_all(self):
-        result = messagebox.askyesno("Confirm",
-            f"Process all remaining {len(self.image_files) - self.current_index} images with current settings?")
+        # While a batch runs the button cancels it
+        if self.batch:
+            self.cancel_batch()
+            return
+        if not self.image_files:
+            return
+        # So the manifest knows about every image saved with Process & Next
+        self.flush_writes()
+
+        # With fan-out presets ticked, every image is written at each of them
+        presets = self.get_presets()
+        settings = presets or self.get_settings()
+        per_image = f" at {len(presets)} presets" if presets else ""
+        if self.scanning():
+            # Follow the scan; the manifest check happens as paths come in
+            paths = self.remaining_paths(self.current_index)
+            message = (f"Process all remaining images{per_image} with current settings?\n\n"
+                       f"The folder is still being scanned ({len(self.image_files)} found so far).")
+        else:
+            # Images the manifest says are already done with these settings are skipped
+            remaining = list(self.remaining_paths(self.current_index))
+            paths = self.manifest.pending(remaining, settings)
+            skipped = len(remaining) - len(paths)
+            if not paths:
+                messagebox.showinfo("Up to Date",
+                    f"All {skipped} remaining images are already processed with these settings.")
+                return
+            message = f"Process all remaining {len(paths)} images{per_image} with current settings?"
+            if skipped:
+                message += f"\n\n{skipped} already up to date in {engine.OUTPUT_FOLDER_NAME} will be skipped."
+        runner = BatchRunner(paths, self.output_folder, settings, manifest=self.manifest,
+                             input_root=self.folder_path,
+                             memory_budget=MEMORY_BUDGET_MB * 1024 * 1024,
+                             profile=bool(PROFILE),
+                             store=OutputStore(None if DEDUP == "1" else DEDUP,
+                                               DEDUP_MB * 1024 * 1024) if DEDUP else None)
+
+        result = messagebox.askyesno("Confirm", message)
         if result:
-            while self.current_index < len(self.image_files):
-                self.process_current_image()
+            self.cancel_estimate()
+            self.batch = runner.start()
+            self.batch_btn.set_text("✕ Cancel")
+            self.poll_batch()
+
+    def cancel_batch(self):
+        if self.batch:
+            self.batch.cancel()
+            self.info_label.config(text="Cancelling… waiting for running images to finish")
+
+    def poll_batch(self):
+        """Show batch progress in the info bar until every job has finished"""
+        progress = self.batch.progress()
+        if not progress.done:
+            # While the scan is still feeding the batch the total keeps growing
+            total = f"{progress.total}" if progress.total_known else f"{progress.total}+"
+            info = f"⚡ Processing {progress.finished_count}/{total}  •  "
+            info += f"{progress.rate:.1f} img/s  •  "
+            info += f"ETA {format_duration(progress.eta)}  •  "
+            info += f"Elapsed {format_duration(progress.elapsed)}"
+            if len(progress.cost_classes) > 1:
+                # Images are dispatched costliest first; show how each size is going
+                info += f"  •  {progress.classes_summary()}"
+            if progress.searches:
+                info += f"  •  {progress.encodes_per_search:.1f} encodes/output"
+            if progress.failed:
+                info += f"  •  ⚠ {progress.failed} failed"
+            self.info_label.config(text=info)
+            self.root.after(200, self.poll_batch)
+            return
+
+        errors = self.batch.errors
+        skipped = self.batch.skipped
+        profiles = self.batch.profiles
+        store = self.batch.store
+        report = self.batch.report() if profiles else None
+        batch_settings = self.batch.settings
+        stopped = self.batch.stopped
+        self.batch = None
+        self.batch_btn.set_text("⚡ Process All")
+
+        summary = f"{progress.completed} images processed in {format_duration(progress.elapsed)}."
+        if skipped:
+            summary += f"\n{skipped} already up to date were skipped."
+        if progress.cancelled:
+            summary += f"\n{progress.cancelled} cancelled."
+        if progress.reused:
+            summary += (f"\n{progress.reused} outputs ({engine.format_size(progress.reused_bytes)}) "
+                        f"reused from earlier renders, saving "
+                        f"{progress.reused_cpu_seconds:.0f} CPU-seconds.")
+        if store is not None:
+            store.evict()
+        if errors:
+            summary += f"\n{len(errors)} failed:\n"
+            summary += "\n".join(f"{os.path.basename(path)}: {error}" for path, error in errors[:10])
+        if report is not None:
+            summary += "\n\nPerformance:\n" + "\n".join(profiling.format_summary(report))
+            if PROFILE != "1":
+                try:
+                    profiling.write_log(PROFILE, profiles, report)
+                except OSError as e:
+                    summary += f"\nCouldn't write {PROFILE}: {e}"
+        if stopped:
+            messagebox.showinfo("Cancelled", summary)
+            # Continue from the first image the batch didn't get to
+            while (self.current_index < len(self.image_files) and
+                   self.manifest.is_current(self.image_path(self.current_index), batch_settings)):
                 self.current_index += 1
-            messagebox.showinfo("Complete", "All images processed!")
+            self.load_image()
+        else:
+            messagebox.showinfo("Complete", "All images processed!\n\n" + summary)
             self.reset_to_welcome()
 
 if __name__ == "__main__":
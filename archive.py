@@ -0,0 +1,257 @@
+"""Images read straight out of ZIP and TAR archives, and outputs written into them.
+
+Nothing is extracted to disk. Members are yielded one at a time as (name,
+source) pairs, where source() returns the member's bytes. ZIP members are
+read from their offsets in the file; TAR archives, compressed ones too,
+are streamed front to back in a single pass. render_member() is the worker
+side, decoding a member's bytes and returning the encoded outputs, and
+ArchiveWriter stores them into a new archive. batch.ArchiveRunner ties them
+together with a bounded number of images in flight.
+"""
+import os
+import posixpath
+import time
+from functools import partial
+from io import BytesIO
+
+from PIL import UnidentifiedImageError
+
+import engine
+from scanner import scan_images
+
+# Archive suffixes and their (kind, compression); longest suffixes first
+ARCHIVE_FORMATS = (
+    (".tar.gz", ("tar", "gz")), (".tgz", ("tar", "gz")),
+    (".tar.bz2", ("tar", "bz2")), (".tbz2", ("tar", "bz2")),
+    (".tar.xz", ("tar", "xz")), (".txz", ("tar", "xz")),
+    (".tar", ("tar", "")), (".zip", ("zip", None)),
+)
+
+# Members never worth decoding: earlier outputs, and macOS resource forks
+SKIPPED_FOLDERS = (engine.OUTPUT_FOLDER_NAME, "__MACOSX")
+
+
+def archive_format(path):
+    """(kind, compression) of an archive name, or None if it isn't one"""
+    lower = path.lower()
+    for suffix, archive in ARCHIVE_FORMATS:
+        if lower.endswith(suffix):
+            return archive
+    return None
+
+
+def is_archive(path):
+    return archive_format(path) is not None
+
+
+def default_output(path):
+    """Output archive next to the input one: photos.zip -> photos-SSResized.zip"""
+    lower = path.lower()
+    for suffix, _ in ARCHIVE_FORMATS:
+        if lower.endswith(suffix):
+            return f"{path[:-len(suffix)]}-{engine.OUTPUT_FOLDER_NAME}{path[-len(suffix):]}"
+    raise ValueError(f"{path} is not a ZIP or TAR archive")
+
+
+def member_name(name):
+    """Member name as a relative POSIX path: no leading slash, '.' or '..' parts"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return "/".join(parts)
+
+
+def _is_image_member(name):
+    parts = name.split("/")
+    return (name.lower().endswith(engine.IMAGE_EXTENSIONS)
+            and not parts[-1].startswith("._")
+            and not any(part in SKIPPED_FOLDERS for part in parts[:-1]))
+
+
+class ZipMembers:
+    """Image members of a ZIP archive, in archive order.
+
+    The central directory is read up front, so the member count is known
+    before any image is.
+    """
+
+    def __init__(self, path):
+        import zipfile
+        self._zip = zipfile.ZipFile(path)
+        self._infos = [info for info in self._zip.infolist()
+                       if not info.is_dir() and _is_image_member(member_name(info.filename))]
+
+    def __len__(self):
+        return len(self._infos)
+
+    def __iter__(self):
+        try:
+            for info in self._infos:
+                yield member_name(info.filename), partial(self._zip.read, info)
+        finally:
+            self._zip.close()
+
+
+def _tar_members(path):
+    """Image members of a TAR archive, streamed in one pass; each source() must be called
+    before the next member is taken"""
+    import tarfile
+    with tarfile.open(path, "r|*") as tar:
+        for member in tar:
+            name = member_name(member.name)
+            if member.isfile() and _is_image_member(name):
+                yield name, partial(_read_tar_member, tar, member)
+
+
+def _read_tar_member(tar, member):
+    with tar.extractfile(member) as f:
+        return f.read()
+
+
+def read_members(path):
+    """(name, source) of every image in the archive at path, in archive order"""
+    kind, _ = archive_format(path) or (None, None)
+    if kind == "zip":
+        return ZipMembers(path)
+    if kind == "tar":
+        return _tar_members(path)
+    raise ValueError(f"{path} is not a ZIP or TAR archive")
+
+
+def folder_members(folder, recursive=False):
+    """(name, source) of every image in a folder, for writing a folder into an archive.
+
+    source() returns the file's path rather than its bytes: the worker
+    reads the file itself, so oversized ones can still be decoded in bands.
+    """
+    for relative in scan_images(folder, recursive):
+        yield relative.replace(os.sep, "/"), partial(os.path.join, folder, relative)
+
+
+def output_names(name, settings):
+    """Names of a member's outputs, mirroring its folder; fan-out presets get their own
+    top-level folder as engine.preset_output_path() does"""
+    folder = posixpath.dirname(name)
+    if isinstance(settings, tuple):
+        return [posixpath.join(engine.preset_folder(preset), folder,
+                               engine.output_filename(name, preset)) for preset in settings]
+    return [posixpath.join(folder, engine.output_filename(name, settings))]
+
+
+def render_member(name, source, settings, memory_budget=None):
+    """Worker entry point: decode one member and encode its outputs into memory.
+
+    source is the member's bytes or a file path; settings may be a tuple of
+    fan-out presets. Returns ([(output name, encoded bytes)], search traces).
+    """
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    traces = []
+    try:
+        if isinstance(settings, tuple):
+            image, _ = engine.open_image_for_presets(source, settings, memory_budget)
+            with image:
+                renders = list(zip(settings, engine.render_presets(image, settings)))
+        else:
+            renders = [(settings, engine.render_source(source, settings, memory_budget))]
+    except UnidentifiedImageError:
+        # Pillow names the BytesIO object; the member's name says more
+        raise UnidentifiedImageError(f"cannot identify image file {name!r}") from None
+    outputs = []
+    for output_name, (preset, rendered) in zip(output_names(name, settings), renders):
+        buffer = BytesIO()
+        trace = engine.encode(rendered, buffer, preset)
+        if trace is not None:
+            traces.append(trace)
+        outputs.append((output_name, buffer.getvalue()))
+    return outputs, traces
+
+
+class ArchiveWriter:
+    """A new ZIP or TAR archive, filled one output at a time.
+
+    It's written under a temporary name and only appears at path on
+    close(); abort() discards it, so a failed or cancelled run never leaves
+    half an archive behind. Not thread-safe: one thread does all the adds.
+    """
+
+    def __init__(self, path):
+        kind, compression = archive_format(path) or (None, None)
+        if kind is None:
+            raise ValueError(f"{path} is not a ZIP or TAR archive name")
+        self.path = path
+        self._tmp_path = f"{path}.{os.urandom(8).hex()}.tmp"
+        self._names = set()
+        if kind == "zip":
+            import zipfile
+            # Images are compressed already; deflating them again costs time for nothing
+            self._zip = zipfile.ZipFile(self._tmp_path, "w", zipfile.ZIP_STORED)
+            self._tar = None
+        else:
+            import tarfile
+            self._zip = None
+            self._tar = tarfile.open(self._tmp_path, "w:" + compression)
+
+    def add(self, name, data):
+        """Store data as name; returns where it went, for printing"""
+        if name in self._names:
+            raise ValueError(f"{name} is already in the archive (two inputs with the same name?)")
+        self._names.add(name)
+        if self._zip is not None:
+            import zipfile
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.external_attr = 0o644 << 16
+            self._zip.writestr(info, data)
+        else:
+            import tarfile
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            info.mode = 0o644
+            self._tar.addfile(info, BytesIO(data))
+        return f"{self.path}:{name}"
+
+    def _close(self):
+        (self._zip or self._tar).close()
+
+    def close(self):
+        self._close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self._close()
+        finally:
+            try:
+                os.remove(self._tmp_path)
+            except OSError:
+                pass
+
+
+class FolderWriter:
+    """Outputs written as files under a folder, for an archive input with a folder output"""
+
+    def __init__(self, folder):
+        self.path = folder
+
+    def add(self, name, data):
+        output_path = os.path.join(self.path, *name.split("/"))
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        # Renamed into place like engine's outputs, so an output is never half there
+        tmp_path = f"{output_path}.{os.urandom(8).hex()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, output_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return output_path
+
+    def close(self):
+        pass
+
+    def abort(self):
+        # Finished outputs stay, as they do when a folder batch is cancelled
+        pass
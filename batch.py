@@ -0,0 +1,632 @@
+"""Multi-process batch runner built on the headless engine.
+
+The runner never blocks: callers (the GUI via root.after polling, the CLI
+via iter_results) ask it for progress while worker processes do the work.
+Inputs can be any iterable, including a scanner generator; a feeder thread
+keeps only a few jobs per worker in flight, so memory doesn't grow with
+the number of files. By default each window of inputs is costed from the
+image headers and dispatched most expensive first (see scheduler).
+ArchiveRunner does the same for members of a ZIP or TAR archive, storing
+the outputs through one writer in input order (see archive).
+"""
+import os
+import queue
+import signal
+import threading
+import time
+from concurrent.futures import CancelledError
+from dataclasses import dataclass
+
+import archive
+import engine
+import profiling
+import scheduler
+
+# Jobs queued per worker process ahead of the ones running
+JOBS_PER_WORKER = 4
+
+# Dispatch orders: costliest first within each scheduling window, or as given
+SCHEDULES = ("largest", "input")
+
+
+@dataclass
+class BatchProgress:
+    total: int
+    completed: int
+    failed: int
+    cancelled: int
+    elapsed: float
+    # False while a generator input is still producing paths
+    total_known: bool = True
+    # Max file size searches: outputs searched, encodes and seconds spent
+    searches: int = 0
+    search_encodes: int = 0
+    search_seconds: float = 0.0
+    # Outputs taken from the output store, and the bytes and CPU time that saved
+    reused: int = 0
+    reused_bytes: int = 0
+    reused_cpu_seconds: float = 0.0
+    # Seconds left from each cost class's measured throughput, when jobs are costed
+    remaining_seconds: float = None
+    # scheduler.ClassProgress of each cost class in the batch
+    cost_classes: tuple = ()
+
+    @property
+    def finished_count(self):
+        return self.completed + self.failed + self.cancelled
+
+    @property
+    def done(self):
+        return self.total_known and self.finished_count >= self.total
+
+    @property
+    def rate(self):
+        """Images per second since the batch started"""
+        processed = self.completed + self.failed
+        return processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Seconds left, or None before the first result.
+
+        Costed batches go by each cost class's measured time per job;
+        otherwise it's the images left at the average rate so far.
+        """
+        if not self.total_known:
+            return None
+        if self.remaining_seconds is not None:
+            return self.remaining_seconds
+        if not self.rate:
+            return None
+        return (self.total - self.finished_count) / self.rate
+
+    def classes_summary(self):
+        """One line of images done and left per cost class, and their measured time"""
+        return ", ".join(
+            f"{c.name} {c.done}/{c.done + c.left}"
+            + ("" if c.seconds_per_job is None else f" @ {c.seconds_per_job:.1f}s")
+            for c in self.cost_classes)
+
+    @property
+    def encodes_per_search(self):
+        return self.search_encodes / self.searches if self.searches else 0.0
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def _ignore_interrupts():
+    """Worker initializer: Ctrl+C reaches the whole process group, but only the
+    parent decides what to cancel, so running images still finish"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _process_pool(workers):
+    """A process pool of workers, created on the thread that starts a run.
+
+    Imported here so that importing batch (the GUI does at startup) doesn't
+    load multiprocessing; importing it on a feeder thread instead races the
+    interpreter's exit hook that shuts the pool down.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers, initializer=_ignore_interrupts)
+
+
+def run_job(path, output_folder, settings, relative_dir="", memory_budget=None, profile=False,
+            store=None):
+    """Worker process entry point; returns (output path or paths, search traces, profile,
+    reuse, seconds).
+
+    The profile is a profiling.Profile if asked for, else None; reuse is
+    the outputstore.Reuse of outputs taken from store, or None. seconds is
+    the job's wall time in the worker, for the cost-class ETA.
+    """
+    start = time.perf_counter()
+    traces = []
+    job_profile = profiling.begin(path) if profile else None
+    reuse = None
+    if store is not None:
+        output, reuse = store.process(path, output_folder, settings, relative_dir, traces,
+                                      memory_budget, job_profile)
+    elif isinstance(settings, tuple):
+        output = engine.process_presets(path, output_folder, settings, relative_dir, traces,
+                                        memory_budget, job_profile)
+    else:
+        output = engine.process(path, os.path.join(output_folder, relative_dir), settings, traces,
+                                memory_budget, job_profile)
+    if job_profile is not None:
+        profiling.finish(job_profile)
+    return output, traces, job_profile, reuse, time.perf_counter() - start
+
+
+class BatchRunner:
+    """Send engine.process jobs to a process pool sized to the core count.
+
+    settings may also be a tuple of presets (see engine.fan_out); each input
+    is then decoded once and written at every preset by
+    engine.process_presets. With input_root set, outputs mirror each
+    input's subfolder of input_root under output_folder. memory_budget caps
+    the decoded bytes of one oversized input per worker (see
+    engine.open_image). With profile set, every finished input's stage
+    timings are kept in profiles and summarized by report(). With an
+    outputstore.OutputStore, outputs already rendered from the same bytes
+    and settings anywhere are linked instead of rendered again.
+
+    schedule "largest" reads the headers of each scheduler.SCHEDULE_WINDOW
+    inputs and dispatches them costliest first, and the ETA follows each
+    cost class's measured time. "input" dispatches in the order given; use
+    it for endless inputs such as a FolderWatcher, whose windows would
+    never fill.
+    """
+
+    def __init__(self, paths, output_folder, settings, workers=None, manifest=None, force=False,
+                 input_root=None, memory_budget=None, profile=False, store=None,
+                 schedule="largest"):
+        if schedule not in SCHEDULES:
+            raise ValueError(f"Unknown schedule {schedule!r}; expected one of {SCHEDULES}")
+        self.paths = paths
+        self.output_folder = output_folder
+        self.settings = settings
+        self.workers = workers or default_workers()
+        self.manifest = manifest
+        self.force = force
+        self.input_root = input_root
+        self.memory_budget = memory_budget
+        self.profile = profile
+        self.store = store
+        self.schedule = schedule
+        self.errors = []
+        # profiling.Profile of every completed input, in completion order
+        self.profiles = []
+        # Inputs already processed with these settings (per the manifest) are skipped
+        self.skipped = 0
+
+        # Lists give a total up front; generators only once they run out
+        self._expected = len(paths) if hasattr(paths, '__len__') else None
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.workers * JOBS_PER_WORKER)
+        self._futures = {}
+        self._submitted = 0
+        self._feeding = True
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._searches = 0
+        self._search_encodes = 0
+        self._search_seconds = 0.0
+        self._reused = 0
+        self._reused_bytes = 0
+        self._reused_cpu_seconds = 0.0
+        self._costs = scheduler.CostTracker()
+        self._costed = 0
+        # Inputs read so far that weren't skipped, and whether that's all of them
+        self._read = 0
+        self._read_all = False
+        self._started = None
+        self._finished = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._results = None
+
+    def start(self, stream_results=False):
+        """Start feeding jobs; with stream_results, iter_results() yields every outcome"""
+        if stream_results:
+            self._results = queue.Queue()
+        self._started = time.monotonic()
+        executor = _process_pool(self.workers)
+        threading.Thread(target=self._feed, args=(executor,), daemon=True).start()
+        return self
+
+    @property
+    def fan_out(self):
+        return isinstance(self.settings, tuple)
+
+    def relative_dir(self, path):
+        """path's folder relative to input_root, or "" without one"""
+        if self.input_root is None:
+            return ""
+        relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(path)),
+                                       os.path.abspath(self.input_root))
+        return "" if relative_dir == os.curdir else relative_dir
+
+    def output_folder_for(self, path):
+        return os.path.join(self.output_folder, self.relative_dir(path))
+
+    def _submit(self, executor, path):
+        return executor.submit(run_job, path, self.output_folder, self.settings,
+                               self.relative_dir(path), self.memory_budget, self.profile,
+                               self.store)
+
+    def _feed(self, executor):
+        try:
+            if self.schedule == "largest":
+                jobs = scheduler.largest_first(self._pending(), self.settings,
+                                               on_costed=self._on_costed)
+            else:
+                jobs = ((path, None) for path in self._pending())
+            for path, cost in jobs:
+                # Wait for a free slot so only a bounded number of jobs is queued
+                self._slots.acquire()
+                if self._stop.is_set():
+                    self._slots.release()
+                    break
+                future = self._submit(executor, path)
+                with self._lock:
+                    self._futures[future] = (path, cost)
+                    self._submitted += 1
+                future.add_done_callback(self._on_done)
+        finally:
+            # Queued jobs keep running; the batch is done once they and the pool have finished
+            executor.shutdown(wait=True)
+            with self._lock:
+                self._feeding = False
+                self._check_done_locked()
+
+    def _pending(self):
+        """Inputs not yet up to date in the manifest, until cancelled"""
+        for path in self.paths:
+            if self._stop.is_set():
+                return
+            if (self.manifest is not None and not self.force
+                    and self.manifest.is_current(path, self.settings)):
+                with self._lock:
+                    self.skipped += 1
+                continue
+            with self._lock:
+                self._read += 1
+            yield path
+        with self._lock:
+            self._read_all = True
+
+    def _on_costed(self, costs):
+        with self._lock:
+            for cost in costs:
+                self._costs.add(cost)
+            self._costed += len(costs)
+
+    def _on_done(self, future):
+        with self._lock:
+            path, cost = self._futures.pop(future)
+        self._slots.release()
+
+        output, traces, profile, reuse, seconds = None, [], None, None, None
+        if not future.cancelled() and future.exception() is None:
+            output, traces, profile, reuse, seconds = future.result()
+
+        # Record before counting, so a batch that reports done is fully in the manifest
+        if self.manifest is not None and output is not None:
+            try:
+                self.manifest.record(path, output, self.settings)
+            except OSError:
+                pass  # Source vanished; it will simply be redone next run
+
+        if self._results is not None and not future.cancelled():
+            self._results.put((path, output, future.exception(), traces))
+
+        with self._lock:
+            if future.cancelled():
+                self._cancelled += 1
+            elif future.exception() is not None:
+                self._failed += 1
+                self.errors.append((path, future.exception()))
+            else:
+                self._completed += 1
+            if cost is not None:
+                self._costs.finish(cost, seconds)
+            if profile is not None:
+                self.profiles.append(profile)
+            if reuse is not None:
+                self._reused += reuse.outputs
+                self._reused_bytes += reuse.bytes
+                self._reused_cpu_seconds += reuse.cpu_seconds
+            for trace in traces:
+                self._searches += 1
+                self._search_encodes += trace.encodes
+                self._search_seconds += trace.elapsed
+            self._check_done_locked()
+
+    def _check_done_locked(self):
+        finished = self._completed + self._failed + self._cancelled
+        if self._feeding or finished < self._submitted or self._done.is_set():
+            return
+        self._finished = time.monotonic()
+        self._done.set()
+        if self._results is not None:
+            self._results.put(None)
+
+    def wait(self, timeout=None):
+        """Block until every job has finished or been cancelled"""
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """Stop feeding and drop queued jobs; running images still finish"""
+        self._stop.set()
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+    @property
+    def stopped(self):
+        """True once cancel() has been called"""
+        return self._stop.is_set()
+
+    def progress(self):
+        with self._lock:
+            if self._started is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self._finished or time.monotonic()) - self._started
+            if not self._feeding:
+                total, total_known = self._submitted, True
+            elif self._read_all and not self._stop.is_set():
+                # A generator ran out, but its last window is still being dispatched
+                total, total_known = self._read, True
+            elif self._expected is not None and not self._stop.is_set():
+                total, total_known = self._expected - self.skipped, True
+            else:
+                total, total_known = self._submitted, False
+            remaining = None
+            # After a cancel, costed jobs that were never dispatched won't run
+            if self._costed and not self._stop.is_set():
+                # Inputs counted in the total whose window hasn't been costed yet
+                uncosted = max(0, total - self._costed) if total_known else 0
+                remaining = self._costs.remaining_seconds(self.workers, uncosted)
+            return BatchProgress(total=total, completed=self._completed,
+                                 failed=self._failed, cancelled=self._cancelled,
+                                 elapsed=elapsed, total_known=total_known,
+                                 searches=self._searches, search_encodes=self._search_encodes,
+                                 search_seconds=self._search_seconds, reused=self._reused,
+                                 reused_bytes=self._reused_bytes,
+                                 reused_cpu_seconds=self._reused_cpu_seconds,
+                                 remaining_seconds=remaining,
+                                 cost_classes=tuple(self._costs.classes()))
+
+    def report(self):
+        """profiling.summarize() of the profiled inputs so far"""
+        with self._lock:
+            profiles = list(self.profiles)
+        return profiling.summarize(profiles, self.progress().elapsed)
+
+    def iter_results(self):
+        """Yield (path, output_path, error, traces) as jobs finish, skipping cancelled ones.
+
+        For a fan-out, output_path is the list of every preset's output.
+        traces holds the engine.SearchTrace of each output written with a
+        max file size.
+        """
+        if self._results is None:
+            raise RuntimeError("start(stream_results=True) is needed for iter_results()")
+        while True:
+            result = self._results.get()
+            if result is None:
+                return
+            yield result
+
+
+class ArchiveRunner:
+    """Render archive members on a process pool and store their outputs in input order.
+
+    members is an iterable of (name, source) pairs from archive.read_members
+    or archive.folder_members; output is an archive.ArchiveWriter or
+    FolderWriter. A feeder thread reads each member's bytes and submits it;
+    one writer thread takes the results in the order they were read and
+    adds them to output, which is the only thread that touches it. An
+    image holds its slot from being read until its outputs are stored, so
+    at most workers * JOBS_PER_WORKER images (their bytes and encoded
+    outputs) are in memory however big the archive is, and a slow image
+    holds back the writer rather than letting later results pile up.
+
+    Same interface as BatchRunner: start(), progress(), iter_results(),
+    cancel() and wait(). A run that fails (the input stops being readable
+    or a write fails) sets error and, like a cancelled one, discards an
+    output archive rather than closing it half full.
+    """
+
+    def __init__(self, members, output, settings, workers=None, memory_budget=None):
+        self.members = members
+        self.output = output
+        self.settings = settings
+        self.workers = workers or default_workers()
+        self.memory_budget = memory_budget
+        self.errors = []
+        # What stopped the run early, if anything
+        self.error = None
+        self.bytes_written = 0
+
+        # ZIP central directories give a total up front; TAR streams only at the end
+        self._expected = len(members) if hasattr(members, '__len__') else None
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.workers * JOBS_PER_WORKER)
+        # (name, future or read error) in input order, then None
+        self._ordered = queue.Queue()
+        # Submitted and not yet stored, for cancel()
+        self._futures = []
+        self._read = 0
+        self._feeding = True
+        self._completed = 0
+        self._failed = 0
+        self._cancelled = 0
+        self._searches = 0
+        self._search_encodes = 0
+        self._search_seconds = 0.0
+        self._started = None
+        self._finished = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+        self._results = None
+
+    def start(self, stream_results=False):
+        """Start reading and writing; with stream_results, iter_results() yields every outcome"""
+        if stream_results:
+            self._results = queue.Queue()
+        self._started = time.monotonic()
+        executor = _process_pool(self.workers)
+        threading.Thread(target=self._write, daemon=True).start()
+        threading.Thread(target=self._feed, args=(executor,), daemon=True).start()
+        return self
+
+    def _feed(self, executor):
+        try:
+            for name, source in self.members:
+                # Take the slot before reading, so unread members stay in the archive
+                self._slots.acquire()
+                if self._stop.is_set():
+                    self._slots.release()
+                    break
+                try:
+                    data = source()
+                except Exception as e:
+                    # One unreadable member (a bad CRC, encryption) fails on its own
+                    job = e
+                else:
+                    job = executor.submit(archive.render_member, name, data, self.settings,
+                                          self.memory_budget)
+                    with self._lock:
+                        self._futures.append(job)
+                with self._lock:
+                    self._read += 1
+                self._ordered.put((name, job))
+        except Exception as e:
+            # The archive can't be read any further, e.g. a truncated TAR stream
+            self._fail(e)
+        finally:
+            # The writer stores results meanwhile; it finishes after the pool does
+            executor.shutdown(wait=True)
+            with self._lock:
+                self._feeding = False
+            self._ordered.put(None)
+
+    def _write(self):
+        while True:
+            entry = self._ordered.get()
+            if entry is None:
+                break
+            try:
+                self._store(*entry)
+            finally:
+                self._slots.release()
+        if self.error is None and not self._stop.is_set():
+            try:
+                self.output.close()
+            except Exception as e:
+                self._fail(e)
+        if self.error is not None or self._stop.is_set():
+            self.output.abort()
+        with self._lock:
+            self._finished = time.monotonic()
+        self._done.set()
+        if self._results is not None:
+            self._results.put(None)
+
+    def _store(self, name, job):
+        outputs, traces, error = [], [], job if isinstance(job, Exception) else None
+        if error is None:
+            try:
+                error = job.exception()
+            except CancelledError:
+                with self._lock:
+                    self._futures.remove(job)
+                    self._cancelled += 1
+                return
+            with self._lock:
+                self._futures.remove(job)
+            if error is None:
+                outputs, traces = job.result()
+
+        stored = []
+        if error is None:
+            if self.error is not None:
+                # Rendered before the run failed, but there's nothing to add it to
+                with self._lock:
+                    self._cancelled += 1
+                return
+            try:
+                for output_name, data in outputs:
+                    stored.append(self.output.add(output_name, data))
+                    with self._lock:
+                        self.bytes_written += len(data)
+            except ValueError as e:
+                error = e  # A duplicate name; the other inputs are fine
+            except Exception as e:
+                self._fail(e)
+                error = e
+
+        if self._results is not None:
+            self._results.put((name, stored, error, traces))
+        with self._lock:
+            if error is not None:
+                self._failed += 1
+                self.errors.append((name, error))
+            else:
+                self._completed += 1
+            for trace in traces:
+                self._searches += 1
+                self._search_encodes += trace.encodes
+                self._search_seconds += trace.elapsed
+
+    def _fail(self, error):
+        with self._lock:
+            if self.error is None:
+                self.error = error
+        self.cancel()
+
+    def wait(self, timeout=None):
+        """Block until every member has been stored, failed or been cancelled"""
+        return self._done.wait(timeout)
+
+    def cancel(self):
+        """Stop reading and drop queued images; running ones still finish"""
+        self._stop.set()
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.cancel()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def progress(self):
+        with self._lock:
+            if self._started is None:
+                elapsed = 0.0
+            else:
+                elapsed = (self._finished or time.monotonic()) - self._started
+            if not self._feeding:
+                total, total_known = self._read, True
+            elif self._expected is not None and not self._stop.is_set():
+                total, total_known = self._expected, True
+            else:
+                total, total_known = self._read, False
+            return BatchProgress(total=total, completed=self._completed,
+                                 failed=self._failed, cancelled=self._cancelled,
+                                 elapsed=elapsed, total_known=total_known,
+                                 searches=self._searches, search_encodes=self._search_encodes,
+                                 search_seconds=self._search_seconds)
+
+    def iter_results(self):
+        """Yield (name, stored outputs, error, traces) in input order, skipping cancelled ones.
+
+        Stored outputs are what output.add() returned for each output of
+        the member: file paths, or archive:name for an archive.
+        """
+        if self._results is None:
+            raise RuntimeError("start(stream_results=True) is needed for iter_results()")
+        while True:
+            result = self._results.get()
+            if result is None:
+                return
+            yield result
@@ -0,0 +1,1494 @@
+"""Benchmarks for the SSResizer pipeline.
+
+    python benchmark.py decode          # draft/reduce decode savings per preset
+    python benchmark.py preview         # per slider update cost, proxy vs. full-res
+    python benchmark.py estimate        # predicted vs. actual output size
+    python benchmark.py fanout          # every preset: separate passes vs. one decode
+    python benchmark.py budget          # max file size search cost vs. trying every quality
+    python benchmark.py memory          # peak RSS of a gigapixel input stays under the budget
+    python benchmark.py resample        # resampling strategies: time and quality per preset
+    python benchmark.py suite           # per-stage timings over a fixed corpus, to compare commits
+    python benchmark.py startup         # import time and imported modules per entry point
+    python benchmark.py schedule        # largest-first vs. listed order: tail and ETA accuracy
+    python benchmark.py archive         # ZIP in, ZIP out: streamed vs. extract, batch and re-zip
+    python benchmark.py exit            # small cli.py batches finish without writing to stderr
+
+Each measurement runs in a fresh worker process so peak RSS belongs to
+that case alone. Pass --json to get machine-readable output.
+"""
+import argparse
+import json
+import math
+import os
+import pickle
+import platform
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+from multiprocessing import get_context
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import PIL
+from PIL import Image, ImageChops, ImageMath
+
+import archive
+import engine
+import estimator
+import scheduler
+import server
+from batch import SCHEDULES, ArchiveRunner, BatchRunner
+
+# String expressions over images; the eval was renamed in Pillow 10.3
+_image_math = getattr(ImageMath, 'unsafe_eval', None) or ImageMath.eval
+
+# SSIM stabilizers for 8-bit images, and the window it's averaged over
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+SSIM_WINDOW = 8
+
+# The suite's corpus: source sizes, and the modes written in each source format
+SUITE_SIZES = {"small": (1200, 800), "medium": (3000, 2000), "large": (6000, 4000)}
+SUITE_FORMATS = {"JPEG": ("RGB",), "PNG": ("RGB", "RGBA", "P"), "TIFF": ("RGB", "RGBA", "P"),
+                 "WEBP": ("RGB", "RGBA")}
+SUITE_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "TIFF": ".tiff", "WEBP": ".webp"}
+SUITE_STAGES = ("decode", "crop", "resize", "encode", "write")
+
+# Modules each entry point must not load just by being imported. Headless
+# ones never load the GUI; the heavy Pillow plugins, multiprocessing and
+# ctypes are only imported when a run needs them
+GUI_ONLY_MODULES = ("tkinter", "PIL.ImageTk", "thumbnails", "estimator", "writer")
+LAZY_MODULES = ("multiprocessing", "ctypes", "PIL.TiffImagePlugin", "PIL.PngImagePlugin")
+STARTUP_FORBIDDEN = {
+    "engine": GUI_ONLY_MODULES + LAZY_MODULES + ("concurrent.futures", "uuid", "csv"),
+    "batch": GUI_ONLY_MODULES + LAZY_MODULES,
+    "cli": GUI_ONLY_MODULES + LAZY_MODULES,
+    "server": GUI_ONLY_MODULES + LAZY_MODULES,
+    "SSResizer": ("PIL.ImageTk", "tkinter.filedialog") + LAZY_MODULES,
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB, or None if unavailable"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def synthetic_image(size, seed=0, mode='RGB', detail=8):
+    """Deterministic photo-like test image: smooth gradients plus seeded texture.
+
+    detail is the texture grain in pixels; smaller means busier images
+    that compress worse.
+    """
+    width, height = size
+    rng = random.Random(seed)
+    small = (max(1, width // detail), max(1, height // detail))
+    texture = Image.frombytes('L', small, bytes(rng.getrandbits(8) for _ in range(small[0] * small[1])))
+    texture = texture.resize(size, Image.Resampling.BICUBIC)
+    red = Image.linear_gradient('L').resize(size)
+    green = Image.radial_gradient('L').resize(size)
+    image = Image.merge('RGB', (red, green, texture))
+    if mode == 'RGBA':
+        image.putalpha(Image.linear_gradient('L').rotate(90).resize(size))
+    elif mode != 'RGB':
+        image = image.convert(mode)
+    return image
+
+
+def run_isolated(func, *args):
+    """Run func(*args) in a fresh spawned process and return its result.
+
+    Linux keeps ru_maxrss across exec, so anything that allocates large
+    images (including writing the sources) must run isolated or it
+    inflates the peak RSS of every later case.
+    """
+    with get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(func, args)
+
+
+_CASE_PROBE = """
+import json, pickle, sys
+import benchmark
+name, args = pickle.load(sys.stdin.buffer)
+json.dump(getattr(benchmark, name)(*args), sys.stdout)
+"""
+
+
+def run_interpreter(func, *args):
+    """run_isolated() in a fresh interpreter, for cases that start worker processes of
+    their own: a pool's workers are daemonic and may not, and a spawned child exits
+    without waiting for its own pool to shut down"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    run = subprocess.run([sys.executable, "-c", _CASE_PROBE], cwd=here, check=True,
+                         input=pickle.dumps((func.__name__, args)), capture_output=True)
+    return json.loads(run.stdout)
+
+
+def _write_source(path, size, fmt, seed=1, mode='RGB'):
+    synthetic_image(size, seed=seed, mode=mode).save(path, format=fmt)
+
+
+def _decode_case(path, settings, reduced):
+    start = time.perf_counter()
+    if reduced:
+        image, _ = engine.open_image(path, settings)
+    else:
+        image = Image.open(path)
+    image.load()
+    decoded = time.perf_counter()
+    engine.render(image, settings)
+    end = time.perf_counter()
+    return {
+        'decoded_size': image.size,
+        'decode_s': decoded - start,
+        'total_s': end - start,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def bench_decode(args):
+    """Full decode vs draft()/reduce() decode for every preset"""
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = []
+        for fmt in args.formats:
+            path = os.path.join(tmp, f"source.{fmt.lower()}")
+            run_isolated(_write_source, path, (args.width, args.height), fmt)
+            sources.append((fmt, path))
+
+        for fmt, path in sources:
+            for resolution in engine.RESOLUTIONS:
+                settings = engine.ResizeSettings(resolution=resolution)
+                row = {'format': fmt, 'resolution': resolution,
+                       'scale': engine.decode_scale((args.width, args.height), settings)}
+                for label, reduced in (('full', False), ('reduced', True)):
+                    runs = [run_isolated(_decode_case, path, settings, reduced)
+                            for _ in range(args.repeat)]
+                    row[label] = {
+                        'decode_s': statistics.median(r['decode_s'] for r in runs),
+                        'total_s': statistics.median(r['total_s'] for r in runs),
+                        'peak_rss_mb': max((r['peak_rss_mb'] or 0) for r in runs) or None,
+                        'decoded_size': runs[0]['decoded_size'],
+                    }
+                results.append(row)
+
+    if args.json:
+        return results
+
+    print(f"Source {args.width}x{args.height}, median of {args.repeat} runs")
+    print(f"{'fmt':<5} {'preset':<6} {'scale':>5} {'decode full':>12} {'reduced':>9} "
+          f"{'total full':>11} {'reduced':>9} {'RSS full':>9} {'reduced':>9}")
+    for row in results:
+        full, reduced = row['full'], row['reduced']
+        print(f"{row['format']:<5} {row['resolution']:<6} {row['scale']:>5} "
+              f"{full['decode_s'] * 1000:>10.0f}ms {reduced['decode_s'] * 1000:>7.0f}ms "
+              f"{full['total_s'] * 1000:>9.0f}ms {reduced['total_s'] * 1000:>7.0f}ms "
+              f"{_fmt_mb(full['peak_rss_mb']):>9} {_fmt_mb(reduced['peak_rss_mb']):>9}")
+    return results
+
+
+def _fit(ratio, bounds):
+    width, height = bounds
+    if ratio > width / height:
+        return width, int(width / ratio)
+    return int(height * ratio), height
+
+
+def _percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def bench_preview(args):
+    """Time one crop-slider update against the proxy and against full-res pixels"""
+    canvas = (args.canvas_width, args.canvas_height)
+    results = []
+    for megapixels in args.megapixels:
+        height = int((megapixels * 1e6 / 1.5) ** 0.5)
+        source = synthetic_image((int(height * 1.5), height), seed=2)
+        for resolution in args.resolutions:
+            settings = engine.ResizeSettings(resolution=resolution)
+            target_width, target_height = settings.target_size
+            display_size = _fit(target_width / target_height, canvas)
+
+            start = time.perf_counter()
+            proxy = engine.make_proxy(source, canvas)
+            proxy_s = time.perf_counter() - start
+
+            old_times, new_times, frames = [], [], []
+            for crop_y in range(-100, 101, 10):
+                tick = settings.with_changes(crop_y=crop_y)
+                start = time.perf_counter()
+                resized = engine.render(source, tick)
+                resized.resize(display_size, Image.Resampling.LANCZOS)
+                old_times.append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                frames.append(engine.render_preview(proxy, tick, display_size))
+                new_times.append(time.perf_counter() - start)
+
+            row = {
+                'megapixels': megapixels, 'resolution': resolution,
+                'proxy_size': proxy.size, 'proxy_build_s': proxy_s,
+                'full_p50_s': _percentile(old_times, 50), 'full_p95_s': _percentile(old_times, 95),
+                'proxy_p50_s': _percentile(new_times, 50), 'proxy_p95_s': _percentile(new_times, 95),
+            }
+            tk_times = _tk_frame_times(frames, canvas)
+            if tk_times is not None:
+                row['tk_new_p50_s'] = _percentile(tk_times[0], 50)
+                row['tk_paste_p50_s'] = _percentile(tk_times[1], 50)
+            results.append(row)
+
+    if args.json:
+        return results
+
+    has_tk = 'tk_new_p50_s' in results[0]
+    print(f"Canvas {canvas[0]}x{canvas[1]}, crop slider sweep of 21 updates")
+    print(f"{'source':>7} {'preset':<6} {'proxy build':>11} {'full p50':>9} {'p95':>7} "
+          f"{'proxy p50':>10} {'p95':>7}" + (f" {'tk new':>8} {'tk paste':>9}" if has_tk else ""))
+    for row in results:
+        line = (f"{row['megapixels']:>5}MP {row['resolution']:<6} "
+                f"{row['proxy_build_s'] * 1000:>9.0f}ms "
+                f"{row['full_p50_s'] * 1000:>7.0f}ms {row['full_p95_s'] * 1000:>5.0f}ms "
+                f"{row['proxy_p50_s'] * 1000:>8.1f}ms {row['proxy_p95_s'] * 1000:>5.1f}ms")
+        if has_tk:
+            line += f" {row['tk_new_p50_s'] * 1000:>6.1f}ms {row['tk_paste_p50_s'] * 1000:>7.1f}ms"
+        print(line)
+    if not has_tk:
+        print("No display, so the Tk redraw columns are skipped")
+    return results
+
+
+def _tk_frame_times(frames, canvas_size):
+    """Seconds to show each frame on a Tk canvas, (new PhotoImage and item, paste in place).
+
+    None without a display.
+    """
+    import tkinter as tk
+    from PIL import ImageTk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        return None
+    try:
+        canvas = tk.Canvas(root, width=canvas_size[0], height=canvas_size[1])
+        canvas.pack()
+        root.update()
+        center = (canvas_size[0] // 2, canvas_size[1] // 2)
+
+        recreate = []
+        for frame in frames:
+            start = time.perf_counter()
+            photo = ImageTk.PhotoImage(frame)
+            canvas.delete("all")
+            canvas.create_image(*center, image=photo)
+            root.update_idletasks()
+            recreate.append(time.perf_counter() - start)
+
+        photo = ImageTk.PhotoImage(frames[0])
+        item = canvas.create_image(*center, image=photo)
+        paste = []
+        for frame in frames:
+            start = time.perf_counter()
+            photo.paste(frame)
+            canvas.coords(item, *center)
+            root.update_idletasks()
+            paste.append(time.perf_counter() - start)
+        return recreate, paste
+    finally:
+        root.destroy()
+
+
+def estimate_corpus(args):
+    """(name, image) pairs: a deterministic synthetic mix plus any files in --corpus"""
+    corpus = [
+        ("smooth 6000x4000", synthetic_image((6000, 4000), seed=3, detail=32)),
+        ("photo 4000x3000", synthetic_image((4000, 3000), seed=4, detail=8)),
+        ("busy 4000x3000", synthetic_image((4000, 3000), seed=5, detail=2)),
+        ("portrait 3000x4000", synthetic_image((3000, 4000), seed=6, detail=6)),
+        ("alpha 3000x2000", synthetic_image((3000, 2000), seed=7, mode='RGBA')),
+        ("palette 2400x1600", synthetic_image((2400, 1600), seed=8, detail=64).quantize(64)),
+    ]
+    if args.corpus:
+        for name in engine.list_images(args.corpus):
+            image = Image.open(os.path.join(args.corpus, name))
+            image.load()
+            corpus.append((name, image))
+    return corpus
+
+
+def bench_estimate(args):
+    """Accuracy and cost of the tile-sampled size prediction against real encodes"""
+    results = []
+    for name, image in estimate_corpus(args):
+        for fmt in args.formats:
+            for resolution in args.resolutions:
+                settings = engine.ResizeSettings(resolution=resolution, output_format=fmt)
+                start = time.perf_counter()
+                predicted = estimator.predict_size(image, settings)
+                predict_s = time.perf_counter() - start
+
+                start = time.perf_counter()
+                actual = engine.encoded_size(image, settings)
+                exact_s = time.perf_counter() - start
+
+                overhead, payload = estimator.extrapolate_payload(image, settings)
+                results.append({
+                    'image': name, 'format': fmt, 'resolution': resolution,
+                    'predicted': predicted, 'actual': actual,
+                    'error_pct': (predicted - actual) / actual * 100,
+                    'predict_s': predict_s, 'exact_s': exact_s,
+                    'fit_ratio': (actual - overhead) / payload if payload else None,
+                })
+
+    if args.json:
+        return results
+
+    print(f"{'image':<20} {'fmt':<5} {'preset':<6} {'predicted':>10} {'actual':>10} "
+          f"{'error':>7} {'predict':>8} {'exact':>8}")
+    for row in results:
+        print(f"{row['image'][:20]:<20} {row['format']:<5} {row['resolution']:<6} "
+              f"{engine.format_size(row['predicted']):>10} {engine.format_size(row['actual']):>10} "
+              f"{row['error_pct']:>+6.1f}% {row['predict_s'] * 1000:>6.0f}ms {row['exact_s'] * 1000:>6.0f}ms")
+
+    print()
+    print(f"{'fmt':<5} {'mean |error|':>12} {'p95 |error|':>11} {'speedup':>8}")
+    for fmt in args.formats:
+        rows = [r for r in results if r['format'] == fmt]
+        errors = [abs(r['error_pct']) for r in rows]
+        speedup = sum(r['exact_s'] for r in rows) / sum(r['predict_s'] for r in rows)
+        print(f"{fmt:<5} {statistics.mean(errors):>11.1f}% {_percentile(errors, 95):>10.1f}% "
+              f"{speedup:>7.1f}x")
+
+    if args.fit:
+        print()
+        print("Suggested CALIBRATION (median of actual / extrapolated payload):")
+        for fmt in args.formats:
+            ratios = [r['fit_ratio'] for r in results
+                      if r['format'] == fmt and r['fit_ratio'] is not None]
+            current = estimator.CALIBRATION[fmt]
+            print(f"    {fmt!r}: {statistics.median(ratios):.3f}  (current {current})")
+    return results
+
+
+def _fanout_case(path, output_folder, presets, fan_out):
+    start = time.perf_counter()
+    if fan_out:
+        engine.process_presets(path, output_folder, presets)
+    else:
+        for settings in presets:
+            engine.process(path, os.path.join(output_folder, engine.preset_folder(settings)),
+                           settings)
+    return {'total_s': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}
+
+
+def _psnr(a, b):
+    """Peak signal-to-noise ratio of two same-sized RGB images in dB"""
+    histogram = ImageChops.difference(a.convert('RGB'), b.convert('RGB')).histogram()
+    squares = sum(count * (value % 256) ** 2 for value, count in enumerate(histogram))
+    mse = squares / (a.width * a.height * 3)
+    return float('inf') if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def _ssim(a, b):
+    """Mean SSIM of the luminance of two same-sized images, over 8x8 windows"""
+    x = a.convert('L').convert('F')
+    y = b.convert('L').convert('F')
+    window = SSIM_WINDOW
+    mean_x, mean_y = x.reduce(window), y.reduce(window)
+    mean_xx = _image_math("x * x", x=x).reduce(window)
+    mean_yy = _image_math("y * y", y=y).reduce(window)
+    mean_xy = _image_math("x * y", x=x, y=y).reduce(window)
+    ssim = _image_math(
+        "((2 * mx * my + c1) * (2 * (mxy - mx * my) + c2))"
+        " / ((mx * mx + my * my + c1) * (mxx - mx * mx + myy - my * my + c2))",
+        mx=mean_x, my=mean_y, mxx=mean_xx, myy=mean_yy, mxy=mean_xy, c1=SSIM_C1, c2=SSIM_C2)
+    # Reducing by the whole size averages every window into one pixel
+    return ssim.reduce(ssim.size).getpixel((0, 0))
+
+
+def bench_fanout(args):
+    """One pass per preset vs. a single decode with a cascade downscale"""
+    base = engine.ResizeSettings(output_format=args.format)
+    presets = engine.fan_out(base, args.resolutions, engine.ORIENTATIONS if args.both else None)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "source.jpg")
+        run_isolated(_write_source, source, (args.width, args.height), 'JPEG')
+        for label, fan_out in (('separate', False), ('fan-out', True)):
+            output_folder = os.path.join(tmp, label)
+            runs = [run_isolated(_fanout_case, source, output_folder, presets, fan_out)
+                    for _ in range(args.repeat)]
+            results.append({
+                'mode': label, 'presets': len(presets),
+                'total_s': statistics.median(r['total_s'] for r in runs),
+                'peak_rss_mb': max((r['peak_rss_mb'] or 0) for r in runs) or None,
+            })
+
+        # The cascade should look the same as rendering each preset directly
+        image, _ = engine.open_image_for_presets(source, presets)
+        image.load()
+        quality = {
+            engine.preset_folder(settings): _psnr(engine.render(image, settings), cascaded)
+            for settings, cascaded in zip(presets, engine.render_presets(image, presets))
+        }
+
+    if args.json:
+        return {'runs': results, 'cascade_psnr_db': quality}
+
+    print(f"Source {args.width}x{args.height} JPEG, {len(presets)} {args.format} presets, "
+          f"median of {args.repeat} runs")
+    for row in results:
+        print(f"{row['mode']:<9} {row['total_s'] * 1000:>7.0f}ms  {_fmt_mb(row['peak_rss_mb']):>7}")
+    print()
+    print("Cascade vs. direct render (PSNR):")
+    for name, psnr in quality.items():
+        print(f"  {name:<16} {psnr:>6.1f} dB")
+    return {'runs': results, 'cascade_psnr_db': quality}
+
+
+def bench_resample(args):
+    """Each resampling strategy against the single LANCZOS pass exports used to make"""
+    source = synthetic_image((args.width, args.height), seed=3, detail=args.detail)
+    results = []
+    for resolution in args.resolutions:
+        settings = engine.ResizeSettings(resolution=resolution)
+        # What every export was before strategies: crop, then one LANCZOS pass
+        reference = engine.get_cropped_image(source, settings).resize(
+            settings.target_size, Image.Resampling.LANCZOS)
+        for strategy in engine.RESAMPLING:
+            tick = settings.with_changes(resample=strategy)
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                output = engine.render(source, tick)
+                times.append(time.perf_counter() - start)
+            results.append({
+                'resolution': resolution, 'strategy': strategy,
+                'resize_s': statistics.median(times),
+                'psnr_db': _psnr(output, reference), 'ssim': _ssim(output, reference),
+            })
+
+    if args.json:
+        return results
+
+    print(f"Source {args.width}x{args.height} RGB, median of {args.repeat} runs, "
+          f"compared with crop + single-pass LANCZOS")
+    print(f"{'preset':<6} {'strategy':<9} {'time':>8} {'PSNR':>8} {'SSIM':>7}")
+    for row in results:
+        psnr = "same" if math.isinf(row['psnr_db']) else f"{row['psnr_db']:.1f}dB"
+        print(f"{row['resolution']:<6} {row['strategy']:<9} {row['resize_s'] * 1000:>6.0f}ms "
+              f"{psnr:>8} {row['ssim']:>7.4f}")
+    return results
+
+
+def suite_corpus(folder, sizes):
+    """Write the suite's synthetic sources into folder, reusing any already there.
+
+    Each file's content depends only on its name, so a corpus folder kept
+    between runs (--corpus-dir) holds the same bytes on every commit.
+    Returns the paths in a fixed order.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for size_name in sizes:
+        for fmt, modes in SUITE_FORMATS.items():
+            for mode in modes:
+                name = f"{size_name}-{mode.lower()}{SUITE_EXTENSIONS[fmt]}"
+                path = os.path.join(folder, name)
+                if not os.path.exists(path):
+                    image = synthetic_image(SUITE_SIZES[size_name], seed=zlib.crc32(name.encode()),
+                                            mode=mode)
+                    image.save(path, format=fmt)
+                paths.append(path)
+    return paths
+
+
+def _suite_job(path, settings, formats, output_folder):
+    """Run one source through the pipeline at one preset, timing every stage.
+
+    The source is decoded, cropped and resized once, then encoded and
+    written in each output format.
+    """
+    start = time.perf_counter()
+    image, _ = engine.open_image(path, settings)
+    image.load()
+    decoded = time.perf_counter()
+    cropped = engine.get_cropped_image(image, settings)
+    cropped_at = time.perf_counter()
+    resized = engine.resample(cropped, settings.target_size, settings.strategy)
+    resized_at = time.perf_counter()
+    row = {'source': os.path.basename(path), 'resolution': settings.resolution,
+           'decode_s': decoded - start, 'crop_s': cropped_at - decoded,
+           'resize_s': resized_at - cropped_at, 'outputs': {}}
+
+    for fmt in formats:
+        fmt_settings = settings.with_changes(output_format=fmt)
+        start = time.perf_counter()
+        buffer = BytesIO()
+        engine.encode(resized, buffer, fmt_settings)
+        encoded = time.perf_counter()
+        output_path = os.path.join(output_folder, f"{settings.resolution}-{fmt}-"
+                                   + engine.output_filename(path, fmt_settings))
+        with open(output_path, 'wb') as f:
+            f.write(buffer.getbuffer())
+        row['outputs'][fmt] = {'encode_s': encoded - start,
+                               'write_s': time.perf_counter() - encoded,
+                               'bytes': buffer.tell()}
+    return row
+
+
+def _median_job(runs):
+    """Per-stage medians of repeated runs of one job"""
+    row = dict(runs[0])
+    for stage in ('decode_s', 'crop_s', 'resize_s'):
+        row[stage] = statistics.median(run[stage] for run in runs)
+    row['outputs'] = {
+        fmt: {'encode_s': statistics.median(run['outputs'][fmt]['encode_s'] for run in runs),
+              'write_s': statistics.median(run['outputs'][fmt]['write_s'] for run in runs),
+              'bytes': output['bytes']}
+        for fmt, output in runs[0]['outputs'].items()
+    }
+    return row
+
+
+def _suite_meta():
+    """Where and on what a suite run was measured"""
+    commit = None
+    try:
+        here = os.path.dirname(os.path.abspath(__file__))
+        commit = subprocess.run(["git", "-C", here, "describe", "--always", "--dirty"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass  # Not a git checkout
+    return {'commit': commit, 'python': platform.python_version(), 'pillow': PIL.__version__,
+            'platform': platform.platform(), 'cpu_count': os.cpu_count()}
+
+
+def _stage_summary(rows):
+    """Median, p95 and total seconds of every stage over the suite's rows"""
+    samples = {stage: [] for stage in SUITE_STAGES}
+    for row in rows:
+        for stage in ('decode', 'crop', 'resize'):
+            samples[stage].append(row[f'{stage}_s'])
+        for output in row['outputs'].values():
+            samples['encode'].append(output['encode_s'])
+            samples['write'].append(output['write_s'])
+    return {stage: {'median_s': statistics.median(values), 'p95_s': _percentile(values, 95),
+                    'total_s': sum(values)}
+            for stage, values in samples.items() if values}
+
+
+def bench_suite(args):
+    """Every stage of the pipeline over a deterministic corpus, per preset and output format"""
+    base = engine.ResizeSettings(resample=args.resample, encoder=args.encoder)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = suite_corpus(args.corpus_dir or os.path.join(tmp, "corpus"), args.sizes)
+        output_folder = os.path.join(tmp, "out")
+        os.makedirs(output_folder)
+        jobs = [(path, base.with_changes(resolution=resolution), args.formats, output_folder)
+                for path in corpus for resolution in args.resolutions]
+
+        start = time.perf_counter()
+        if args.jobs > 1:
+            with ProcessPoolExecutor(args.jobs, mp_context=get_context('spawn')) as executor:
+                runs = [[executor.submit(_suite_job, *job) for job in jobs]
+                        for _ in range(args.repeat)]
+                runs = [[future.result() for future in futures] for futures in runs]
+        else:
+            runs = [[_suite_job(*job) for job in jobs] for _ in range(args.repeat)]
+        wall = (time.perf_counter() - start) / args.repeat
+
+    rows = [_median_job([run[i] for run in runs]) for i in range(len(jobs))]
+    outputs = len(jobs) * len(args.formats)
+    results = {
+        'meta': _suite_meta(),
+        'config': {'sizes': args.sizes, 'resolutions': args.resolutions, 'formats': args.formats,
+                   'resample': base.strategy, 'encoder': base.encoder_profile, 'jobs': args.jobs, 'repeat': args.repeat,
+                   'sources': len(corpus)},
+        'wall_s': wall, 'outputs_per_s': outputs / wall,
+        'stages': _stage_summary(rows),
+        'rows': rows,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    if args.json:
+        return results
+
+    print(f"{len(corpus)} sources x {len(args.resolutions)} presets x {len(args.formats)} formats "
+          f"= {outputs} outputs, {args.jobs} job(s), median of {args.repeat} runs "
+          f"[{results['meta']['commit'] or 'no git'}]")
+    print(f"Wall {wall:.2f}s, {results['outputs_per_s']:.1f} outputs/s")
+    print()
+    header = f"{'stage':<7} {'median':>9} {'p95':>9} {'total':>8}"
+    if baseline:
+        header += f" {'baseline':>9} {'change':>7}"
+    print(header)
+    for stage, summary in results['stages'].items():
+        line = (f"{stage:<7} {summary['median_s'] * 1000:>7.1f}ms {summary['p95_s'] * 1000:>7.1f}ms "
+                f"{summary['total_s']:>7.2f}s")
+        old = baseline and baseline['stages'].get(stage)
+        if old:
+            change = (summary['total_s'] / old['total_s'] - 1) * 100 if old['total_s'] else 0.0
+            line += f" {old['total_s']:>8.2f}s {change:>+6.0f}%"
+        print(line)
+    if baseline:
+        change = (wall / baseline['wall_s'] - 1) * 100
+        print(f"\nWall vs. baseline [{baseline['meta'].get('commit') or 'no git'}]: "
+              f"{baseline['wall_s']:.2f}s -> {wall:.2f}s ({change:+.0f}%)")
+    print()
+    print(f"{'preset':<6} " + " ".join(f"{fmt + ' encode':>13}" for fmt in args.formats))
+    for resolution in args.resolutions:
+        encode_times = [statistics.median(row['outputs'][fmt]['encode_s'] for row in rows
+                                          if row['resolution'] == resolution)
+                        for fmt in args.formats]
+        print(f"{resolution:<6} " + " ".join(f"{t * 1000:>11.1f}ms" for t in encode_times))
+    return results
+
+
+def bench_encoders(args):
+    """Encode time and output size of every encoder profile, per output format"""
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = suite_corpus(args.corpus_dir or tmp, args.sizes)
+        renders = []
+        for path in corpus:
+            for resolution in args.resolutions:
+                settings = engine.ResizeSettings(resolution=resolution)
+                image, _ = engine.open_image(path, settings)
+                with image:
+                    renders.append(engine.render(image, settings))
+
+    results = []
+    for fmt in args.formats:
+        for profile in engine.ENCODER_PROFILES:
+            settings = engine.ResizeSettings(output_format=fmt, jpeg_quality=args.quality,
+                                             encoder=profile)
+            times, total_bytes, pixels = [], 0, 0
+            for rendered in renders:
+                rendered = engine.prepare_for_format(rendered, fmt)
+                runs = []
+                for _ in range(args.repeat):
+                    buffer = BytesIO()
+                    start = time.perf_counter()
+                    engine.encode(rendered, buffer, settings)
+                    runs.append(time.perf_counter() - start)
+                times.append(statistics.median(runs))
+                total_bytes += buffer.tell()
+                pixels += rendered.width * rendered.height
+            results.append({'format': fmt, 'encoder': profile, 'outputs': len(times),
+                            'median_s': statistics.median(times), 'total_s': sum(times),
+                            'mpix_per_s': pixels / 1e6 / sum(times), 'bytes': total_bytes})
+
+    if args.json:
+        return results
+    print(f"{len(corpus)} sources x {len(args.resolutions)} presets, quality {args.quality}, "
+          f"median of {args.repeat}")
+    print(f"{'format':<6} {'encoder':<9} {'median':>9} {'MP/s':>7} {'total size':>11} "
+          f"{'vs. balanced':>13} {'speed':>6}")
+    for row in results:
+        balanced = next(r for r in results
+                        if r['format'] == row['format'] and r['encoder'] == "balanced")
+        print(f"{row['format']:<6} {row['encoder']:<9} {row['median_s'] * 1000:>7.1f}ms "
+              f"{row['mpix_per_s']:>7.1f} {engine.format_size(row['bytes']):>11} "
+              f"{(row['bytes'] / balanced['bytes'] - 1) * 100:>+11.1f}% "
+              f"{balanced['total_s'] / row['total_s']:>5.1f}x")
+    return results
+
+
+def _serve_request(base_url, query):
+    start = time.perf_counter()
+    with urlopen(f"{base_url}/resize?{urlencode(query)}") as response:
+        response.read()
+        outcome = response.headers["X-Cache"]
+    return time.perf_counter() - start, outcome
+
+
+def bench_serve(args):
+    """Load-test the HTTP service on localhost: coalescing, cache hit rate and latency"""
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = suite_corpus(args.corpus_dir or tmp, args.sizes)
+        service = server.ResizeService(os.path.dirname(corpus[0]),
+                                       args.cache_mb * 1024 * 1024, args.jobs)
+        httpd = server.make_server(service, port=0, quiet=True)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        base_url = "http://%s:%d" % httpd.server_address[:2]
+        try:
+            # A burst of identical requests should cost one render
+            burst_query = {"path": os.path.basename(corpus[0]), "resolution": "4K"}
+            with ThreadPoolExecutor(args.clients) as clients:
+                burst = list(clients.map(lambda _: _serve_request(base_url, burst_query),
+                                         range(args.clients)))
+
+            # Then a skewed mix: a few popular renders and a long tail
+            variants = [{"path": os.path.basename(path), "resolution": resolution,
+                         "format": fmt}
+                        for path in corpus for resolution in ("720P", "1080P")
+                        for fmt in ("JPEG", "WEBP")]
+            rng = random.Random(0)
+            queries = [variants[min(len(variants) - 1, int(rng.expovariate(1 / args.skew)))]
+                       for _ in range(args.requests)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(args.clients) as clients:
+                timings = list(clients.map(lambda q: _serve_request(base_url, q), queries))
+            wall = time.perf_counter() - start
+            metrics = service.metrics()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            service.close()
+
+    latencies = [t for t, _ in timings]
+    outcomes = [o for _, o in timings]
+    results = {
+        'burst': {'requests': len(burst), 'renders': [o for _, o in burst].count("miss"),
+                  'coalesced': [o for _, o in burst].count("coalesced")},
+        'requests': len(timings), 'clients': args.clients, 'distinct': len(variants),
+        'wall_s': wall, 'requests_per_s': len(timings) / wall,
+        'p50_ms': _percentile(latencies, 50) * 1000, 'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'hits': outcomes.count("hit"), 'misses': outcomes.count("miss"),
+        'coalesced': outcomes.count("coalesced"),
+        'server': metrics,
+    }
+    if args.json:
+        return results
+    print(f"Burst of {args.clients} identical 4K requests: {results['burst']['renders']} render, "
+          f"{results['burst']['coalesced']} coalesced")
+    print(f"{len(timings)} requests over {len(variants)} variants from {args.clients} clients: "
+          f"{results['requests_per_s']:.1f} req/s, latency p50 {results['p50_ms']:.1f} ms, "
+          f"p95 {results['p95_ms']:.1f} ms, p99 {results['p99_ms']:.1f} ms")
+    print(f"hits {results['hits']}, misses {results['misses']}, coalesced {results['coalesced']} "
+          f"(server hit rate {metrics['hit_rate']:.0%}, {metrics['cache']['evictions']} evictions, "
+          f"{engine.format_size(metrics['cache']['bytes'])} cached)")
+    return results
+
+
+def _best_quality(image, settings):
+    """Highest quality that fits settings.max_bytes, by encoding every one"""
+    for quality in range(min(100, settings.jpeg_quality), engine.MIN_SEARCH_QUALITY - 1, -1):
+        data = engine._encode_candidate(image, settings, quality, engine.WEBP_METHOD)
+        if len(data) <= settings.max_bytes:
+            return quality
+    return None
+
+
+def bench_budget(args):
+    """Encodes and time the max file size search spends, and how close it gets"""
+    results = []
+    for name, image in estimate_corpus(args):
+        for fmt in args.formats:
+            base = engine.ResizeSettings(resolution=args.resolution, output_format=fmt,
+                                         jpeg_quality=args.quality)
+            rendered = engine.prepare_for_format(engine.render(image, base), fmt)
+            for kilobytes in args.budgets:
+                settings = base.with_changes(max_bytes=kilobytes * 1024)
+                try:
+                    _, trace = engine.fit_to_budget(rendered, settings)
+                except ValueError:
+                    trace = None
+                results.append({
+                    'image': name, 'format': fmt, 'budget_kb': kilobytes,
+                    'quality': trace and trace.quality, 'method': trace and trace.method,
+                    'size': trace and trace.size, 'encodes': trace and trace.encodes,
+                    'search_s': trace and trace.elapsed,
+                    'best_quality': _best_quality(rendered, settings) if args.check else None,
+                })
+
+    if args.json:
+        return results
+
+    print(f"{'image':<20} {'fmt':<5} {'budget':>7} {'quality':>8} {'best':>5} {'size':>10} "
+          f"{'encodes':>8} {'time':>7}")
+    for row in results:
+        if row['quality'] is None:
+            print(f"{row['image'][:20]:<20} {row['format']:<5} {row['budget_kb']:>5}KB  doesn't fit")
+            continue
+        method = f"m{row['method']}" if row['method'] is not None else ""
+        best = "" if row['best_quality'] is None else row['best_quality']
+        print(f"{row['image'][:20]:<20} {row['format']:<5} {row['budget_kb']:>5}KB "
+              f"{row['quality']:>5}{method:>3} {best:>5} {engine.format_size(row['size']):>10} "
+              f"{row['encodes']:>8} {row['search_s'] * 1000:>5.0f}ms")
+
+    print()
+    print(f"{'fmt':<5} {'mean encodes':>12} {'max':>4} {'mean time':>10}")
+    for fmt in args.formats:
+        rows = [r for r in results if r['format'] == fmt and r['quality'] is not None]
+        if rows:
+            print(f"{fmt:<5} {statistics.mean(r['encodes'] for r in rows):>12.1f} "
+                  f"{max(r['encodes'] for r in rows):>4} "
+                  f"{statistics.mean(r['search_s'] for r in rows) * 1000:>8.0f}ms")
+    return results
+
+
+def _synthetic_bands(size, rows):
+    """(y, band image) covering a synthetic image of size, without ever holding all of it"""
+    width, height = size
+    for y in range(0, height, rows):
+        yield y, synthetic_image((width, min(rows, height - y)), seed=y)
+
+
+def _png_chunk(kind, body):
+    return (struct.pack('>I', len(body)) + kind + body
+            + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff))
+
+
+def _write_large_png(path, size):
+    """Stream a synthetic RGB PNG to path one band of scanlines at a time"""
+    width, height = size
+    compressor = zlib.compressobj(1)
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        for _, band in _synthetic_bands(size, 256):
+            data = band.tobytes()
+            stride = width * 3
+            # Filter type 0 (None) on every scanline
+            raw = b''.join(b'\0' + data[i:i + stride] for i in range(0, len(data), stride))
+            f.write(_png_chunk(b'IDAT', compressor.compress(raw)))
+        f.write(_png_chunk(b'IDAT', compressor.flush()))
+        f.write(_png_chunk(b'IEND', b''))
+
+
+def _write_large_tiff(path, size, rows_per_strip=64):
+    """Stream a synthetic deflate-compressed RGB TIFF to path, a strip at a time"""
+    width, height = size
+    offsets, counts = [], []
+    with open(path, 'wb') as f:
+        f.write(b'II*\x00' + struct.pack('<I', 0))  # IFD offset is patched in at the end
+        for _, band in _synthetic_bands(size, 256):
+            data = band.tobytes()
+            strip_bytes = rows_per_strip * width * 3
+            for i in range(0, len(data), strip_bytes):
+                strip = zlib.compress(data[i:i + strip_bytes], 1)
+                offsets.append(f.tell())
+                counts.append(len(strip))
+                f.write(strip)
+        strips = len(offsets)
+        arrays_at = f.tell()
+        f.write(struct.pack('<3H', 8, 8, 8))
+        f.write(struct.pack(f'<{strips}I', *offsets))
+        f.write(struct.pack(f'<{strips}I', *counts))
+        entries = [
+            (256, 4, 1, width), (257, 4, 1, height), (258, 3, 3, arrays_at),
+            (259, 3, 1, 8), (262, 3, 1, 2), (273, 4, strips, arrays_at + 6),
+            (277, 3, 1, 3), (278, 4, 1, rows_per_strip),
+            (279, 4, strips, arrays_at + 6 + 4 * strips), (284, 3, 1, 1),
+        ]
+        ifd_at = f.tell()
+        f.write(struct.pack('<H', len(entries)))
+        for tag, kind, count, value in entries:
+            f.write(struct.pack('<HHII', tag, kind, count, value))
+        f.write(struct.pack('<I', 0))
+        f.seek(4)
+        f.write(struct.pack('<I', ifd_at))
+
+
+def _memory_case(path, output_folder, settings, memory_budget):
+    start = time.perf_counter()
+    if path is not None:
+        engine.process(path, output_folder, settings, memory_budget=memory_budget)
+    return {'total_s': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}
+
+
+def bench_memory(args):
+    """Peak RSS of processing an image far past Pillow's decompression-bomb limit"""
+    size = (args.width, args.height)
+    budget_mb = args.budget
+    settings = engine.ResizeSettings(resolution=args.resolution)
+    writers = {'PNG': _write_large_png, 'TIFF': _write_large_tiff}
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # Interpreter, Pillow and engine alone; the check is against growth past this
+        baseline = run_isolated(_memory_case, None, tmp, settings, None)['peak_rss_mb']
+        for fmt in args.formats:
+            path = os.path.join(tmp, f"large.{fmt.lower()}")
+            run_isolated(writers[fmt], path, size)
+            run = run_isolated(_memory_case, path, os.path.join(tmp, fmt), settings,
+                               budget_mb * 1024 * 1024)
+            growth = None if run['peak_rss_mb'] is None else run['peak_rss_mb'] - baseline
+            results.append({
+                'format': fmt, 'file_mb': os.path.getsize(path) / (1024 * 1024),
+                'decoded_mb': args.width * args.height * 4 / (1024 * 1024),
+                'budget_mb': budget_mb, 'total_s': run['total_s'],
+                'peak_rss_mb': run['peak_rss_mb'], 'growth_mb': growth,
+                'passed': None if growth is None else growth <= budget_mb,
+            })
+
+    if args.json:
+        return results
+
+    print(f"Source {args.width}x{args.height} ({args.width * args.height / 1e6:.0f} MP) to "
+          f"{args.resolution}, budget {budget_mb}MB, baseline RSS {_fmt_mb(baseline)}")
+    print(f"{'fmt':<5} {'file':>8} {'decoded':>8} {'time':>8} {'peak RSS':>9} {'growth':>7}")
+    for row in results:
+        verdict = {True: "PASS", False: "FAIL", None: "n/a"}[row['passed']]
+        print(f"{row['format']:<5} {_fmt_mb(row['file_mb']):>8} {_fmt_mb(row['decoded_mb']):>8} "
+              f"{row['total_s']:>7.1f}s {_fmt_mb(row['peak_rss_mb']):>9} "
+              f"{_fmt_mb(row['growth_mb']):>7}  {verdict}")
+    return results
+
+
+def _fmt_mb(value):
+    return "n/a" if value is None else f"{value:.0f}MB"
+
+
+def schedule_corpus(folder, small, medium, huge):
+    """A folder that lists its costliest images last: small JPEGs, then medium and huge PNGs"""
+    os.makedirs(folder, exist_ok=True)
+    groups = [("a", small, (2000, 1500), "JPEG", ".jpg"), ("m", medium, (4000, 3000), "PNG", ".png"),
+              ("z", huge, (10000, 7000), "PNG", ".png")]
+    paths = []
+    for prefix, count, size, fmt, extension in groups:
+        for i in range(count):
+            path = os.path.join(folder, f"{prefix}{i:03d}{extension}")
+            if not os.path.exists(path):
+                run_isolated(_write_source, path, size, fmt, zlib.crc32(path.encode()))
+            paths.append(path)
+    return sorted(paths)
+
+
+def _makespan(order, seconds, workers):
+    """Finish time of jobs taking seconds[path], handed in order to the first free worker"""
+    free = [0.0] * workers
+    for path in order:
+        free[free.index(min(free))] += seconds[path]
+    return max(free)
+
+
+def bench_schedule(args):
+    """Largest-first vs. listed order: the batch's tail on N workers, and ETA accuracy"""
+    settings = engine.ResizeSettings(resolution=args.resolution, output_format=args.format)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = schedule_corpus(args.corpus_dir or os.path.join(tmp, "corpus"),
+                                args.small, args.medium, args.huge)
+        for schedule in ("input", "largest"):
+            runner = BatchRunner(list(paths), os.path.join(tmp, schedule), settings,
+                                 workers=args.jobs, profile=True, schedule=schedule).start()
+            samples = []
+            while not runner.wait(args.sample_interval):
+                samples.append((time.monotonic(), runner.progress().eta))
+            end = time.monotonic()
+            wall = runner.progress().elapsed
+            start = end - wall
+            # ETA error as a share of the batch's wall time, over its middle 80%
+            errors = [abs(eta - (end - t)) / wall for t, eta in samples
+                      if eta is not None and 0.1 <= (t - start) / wall <= 0.9]
+            seconds = {p.path: p.total for p in runner.profiles}
+            if schedule == "largest":
+                order = [path for path, _ in scheduler.largest_first(paths, settings)]
+            else:
+                order = paths
+            row = {'schedule': schedule, 'images': len(seconds), 'wall_s': wall,
+                   'eta_error_p50': _percentile(errors, 50) if errors else None,
+                   'eta_error_max': max(errors) if errors else None,
+                   'classes': runner.progress().classes_summary(), 'makespan_s': {}}
+            for workers in args.simulate:
+                row['makespan_s'][workers] = _makespan(order, seconds, workers)
+            # Best possible: work spread evenly, but never shorter than the longest job
+            row['ideal_s'] = {w: max(sum(seconds.values()) / w, max(seconds.values()))
+                              for w in args.simulate}
+            results.append(row)
+
+    if args.json:
+        return results
+
+    print(f"{args.small} small JPEG, {args.medium} medium PNG and {args.huge} huge PNG sources "
+          f"(listed last) to {args.resolution} {args.format}, {args.jobs} workers; tails "
+          f"replayed from measured job times")
+    print(f"{'schedule':<8} {'wall':>7} {'ETA err p50':>11} {'max':>6}  "
+          + "  ".join(f"{f'{w} workers':>17}" for w in args.simulate))
+    for row in results:
+        eta = ("n/a" if row['eta_error_p50'] is None else
+               f"{row['eta_error_p50']:>10.0%} {row['eta_error_max']:>6.0%}")
+        tails = "  ".join(f"{row['makespan_s'][w]:>6.1f}s (ideal {row['ideal_s'][w]:.1f})"
+                          for w in args.simulate)
+        print(f"{row['schedule']:<8} {row['wall_s']:>6.1f}s {eta:>18}  {tails}")
+    print(f"classes: {results[-1]['classes']}")
+    return results
+
+
+def _write_archive_corpus(path, images, sources, size):
+    """ZIP of images JPEG members, cycling through sources distinct synthetic photos"""
+    import zipfile
+    members = []
+    for seed in range(sources):
+        buffer = BytesIO()
+        synthetic_image(size, seed=seed).save(buffer, format="JPEG", quality=90)
+        members.append(buffer.getvalue())
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as z:
+        for i in range(images):
+            z.writestr(f"shoot/{i // 100:02d}/img{i:05d}.jpg", members[i % sources])
+
+
+def _archive_case(method, source, output, settings, workers):
+    """Peak parent RSS and wall time of one ZIP-to-ZIP run; scratch is the disk it extracted to"""
+    import zipfile
+    start = time.perf_counter()
+    scratch = 0
+    if method == "stream":
+        runner = ArchiveRunner(archive.read_members(source), archive.ArchiveWriter(output),
+                               settings, workers=workers).start()
+        runner.wait()
+        failed = runner.progress().failed + (runner.error is not None)
+    elif method == "extract":
+        folder = output + ".d"
+        with zipfile.ZipFile(source) as z:
+            z.extractall(folder)
+        paths = [os.path.join(root, name) for root, _, names in os.walk(folder) for name in names]
+        scratch = sum(os.path.getsize(path) for path in paths)
+        output_folder = os.path.join(folder, engine.OUTPUT_FOLDER_NAME)
+        runner = BatchRunner(sorted(paths), output_folder, settings, workers=workers,
+                             input_root=folder, schedule="input").start()
+        runner.wait()
+        failed = runner.progress().failed
+        with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as z:
+            for root, _, names in os.walk(output_folder):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    z.write(path, os.path.relpath(path, output_folder))
+        shutil.rmtree(folder)
+    else:
+        failed = 0
+    return {'total_s': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb(),
+            'scratch_mb': scratch / (1024 * 1024), 'failed': failed}
+
+
+def bench_archive(args):
+    """ZIP in, ZIP out: members streamed through the workers vs. extract, batch and re-zip"""
+    settings = engine.ResizeSettings(resolution=args.resolution, output_format=args.format)
+    size = tuple(args.source_size)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = run_interpreter(_archive_case, None, None, None, settings, args.jobs)['peak_rss_mb']
+        for images in args.images:
+            source = os.path.join(tmp, f"in{images}.zip")
+            run_isolated(_write_archive_corpus, source, images, args.sources, size)
+            for method in ("extract", "stream"):
+                output = os.path.join(tmp, f"{method}{images}.zip")
+                run = run_interpreter(_archive_case, method, source, output, settings, args.jobs)
+                results.append({
+                    'method': method, 'images': images,
+                    'archive_mb': os.path.getsize(source) / (1024 * 1024),
+                    'total_s': run['total_s'], 'failed': run['failed'],
+                    'peak_rss_mb': run['peak_rss_mb'], 'scratch_mb': run['scratch_mb'],
+                    'growth_mb': (None if run['peak_rss_mb'] is None
+                                  else run['peak_rss_mb'] - baseline),
+                })
+                os.remove(output)
+
+    if args.json:
+        return results
+
+    print(f"{size[0]}x{size[1]} JPEG members ({args.sources} distinct) to {args.resolution} "
+          f"{args.format}, {args.jobs} workers, baseline RSS {_fmt_mb(baseline)}")
+    print(f"{'method':<8} {'images':>6} {'archive':>8} {'time':>8} {'img/s':>6} "
+          f"{'RSS growth':>10} {'scratch':>8}")
+    for row in results:
+        print(f"{row['method']:<8} {row['images']:>6} {_fmt_mb(row['archive_mb']):>8} "
+              f"{row['total_s']:>7.1f}s {row['images'] / row['total_s']:>6.1f} "
+              f"{_fmt_mb(row['growth_mb']):>10} {_fmt_mb(row['scratch_mb']):>8}")
+    return results
+
+
+_IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+modules = sorted(sys.modules)
+import json
+json.dump({{"import_s": elapsed, "modules": modules}}, sys.stdout)
+"""
+
+_PAINT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    json.dump({"error": str(e)}, sys.stdout)
+    sys.exit()
+import SSResizer
+app = SSResizer.ImageResizerApp(root)
+exposes = []
+app.welcome_frame.bind('<Expose>', lambda e: exposes.append(app.settings_built), add='+')
+root.update()
+painted = time.perf_counter() - start
+deadline = time.monotonic() + 10
+while not app.settings_built and time.monotonic() < deadline:
+    root.update()
+built = time.perf_counter() - start
+root.destroy()
+app.writer.shutdown()
+json.dump({"first_paint_s": painted, "panel_s": built,
+           "panel_before_paint": bool(exposes and exposes[0])}, sys.stdout)
+"""
+
+# Picks a folder before the idle callback that builds the settings panel has run
+_SELECT_PROBE = """
+import json, os, sys, tempfile, time
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError as e:
+    json.dump({"error": str(e)}, sys.stdout)
+    sys.exit()
+from tkinter import filedialog
+from PIL import Image
+folder = tempfile.mkdtemp()
+os.environ["XDG_CACHE_HOME"] = os.path.join(folder, "cache")
+Image.new("RGB", (640, 480), "gray").save(os.path.join(folder, "a.jpg"))
+filedialog.askdirectory = lambda **kwargs: folder
+import SSResizer
+
+def widgets(widget):
+    yield widget
+    for child in widget.winfo_children():
+        yield from widgets(child)
+
+app = SSResizer.ImageResizerApp(root)
+deferred = not app.settings_built
+app.select_folder()
+sections = len(app.settings_container.winfo_children())
+deadline = time.monotonic() + 10
+while app.current_image is None and time.monotonic() < deadline:
+    root.update()
+# Let every queued expose and idle callback run
+for _ in range(20):
+    root.update()
+    time.sleep(0.01)
+menus = sum(isinstance(w, tk.OptionMenu) for w in widgets(app.settings_container))
+result = {"deferred": deferred, "loaded": app.current_image is not None, "option_menus": menus,
+          "sections": len(app.settings_container.winfo_children()), "sections_at_select": sections}
+app.on_close()
+app.thumbnails.shutdown()
+json.dump(result, sys.stdout)
+"""
+
+
+def _display_prefix():
+    """Command prefix giving a GUI probe a display: xvfb-run where X has none, else nothing"""
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+        xvfb_run = shutil.which("xvfb-run")
+        if xvfb_run:
+            return [xvfb_run, "-a"]
+    return []
+
+
+def _probe(code, prefix=()):
+    """(wall seconds, JSON output) of code run in a fresh interpreter next to this file"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    start = time.perf_counter()
+    run = subprocess.run([*prefix, sys.executable, "-c", code], cwd=here, capture_output=True,
+                         text=True, check=True)
+    return time.perf_counter() - start, json.loads(run.stdout)
+
+
+def bench_startup(args):
+    """Import time and loaded modules of each entry point, and the GUI's first paint"""
+    results = []
+    for module in args.modules:
+        probes = [_probe(_IMPORT_PROBE.format(module=module)) for _ in range(args.repeat + 1)][1:]
+        modules = probes[-1][1]['modules']
+        import_ms = statistics.median(p[1]['import_s'] for p in probes) * 1000
+        unexpected = [name for name in STARTUP_FORBIDDEN.get(module, ()) if name in modules]
+        results.append({
+            'target': f"import {module}", 'import_ms': import_ms,
+            'process_ms': statistics.median(p[0] for p in probes) * 1000,
+            'modules': len(modules), 'unexpected': unexpected, 'budget_ms': args.budget_ms,
+            'passed': not unexpected and import_ms <= args.budget_ms,
+        })
+
+    if args.gui:
+        prefix = _display_prefix()
+        paints = [_probe(_PAINT_PROBE, prefix)[1] for _ in range(args.repeat)]
+        if 'error' in paints[0]:
+            skipped = f"no display ({paints[0]['error']}); install xvfb-run to check headless"
+            results.append({'target': "GUI first paint", 'skipped': skipped, 'passed': None})
+            results.append({'target': "GUI early select", 'skipped': skipped, 'passed': None})
+        else:
+            first_paint_ms = statistics.median(p['first_paint_s'] for p in paints) * 1000
+            late_panel = not any(p['panel_before_paint'] for p in paints)
+            results.append({
+                'target': "GUI first paint", 'first_paint_ms': first_paint_ms,
+                'panel_ms': statistics.median(p['panel_s'] for p in paints) * 1000,
+                'budget_ms': args.paint_budget_ms, 'panel_after_paint': late_panel,
+                'passed': late_panel and first_paint_ms <= args.paint_budget_ms,
+            })
+            select = _probe(_SELECT_PROBE, prefix)[1]
+            results.append({
+                'target': "GUI early select", **select,
+                # Built once, when the folder was picked; the idle callback found it built
+                'passed': (select['deferred'] and select['loaded'] and select['option_menus'] == 1
+                           and select['sections'] == select['sections_at_select']),
+            })
+
+    if args.json:
+        return results
+
+    print(f"Median of {args.repeat} fresh interpreters, Python {platform.python_version()}, "
+          f"Pillow {PIL.__version__}")
+    print(f"{'target':<18} {'import':>8} {'process':>8} {'modules':>8} {'budget':>7}")
+    for row in results:
+        verdict = {True: "PASS", False: "FAIL", None: "SKIP"}[row['passed']]
+        if 'import_ms' in row:
+            print(f"{row['target']:<18} {row['import_ms']:>6.1f}ms {row['process_ms']:>6.0f}ms "
+                  f"{row['modules']:>8} {row['budget_ms']:>5.0f}ms  {verdict}")
+            if row['unexpected']:
+                print(f"  imports {', '.join(row['unexpected'])} up front")
+        elif 'skipped' in row:
+            print(f"{row['target']:<18} {verdict}: {row['skipped']}")
+        elif 'first_paint_ms' in row:
+            print(f"{row['target']:<18} {row['first_paint_ms']:>6.0f}ms to the welcome screen, "
+                  f"{row['panel_ms']:.0f}ms to the settings panel, budget "
+                  f"{row['budget_ms']:.0f}ms  {verdict}")
+            if not row['panel_after_paint']:
+                print("  settings panel was built before the welcome screen's first paint")
+        else:
+            print(f"{row['target']:<18} folder picked before the panel's idle callback: "
+                  f"{row['option_menus']} resolution menu(s), {row['sections_at_select']} -> "
+                  f"{row['sections']} sidebar widgets  {verdict}")
+    return results
+
+
+def bench_exit(args):
+    """Run a small cli.py folder batch repeatedly; a clean run writes nothing to stderr"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = os.path.join(tmp, "in")
+        os.makedirs(folder)
+        for i in range(args.images):
+            run_isolated(_write_source, os.path.join(folder, f"img{i:03d}.jpg"),
+                         (1200 + 40 * i, 800), "JPEG", i)
+        for schedule in args.schedules:
+            noisy = []
+            for run in range(args.runs):
+                command = [sys.executable, os.path.join(here, "cli.py"), folder,
+                           "-o", os.path.join(tmp, "out"), "--force", "--stats-interval", "0",
+                           "--schedule", schedule, "-j", str(args.jobs)]
+                done = subprocess.run(command, capture_output=True, text=True)
+                if done.returncode != 0 or done.stderr:
+                    noisy.append((run, done.returncode, done.stderr.strip()))
+            results.append({
+                'schedule': schedule, 'runs': args.runs, 'noisy': len(noisy),
+                'first_stderr': noisy[0][2] if noisy else "",
+                'passed': not noisy,
+            })
+
+    if args.json:
+        return results
+
+    print(f"{args.images} JPEGs, {args.jobs} workers, {args.runs} runs per schedule")
+    for row in results:
+        verdict = "PASS" if row['passed'] else "FAIL"
+        print(f"--schedule {row['schedule']:<8} {row['noisy']}/{row['runs']} runs failed or "
+              f"wrote to stderr  {verdict}")
+        if row['first_stderr']:
+            print("  " + row['first_stderr'].replace("\n", "\n  "))
+    return results
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="SSResizer benchmarks")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    decode = sub.add_parser("decode", help="Decode-time downscaling savings per preset")
+    decode.add_argument("--width", type=int, default=6000)
+    decode.add_argument("--height", type=int, default=4000)
+    decode.add_argument("--formats", nargs="+", default=["JPEG", "PNG"])
+    decode.add_argument("--repeat", type=int, default=3)
+    decode.set_defaults(func=bench_decode)
+
+    preview = sub.add_parser("preview", help="Crop slider update cost, proxy vs. full-res")
+    preview.add_argument("--megapixels", type=int, nargs="+", default=[12, 40])
+    preview.add_argument("--resolutions", nargs="+", default=["1080P", "4K"],
+                         choices=list(engine.RESOLUTIONS))
+    preview.add_argument("--canvas-width", type=int, default=1030)
+    preview.add_argument("--canvas-height", type=int, default=700)
+    preview.set_defaults(func=bench_preview)
+
+    estimate = sub.add_parser("estimate", help="Predicted vs. actual output size")
+    estimate.add_argument("--corpus", help="Folder of extra images to include")
+    estimate.add_argument("--formats", nargs="+", default=list(engine.OUTPUT_FORMATS),
+                          type=str.upper, choices=engine.OUTPUT_FORMATS)
+    estimate.add_argument("--resolutions", nargs="+", default=["1080P", "2K", "4K"],
+                          choices=list(engine.RESOLUTIONS))
+    estimate.add_argument("--fit", action="store_true",
+                          help="Print calibration factors fitted to this corpus")
+    estimate.set_defaults(func=bench_estimate)
+
+    fanout = sub.add_parser("fanout", help="Every preset from one decode vs. one pass each")
+    fanout.add_argument("--width", type=int, default=6000)
+    fanout.add_argument("--height", type=int, default=4000)
+    fanout.add_argument("--resolutions", nargs="+", default=list(engine.RESOLUTIONS),
+                        choices=list(engine.RESOLUTIONS))
+    fanout.add_argument("--both", action="store_true", help="Landscape and portrait")
+    fanout.add_argument("--format", default="JPEG", type=str.upper, choices=engine.OUTPUT_FORMATS)
+    fanout.add_argument("--repeat", type=int, default=3)
+    fanout.set_defaults(func=bench_fanout)
+
+    budget = sub.add_parser("budget", help="Max file size quality search cost")
+    budget.add_argument("--corpus", help="Folder of extra images to include")
+    budget.add_argument("--formats", nargs="+", default=["JPEG", "WEBP"], type=str.upper,
+                        choices=sorted(engine.SIZE_MODEL_SLOPE))
+    budget.add_argument("--resolution", default="1080P", choices=list(engine.RESOLUTIONS))
+    budget.add_argument("--budgets", nargs="+", type=int, default=[50, 150, 400],
+                        help="Max file sizes in KB")
+    budget.add_argument("--quality", type=int, default=90, help="Quality ceiling")
+    budget.add_argument("--check", action="store_true",
+                        help="Also find the best fitting quality by trying every one (slow)")
+    budget.set_defaults(func=bench_budget)
+
+    resample = sub.add_parser("resample", help="Resampling strategies: time and quality per preset")
+    resample.add_argument("--width", type=int, default=6000)
+    resample.add_argument("--height", type=int, default=4000)
+    resample.add_argument("--detail", type=int, default=2,
+                          help="Texture grain in pixels; fine grain shows aliasing")
+    resample.add_argument("--resolutions", nargs="+", default=list(engine.RESOLUTIONS),
+                          choices=list(engine.RESOLUTIONS))
+    resample.add_argument("--repeat", type=int, default=3)
+    resample.set_defaults(func=bench_resample)
+
+    suite = sub.add_parser("suite", help="Per-stage timings over a fixed synthetic corpus")
+    suite.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(SUITE_SIZES))
+    suite.add_argument("--resolutions", nargs="+", default=list(engine.RESOLUTIONS),
+                       choices=list(engine.RESOLUTIONS))
+    suite.add_argument("--formats", nargs="+", default=list(engine.OUTPUT_FORMATS),
+                       type=str.upper, choices=engine.OUTPUT_FORMATS)
+    suite.add_argument("--resample", default="best", choices=list(engine.RESAMPLING))
+    suite.add_argument("--encoder", default="balanced", choices=list(engine.ENCODER_PROFILES))
+    suite.add_argument("-j", "--jobs", type=int, default=1,
+                       help="Worker processes; 1 runs every job in this process")
+    suite.add_argument("--repeat", type=int, default=1)
+    suite.add_argument("--corpus-dir", help="Keep the generated corpus here and reuse it")
+    suite.add_argument("--output", help="Also write the JSON results to this file")
+    suite.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    suite.set_defaults(func=bench_suite)
+
+    serve = sub.add_parser("serve", help="Load-test the HTTP resize service on localhost")
+    serve.add_argument("--sizes", nargs="+", default=["small"], choices=list(SUITE_SIZES))
+    serve.add_argument("--requests", type=int, default=400)
+    serve.add_argument("--clients", type=int, default=8, help="Concurrent client threads")
+    serve.add_argument("--skew", type=float, default=4.0,
+                       help="Mean index of the requested variant; smaller is more repetitive")
+    serve.add_argument("--cache-mb", type=int, default=server.CACHE_MB)
+    serve.add_argument("-j", "--jobs", type=int, default=None, help="Concurrent renders")
+    serve.add_argument("--corpus-dir", help="Reuse the suite's corpus from this folder")
+    serve.set_defaults(func=bench_serve)
+
+    encoders = sub.add_parser("encoders", help="Encode time and size per encoder profile")
+    encoders.add_argument("--sizes", nargs="+", default=["medium"], choices=list(SUITE_SIZES))
+    encoders.add_argument("--resolutions", nargs="+", default=["1080P", "4K"],
+                          choices=list(engine.RESOLUTIONS))
+    encoders.add_argument("--formats", nargs="+", default=list(engine.OUTPUT_FORMATS),
+                          type=str.upper, choices=engine.OUTPUT_FORMATS)
+    encoders.add_argument("--quality", type=int, default=85)
+    encoders.add_argument("--repeat", type=int, default=1)
+    encoders.add_argument("--corpus-dir", help="Reuse the suite's corpus from this folder")
+    encoders.set_defaults(func=bench_encoders)
+
+    schedule = sub.add_parser("schedule", help="Largest-first vs. listed order: tail length "
+                                               "and ETA accuracy")
+    schedule.add_argument("--small", type=int, default=40)
+    schedule.add_argument("--medium", type=int, default=6)
+    schedule.add_argument("--huge", type=int, default=2)
+    schedule.add_argument("--resolution", default="1080P", choices=list(engine.RESOLUTIONS))
+    schedule.add_argument("--format", default="JPEG", type=str.upper,
+                          choices=engine.OUTPUT_FORMATS)
+    schedule.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    schedule.add_argument("--simulate", type=int, nargs="+", default=[4, 8],
+                          help="Worker counts to replay the measured job times on")
+    schedule.add_argument("--sample-interval", type=float, default=0.25,
+                          help="Seconds between ETA samples")
+    schedule.add_argument("--corpus-dir", help="Keep the sources in this folder between runs")
+    schedule.set_defaults(func=bench_schedule)
+
+    archive_parser = sub.add_parser("archive", help="ZIP in, ZIP out: streamed vs. extract, "
+                                                    "batch and re-zip")
+    archive_parser.add_argument("--images", type=int, nargs="+", default=[100, 400],
+                                help="Archive sizes to run, in images")
+    archive_parser.add_argument("--sources", type=int, default=8,
+                                help="Distinct photos the members cycle through")
+    archive_parser.add_argument("--source-size", type=int, nargs=2, default=[3000, 2000],
+                                metavar=("WIDTH", "HEIGHT"))
+    archive_parser.add_argument("--resolution", default="1080P", choices=list(engine.RESOLUTIONS))
+    archive_parser.add_argument("--format", default="JPEG", type=str.upper,
+                                choices=engine.OUTPUT_FORMATS)
+    archive_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    archive_parser.set_defaults(func=bench_archive)
+
+    startup = sub.add_parser("startup", help="Import time and modules per entry point "
+                                             "(exits 1 if over budget or importing too much)")
+    startup.add_argument("--modules", nargs="+", default=list(STARTUP_FORBIDDEN))
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--budget-ms", type=float, default=150,
+                         help="Import time budget per entry point")
+    startup.add_argument("--no-gui", dest="gui", action="store_false",
+                         help="Skip the GUI checks (they need a display, or xvfb-run on Linux)")
+    startup.add_argument("--paint-budget-ms", type=float, default=500)
+    startup.set_defaults(func=bench_startup)
+
+    exit_parser = sub.add_parser("exit", help="Small cli.py batches, repeated (exits 1 if any "
+                                              "fails or writes to stderr)")
+    exit_parser.add_argument("--runs", type=int, default=20)
+    exit_parser.add_argument("--images", type=int, default=24)
+    exit_parser.add_argument("--schedules", nargs="+", default=list(SCHEDULES), choices=SCHEDULES)
+    exit_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    exit_parser.set_defaults(func=bench_exit)
+
+    memory = sub.add_parser("memory", help="Peak RSS of a gigapixel input vs. the memory budget "
+                                           "(exits 1 if over)")
+    memory.add_argument("--width", type=int, default=24000)
+    memory.add_argument("--height", type=int, default=16000)
+    memory.add_argument("--formats", nargs="+", default=["PNG", "TIFF"], type=str.upper,
+                        choices=["PNG", "TIFF"])
+    memory.add_argument("--resolution", default="4K", choices=list(engine.RESOLUTIONS))
+    memory.add_argument("--budget", type=int, default=256, help="Memory budget in MB")
+    memory.set_defaults(func=bench_memory)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results = args.func(args)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    # Checks mark their rows; any failure fails the run
+    if isinstance(results, list) and any(row.get('passed') is False for row in results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
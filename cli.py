@@ -0,0 +1,376 @@
+"""Command-line entry point for SSResizer.
+
+Runs the same pipeline as the GUI without importing tkinter:
+
+    python cli.py photos/ --resolution 720P --format WEBP
+    python cli.py photos/ --presets all --both-orientations
+    python cli.py uploads/ --watch
+    python cli.py client.zip -o client-1080P.zip
+"""
+import argparse
+import os
+import re
+import sys
+import threading
+
+import engine
+import profiling
+from archive import (ArchiveWriter, FolderWriter, default_output, folder_members, is_archive,
+                     read_members)
+from batch import SCHEDULES, ArchiveRunner, BatchRunner, default_workers, format_duration
+from manifest import Manifest
+from outputstore import STORE_MB, OutputStore
+from scanner import scan_images
+from watcher import SETTLE_SECONDS, FolderWatcher, watch_stats
+
+
+SIZE_UNITS = {"": 1, "B": 1, "K": 1024, "KB": 1024, "M": 1024 ** 2, "MB": 1024 ** 2,
+              "G": 1024 ** 3, "GB": 1024 ** 3}
+
+
+def parse_size(text):
+    """Byte count from '150000', '200KB' or '1.5MB' (binary units, like format_size)"""
+    match = re.fullmatch(r"\s*([0-9]*\.?[0-9]+)\s*([A-Za-z]*)\s*", text)
+    if not match or match.group(2).upper() not in SIZE_UNITS:
+        raise argparse.ArgumentTypeError(f"invalid size: {text!r}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Crop and resize images to standard resolutions.")
+    parser.add_argument("input", help="Image file, folder of images, or ZIP or TAR archive")
+    parser.add_argument("-o", "--output",
+                        help="Output folder, or a .zip/.tar/.tar.gz... archive to write the "
+                             "outputs into (default: <input folder>/SSResized, or "
+                             "<archive>-SSResized.zip next to an input archive)")
+    parser.add_argument("-r", "--resolution", default="1080P",
+                        choices=list(engine.RESOLUTIONS))
+    parser.add_argument("--orientation", default="landscape",
+                        choices=engine.ORIENTATIONS)
+    parser.add_argument("-p", "--presets", nargs="+", metavar="RESOLUTION",
+                        choices=list(engine.RESOLUTIONS) + ["all"],
+                        help="Write several resolutions from one decode, each into its own "
+                             "subfolder (e.g. --presets 720P 1080P 4K, or --presets all)")
+    parser.add_argument("--both-orientations", action="store_true",
+                        help="With --presets, write landscape and portrait versions")
+    parser.add_argument("-f", "--format", dest="output_format", default="JPEG",
+                        type=str.upper, choices=engine.OUTPUT_FORMATS)
+    parser.add_argument("-q", "--quality", dest="jpeg_quality", type=int, default=85,
+                        help="JPEG and WEBP quality 1-100 (default: 85)")
+    parser.add_argument("-e", "--encoder", default="balanced", choices=list(engine.ENCODER_PROFILES),
+                        help="Encoder effort: fast skips JPEG optimization and uses the quickest "
+                             "PNG and WEBP compression, smallest adds progressive JPEG, PNG "
+                             "optimize and WEBP method 6 (default: balanced)")
+    parser.add_argument("--max-size", dest="max_bytes", type=parse_size,
+                        help="Largest output file, e.g. 200KB; quality is searched downwards "
+                             "from --quality to fit (JPEG and WEBP only)")
+    parser.add_argument("--trace", action="store_true",
+                        help="With --max-size, print each image's quality search to stderr")
+    parser.add_argument("--resample", default="best", choices=list(engine.RESAMPLING),
+                        help="Resampling strategy: best is a single LANCZOS pass, balanced "
+                             "box-reduces to within 2x of the target first, fast also finishes "
+                             "with BILINEAR (default: best)")
+    parser.add_argument("--crop-x", type=int, default=0,
+                        help="Horizontal crop position -100..100 (default: 0)")
+    parser.add_argument("--crop-y", type=int, default=0,
+                        help="Vertical crop position -100..100 (default: 0)")
+    parser.add_argument("-j", "--jobs", type=int, default=default_workers(),
+                        help="Worker processes (default: number of cores)")
+    parser.add_argument("-R", "--recursive", action="store_true",
+                        help="Include subfolders, mirroring them under the output folder "
+                             "(archives always include every member)")
+    parser.add_argument("--max-memory", dest="memory_budget", type=parse_size,
+                        help="Decode inputs bigger than this in bands, keeping about this "
+                             "much image data in memory per worker (default: "
+                             f"{engine.format_size(engine.MEMORY_BUDGET)}; TIFF, PNG and BMP)")
+    parser.add_argument("--profile", metavar="LOG", nargs="?", const="",
+                        help="Time each image's load, resize, encode and write and print a "
+                             "summary to stderr; with LOG, also write every image's timings "
+                             "there (CSV for a .csv name, JSON otherwise)")
+    parser.add_argument("--dedup", metavar="DIR", nargs="?", const="",
+                        help="Reuse outputs already rendered from identical source bytes with "
+                             "identical settings, in any folder or earlier run, by hardlink or "
+                             "copy; kept in DIR (default: ~/.cache/ssresizer/outputs)")
+    parser.add_argument("--dedup-max-size", type=parse_size, default=STORE_MB * 1024 ** 2,
+                        help=f"Size limit of the --dedup store (default: {STORE_MB}MB)")
+    parser.add_argument("-w", "--watch", action="store_true",
+                        help="Keep running and process images as they are added to the input "
+                             "folder, until interrupted")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="With --watch, seconds a file's size and time must stay unchanged "
+                             f"before it's processed (default: {SETTLE_SECONDS:g})")
+    parser.add_argument("--poll", action="store_true",
+                        help="With --watch, rescan the folder instead of using inotify "
+                             "(needed for network mounts written to by other machines)")
+    parser.add_argument("--schedule", choices=SCHEDULES, default="largest",
+                        help="Order a folder is processed in: costliest images first, judged "
+                             "from their headers, or as listed (default: largest)")
+    parser.add_argument("--stats-interval", type=float, default=10.0,
+                        help="Seconds between status lines on stderr: progress and ETA per "
+                             "cost class, or with --watch queue depth and throughput; 0 for "
+                             "none (default: 10)")
+    parser.add_argument("--force", action="store_true",
+                        help="Reprocess inputs the output folder's manifest marks as up to date")
+    return parser
+
+
+def settings_from_args(args):
+    return engine.ResizeSettings(
+        resolution=args.resolution,
+        orientation=args.orientation,
+        output_format=args.output_format,
+        jpeg_quality=max(1, min(100, args.jpeg_quality)),
+        crop_x=max(-100, min(100, args.crop_x)),
+        crop_y=max(-100, min(100, args.crop_y)),
+        max_bytes=args.max_bytes,
+        resample=args.resample,
+        encoder=args.encoder,
+    )
+
+
+def presets_from_args(args, settings):
+    """The fan-out presets asked for, or None for a single resolution"""
+    if not args.presets:
+        return None
+    resolutions = list(engine.RESOLUTIONS) if "all" in args.presets else args.presets
+    orientations = engine.ORIENTATIONS if args.both_orientations else None
+    return engine.fan_out(settings, dict.fromkeys(resolutions), orientations)
+
+
+def store_from_args(args):
+    if args.dedup is None:
+        return None
+    return OutputStore(args.dedup or None, args.dedup_max_size)
+
+
+def print_reuse(progress, store):
+    if store is None:
+        return
+    store.evict()
+    if progress.reused:
+        print(f"dedup: {progress.reused} outputs ({engine.format_size(progress.reused_bytes)}) "
+              f"reused, saving {progress.reused_cpu_seconds:.1f} CPU-seconds", file=sys.stderr)
+
+
+def collect_inputs(path, recursive=False):
+    """Return (input folder, iterable of file paths) for a file or folder argument.
+
+    Folders are scanned lazily, so processing starts before the scan ends.
+    """
+    if os.path.isdir(path):
+        return path, (os.path.join(path, f) for f in scan_images(path, recursive))
+    return os.path.dirname(os.path.abspath(path)), [path]
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        settings = settings_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    presets = presets_from_args(args, settings)
+
+    if not os.path.exists(args.input):
+        print(f"error: {args.input} does not exist", file=sys.stderr)
+        return 2
+
+    archive_output = args.output is not None and is_archive(args.output)
+    if args.watch:
+        if not os.path.isdir(args.input):
+            print(f"error: --watch needs a folder, not {args.input}", file=sys.stderr)
+            return 2
+        if archive_output:
+            print("error: --watch never finishes, so it can't write into an archive",
+                  file=sys.stderr)
+            return 2
+        return watch(args, presets or settings)
+
+    if archive_output or (os.path.isfile(args.input) and is_archive(args.input)):
+        if args.dedup is not None or args.profile is not None:
+            parser.error("--dedup and --profile work on folders, not archives")
+        return convert_archive(args, presets or settings)
+
+    folder, paths = collect_inputs(args.input, args.recursive)
+    output_folder = args.output or os.path.join(folder, engine.OUTPUT_FOLDER_NAME)
+    os.makedirs(output_folder, exist_ok=True)
+
+    runner = BatchRunner(paths, output_folder, presets or settings, workers=args.jobs,
+                         manifest=Manifest(output_folder), force=args.force, input_root=folder,
+                         memory_budget=args.memory_budget, profile=args.profile is not None,
+                         store=store_from_args(args), schedule=args.schedule)
+
+    stopped = report_progress(runner, args.stats_interval)
+    failures = 0
+    try:
+        for path, output_path, error, traces in runner.start(stream_results=True).iter_results():
+            if error is not None:
+                failures += 1
+                print(f"failed: {path}: {error}", file=sys.stderr)
+                continue
+            print("\n".join(output_path) if presets else output_path)
+            if args.trace:
+                print_traces(path, traces)
+    except KeyboardInterrupt:
+        print("cancelled; waiting for running images to finish", file=sys.stderr)
+        runner.cancel()
+        runner.wait()
+        return 130
+    finally:
+        stopped.set()
+    runner.wait()
+
+    progress = runner.progress()
+    print_searches(progress)
+    print_reuse(progress, runner.store)
+    if args.profile is not None and runner.profiles:
+        report = runner.report()
+        print("profile: " + "\nprofile: ".join(profiling.format_summary(report)), file=sys.stderr)
+        if args.profile:
+            profiling.write_log(args.profile, runner.profiles, report)
+    if runner.skipped:
+        print(f"{runner.skipped} already up to date", file=sys.stderr)
+    if progress.total + runner.skipped == 0:
+        print(f"error: no images found in {args.input}", file=sys.stderr)
+        return 1
+    return 1 if failures else 0
+
+
+def convert_archive(args, settings):
+    """Process the images of an archive, or write a folder's outputs into one; returns the
+    exit code"""
+    if os.path.isdir(args.input):
+        members = folder_members(args.input, args.recursive)
+    else:
+        try:
+            members = read_members(args.input)
+        except Exception as e:
+            # zipfile raises its own BadZipFile, not an OSError
+            print(f"error: can't read {args.input}: {e}", file=sys.stderr)
+            return 2
+    output_path = args.output or default_output(args.input)
+    if is_archive(output_path):
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        output = ArchiveWriter(output_path)
+    else:
+        output = FolderWriter(output_path)
+
+    runner = ArchiveRunner(members, output, settings, workers=args.jobs,
+                           memory_budget=args.memory_budget)
+    discarded = f"{output_path} discarded" if isinstance(output, ArchiveWriter) else None
+    stopped = report_progress(runner, args.stats_interval)
+    failures = 0
+    try:
+        for name, stored, error, traces in runner.start(stream_results=True).iter_results():
+            if error is not None:
+                failures += 1
+                print(f"failed: {name}: {error}", file=sys.stderr)
+                continue
+            print("\n".join(stored))
+            if args.trace:
+                print_traces(name, traces)
+    except KeyboardInterrupt:
+        print("cancelled; waiting for running images to finish", file=sys.stderr)
+        runner.cancel()
+        runner.wait()
+        if discarded:
+            print(discarded, file=sys.stderr)
+        return 130
+    finally:
+        stopped.set()
+    runner.wait()
+
+    progress = runner.progress()
+    print_searches(progress)
+    if runner.error is not None:
+        print(f"error: {runner.error}" + (f"; {discarded}" if discarded else ""), file=sys.stderr)
+        return 1
+    if progress.total == 0:
+        print(f"error: no images found in {args.input}", file=sys.stderr)
+        return 1
+    print(f"{progress.completed} images, {engine.format_size(runner.bytes_written)} written to "
+          f"{output_path}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+def report_progress(runner, interval):
+    """Print progress_line() every interval seconds until the returned Event is set"""
+    stopped = threading.Event()
+
+    def report():
+        while not stopped.wait(interval):
+            print(progress_line(runner.progress()), file=sys.stderr)
+
+    if interval > 0:
+        threading.Thread(target=report, daemon=True).start()
+    return stopped
+
+
+def print_traces(path, traces):
+    for trace in traces:
+        tried = ", ".join(f"q{q}{'' if m is None else f' m{m}'}="
+                          f"{engine.format_size(size)}" for q, m, size in trace.candidates)
+        print(f"search: {os.path.basename(path)}: {trace.summary()} [{tried}]", file=sys.stderr)
+
+
+def print_searches(progress):
+    if progress.searches:
+        print(f"max size search: {progress.encodes_per_search:.1f} encodes and "
+              f"{progress.search_seconds / progress.searches * 1000:.0f} ms per output",
+              file=sys.stderr)
+
+
+def progress_line(progress):
+    """Status line of a running batch: images done, rate, ETA and the cost classes"""
+    total = f"{progress.total}" if progress.total_known else f"{progress.total}+"
+    line = (f"{progress.finished_count}/{total} done, {progress.rate:.1f} img/s, "
+            f"ETA {format_duration(progress.eta)}")
+    if progress.cost_classes:
+        line += f" ({progress.classes_summary()})"
+    return line
+
+
+def watch(args, settings):
+    """Process images added to args.input until interrupted; returns the exit code"""
+    output_folder = args.output or os.path.join(args.input, engine.OUTPUT_FOLDER_NAME)
+    os.makedirs(output_folder, exist_ok=True)
+    watcher = FolderWatcher(args.input, args.recursive, settle=args.settle, poll=args.poll)
+    runner = BatchRunner(watcher, output_folder, settings, workers=args.jobs,
+                         manifest=Manifest(output_folder), force=args.force,
+                         input_root=args.input, memory_budget=args.memory_budget,
+                         store=store_from_args(args), schedule="input")
+    print(f"watching {args.input} ({watcher.backend}); Ctrl+C to stop", file=sys.stderr)
+
+    stopped = threading.Event()
+
+    def report_stats():
+        stats = None
+        while not stopped.wait(args.stats_interval):
+            stats = watch_stats(watcher, runner, stats)
+            print(stats.summary(), file=sys.stderr)
+
+    if args.stats_interval > 0:
+        threading.Thread(target=report_stats, daemon=True).start()
+    try:
+        for path, output_path, error, _ in runner.start(stream_results=True).iter_results():
+            if error is not None:
+                print(f"failed: {path}: {error}", file=sys.stderr)
+            else:
+                print("\n".join(output_path) if isinstance(output_path, list) else output_path,
+                      flush=True)
+    except KeyboardInterrupt:
+        # Queued images are dropped; the manifest picks them up on the next start
+        print("stopping; waiting for running images to finish", file=sys.stderr)
+        watcher.stop()
+        runner.cancel()
+        runner.wait()
+    finally:
+        stopped.set()
+    print(watch_stats(watcher, runner).summary(), file=sys.stderr)
+    print_reuse(runner.progress(), runner.store)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,671 @@
+"""Headless resize engine shared by the GUI and the command line.
+
+Nothing in here imports tkinter, so the same decode/crop/resize/encode
+pipeline runs on build servers and in cron jobs.
+"""
+import math
+import os
+import time
+from dataclasses import dataclass, field, replace
+from io import BytesIO
+from PIL import Image
+
+import tiled
+from profiling import stage
+
+# Resolution presets
+RESOLUTIONS = {
+    "480P": {"landscape": (854, 480), "portrait": (480, 854)},
+    "720P": {"landscape": (1280, 720), "portrait": (720, 1280)},
+    "1080P": {"landscape": (1920, 1080), "portrait": (1080, 1920)},
+    "2K": {"landscape": (2560, 1440), "portrait": (1440, 2560)},
+    "4K": {"landscape": (3840, 2160), "portrait": (2160, 3840)}
+}
+
+ORIENTATIONS = ("landscape", "portrait")
+OUTPUT_FORMATS = ("JPEG", "PNG", "WEBP")
+OUTPUT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+# Input files picked up when scanning a folder
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp')
+
+OUTPUT_FOLDER_NAME = "SSResized"
+
+# JPEG DCT scaling supports 1/2, 1/4 and 1/8
+MAX_DECODE_SCALE = 8
+
+# Inputs that would decode to more than this are read in bands (see tiled.py)
+MEMORY_BUDGET = 512 * 1024 * 1024
+
+# Resampling strategies: (finishing filter, reducing_gap). With a gap, the
+# source is first box-reduced by an integer factor down to no less than gap
+# times the target size, and only that is resampled with the filter.
+# "best" is a single LANCZOS pass, which is what exports default to
+RESAMPLING = {
+    "fast": (Image.Resampling.BILINEAR, 1.0),
+    "balanced": (Image.Resampling.LANCZOS, 2.0),
+    "best": (Image.Resampling.LANCZOS, None),
+}
+
+# On-screen previews trade a little sharpness for speed, and preview
+# proxies are only ever seen scaled to the canvas
+PREVIEW_STRATEGY = "fast"
+PROXY_STRATEGY = "balanced"
+
+# Modes Image.reduce() can box-filter
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'CMYK', 'YCbCr', 'I', 'F')
+
+# Max file size mode: lowest quality tried, and the most encodes spent per image
+MIN_SEARCH_QUALITY = 5
+MAX_SEARCH_ENCODES = 7
+
+# Log output size is roughly linear in log quantizer scale for JPEG and in
+# quality for WEBP; these prior slopes only shape the first guess, after
+# which the search fits the slope to the measured sizes
+SIZE_MODEL_SLOPE = {"JPEG": 0.75, "WEBP": 0.025}
+
+# WEBP effort: the search runs at the encoder profile's method (this one
+# for "balanced"), then tries the slowest, smallest one on the first
+# quality that didn't fit
+WEBP_METHOD = 4
+WEBP_SMALLEST_METHOD = 6
+
+# Encoder effort per output format, from quickest to smallest files. Quality
+# always comes from the settings; measured with `python benchmark.py encoders`
+ENCODER_PROFILES = {
+    "fast": {"JPEG": {"optimize": False}, "PNG": {"compress_level": 1},
+             "WEBP": {"method": 0}},
+    "balanced": {"JPEG": {"optimize": True}, "PNG": {"compress_level": 6},
+                 "WEBP": {"method": WEBP_METHOD}},
+    "smallest": {"JPEG": {"optimize": True, "progressive": True}, "PNG": {"optimize": True},
+                 "WEBP": {"method": WEBP_SMALLEST_METHOD}},
+}
+
+
+@dataclass(frozen=True)
+class ResizeSettings:
+    """Everything that decides what an output file looks like"""
+    resolution: str = "1080P"
+    orientation: str = "landscape"
+    output_format: str = "JPEG"
+    # JPEG and WEBP quality
+    jpeg_quality: int = 85
+    crop_x: int = 0
+    crop_y: int = 0
+    # Largest output in bytes; quality is searched downwards from jpeg_quality to fit
+    max_bytes: int = None
+    # Key of RESAMPLING used for the output; None is "best"
+    resample: str = None
+    # Key of ENCODER_PROFILES; None is "balanced"
+    encoder: str = None
+
+    def __post_init__(self):
+        if self.resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {self.resolution}")
+        if self.orientation not in ORIENTATIONS:
+            raise ValueError(f"Unknown orientation: {self.orientation}")
+        if self.output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {self.output_format}")
+        if self.max_bytes is not None:
+            if self.output_format not in SIZE_MODEL_SLOPE:
+                raise ValueError(f"A max file size needs a lossy format, not {self.output_format}")
+            if self.max_bytes <= 0:
+                raise ValueError(f"Max file size must be positive: {self.max_bytes}")
+        if self.resample is not None and self.resample not in RESAMPLING:
+            raise ValueError(f"Unknown resampling strategy: {self.resample}")
+        if self.resample == "best":
+            # The default; stored as None so manifest hashes don't change with it
+            object.__setattr__(self, 'resample', None)
+        if self.encoder is not None and self.encoder not in ENCODER_PROFILES:
+            raise ValueError(f"Unknown encoder profile: {self.encoder}")
+        if self.encoder == "balanced":
+            object.__setattr__(self, 'encoder', None)
+
+    @property
+    def target_size(self):
+        return RESOLUTIONS[self.resolution][self.orientation]
+
+    @property
+    def strategy(self):
+        return self.resample or "best"
+
+    @property
+    def encoder_profile(self):
+        return self.encoder or "balanced"
+
+    def save_options(self, quality=None):
+        """Image.save() keyword arguments for the output format and encoder profile"""
+        options = dict(ENCODER_PROFILES[self.encoder_profile][self.output_format])
+        if self.output_format != "PNG":
+            options['quality'] = self.jpeg_quality if quality is None else quality
+        return options
+
+    def with_changes(self, **changes):
+        return replace(self, **changes)
+
+
+def list_images(folder):
+    """Return the sorted image file names directly inside folder"""
+    files = [f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS)]
+    files.sort()
+    return files
+
+
+def output_filename(source_name, settings):
+    original_name = os.path.splitext(os.path.basename(source_name))[0]
+    return original_name + OUTPUT_EXTENSIONS[settings.output_format]
+
+
+def crop_box(image_size, target_size, crop_x=0, crop_y=0):
+    """Crop rectangle (left, top, right, bottom) matching the target aspect ratio"""
+    target_width, target_height = target_size
+    target_ratio = target_width / target_height
+
+    img_width, img_height = image_size
+    img_ratio = img_width / img_height
+
+    if img_ratio > target_ratio:
+        # Image is wider, crop width
+        new_width = int(img_height * target_ratio)
+        new_height = img_height
+    else:
+        # Image is taller, crop height
+        new_width = img_width
+        new_height = int(img_width / target_ratio)
+
+    # Apply crop offset (percentage of available crop space)
+    x_offset = int((img_width - new_width) / 2 * (1 + crop_x / 100))
+    y_offset = int((img_height - new_height) / 2 * (1 + crop_y / 100))
+
+    # Ensure crop stays within bounds
+    x_offset = max(0, min(x_offset, img_width - new_width))
+    y_offset = max(0, min(y_offset, img_height - new_height))
+
+    return (x_offset, y_offset, x_offset + new_width, y_offset + new_height)
+
+
+def decode_scale(image_size, settings):
+    """Largest power-of-two reduction that keeps the crop at or above the target size"""
+    left, top, right, bottom = crop_box(image_size, settings.target_size,
+                                        settings.crop_x, settings.crop_y)
+    target_width, target_height = settings.target_size
+    scale = 1
+    while (scale < MAX_DECODE_SCALE
+           and (right - left) // (scale * 2) >= target_width
+           and (bottom - top) // (scale * 2) >= target_height):
+        scale *= 2
+    return scale
+
+
+def max_scale(image_size, settings):
+    """Largest integer reduction that keeps the crop at or above the target size"""
+    left, top, right, bottom = crop_box(image_size, settings.target_size,
+                                        settings.crop_x, settings.crop_y)
+    target_width, target_height = settings.target_size
+    return max(1, min((right - left) // target_width, (bottom - top) // target_height))
+
+
+def open_image(path, settings=None, memory_budget=None):
+    """Open path, decoding at a reduced scale when the settings' target allows it.
+
+    JPEGs use DCT scaling via draft() so the skipped pixels are never
+    decoded; other formats are box-reduced right after decoding. Returns
+    (image, original_size) since the image may be smaller than the file.
+
+    Inputs bigger than memory_budget bytes decoded (MEMORY_BUDGET by
+    default) are read in bands by tiled.read_region() where the format
+    allows, reduced by any integer max_scale().
+    """
+    banded = _open_banded(path, [settings] if settings else [], memory_budget)
+    if banded is not None:
+        return banded
+    image = Image.open(path)
+    original_size = image.size
+    if settings is None:
+        return image, original_size
+    return _decode_reduced(image, decode_scale(original_size, settings)), original_size
+
+
+def _oversized(path, memory_budget):
+    """(size, decoded bytes) of path if it's over the budget and could be banded, else None"""
+    if hasattr(path, 'read'):
+        return None  # File objects are decoded whole
+    info = tiled.probe(path)
+    if info is None or info[1] <= (memory_budget or MEMORY_BUDGET):
+        return None
+    return info
+
+
+def _open_banded(path, presets, memory_budget):
+    """(image, original_size) decoded band by band, or None if path fits the budget or can't be"""
+    info = _oversized(path, memory_budget)
+    if info is None:
+        return None
+    original_size, decoded = info
+    budget = memory_budget or MEMORY_BUDGET
+    if presets:
+        scale = min(max_scale(original_size, settings) for settings in presets)
+    else:
+        # No target to keep: just make the whole image fit the budget
+        scale = math.ceil(math.sqrt(decoded / budget))
+    try:
+        return tiled.read_region(path, (0, 0) + original_size, scale, budget), original_size
+    except tiled.Unsupported:
+        return None
+
+
+def render_banded(path, settings, memory_budget=None, profile=None):
+    """Render an oversized file reading only its crop, or None if path fits the budget or can't be.
+
+    The crop is decoded in bands and reduced by max_scale(); the final
+    resize maps the crop exactly, including a partly covered last column
+    and row of the reduction. The read and the resize are timed into
+    profile if one is given (see profiling.Profile).
+    """
+    info = _oversized(path, memory_budget)
+    if info is None:
+        return None
+    scale = max_scale(info[0], settings)
+    box = crop_box(info[0], settings.target_size, settings.crop_x, settings.crop_y)
+    try:
+        with stage(profile, "load"):
+            region = tiled.read_region(path, box, scale, memory_budget or MEMORY_BUDGET)
+    except tiled.Unsupported:
+        return None
+    with region, stage(profile, "resize"):
+        return resample(region, settings.target_size, settings.strategy,
+                        box=(0, 0, (box[2] - box[0]) / scale, (box[3] - box[1]) / scale))
+
+
+def render_source(source, settings, memory_budget=None):
+    """Decode, crop and resize a path or file object to the settings' target"""
+    rendered = render_banded(source, settings, memory_budget)
+    if rendered is not None:
+        return rendered
+    image, _ = open_image(source, settings, memory_budget)
+    with image:
+        return render(image, settings)
+
+
+def _decode_reduced(image, scale):
+    """Decode a freshly opened image at 1/scale of its size where the format allows"""
+    if scale == 1:
+        return image
+
+    if image.format == 'JPEG':
+        width, height = image.size
+        image.draft(image.mode, (width // scale, height // scale))
+        return image
+
+    if image.mode not in REDUCIBLE_MODES:
+        return image
+
+    image.load()
+    reduced = image.reduce(scale)
+    image.close()
+    return reduced
+
+
+def get_cropped_image(image, settings):
+    return image.crop(crop_box(image.size, settings.target_size,
+                               settings.crop_x, settings.crop_y))
+
+
+def resample(image, size, strategy="best", box=None):
+    """Resize image (or just box of it) to size with one of the RESAMPLING strategies"""
+    resample_filter, reducing_gap = RESAMPLING[strategy]
+    return image.resize(size, resample_filter, box=box, reducing_gap=reducing_gap)
+
+
+def render(image, settings):
+    """Crop and resize an opened image to the target resolution"""
+    # Resampling straight from the crop box saves copying the crop first
+    box = crop_box(image.size, settings.target_size, settings.crop_x, settings.crop_y)
+    return resample(image, settings.target_size, settings.strategy, box)
+
+
+def fan_out(settings, resolutions, orientations=None):
+    """One settings per resolution/orientation pair, largest target first"""
+    orientations = orientations or (settings.orientation,)
+    presets = [settings.with_changes(resolution=resolution, orientation=orientation)
+               for orientation in orientations for resolution in resolutions]
+    presets.sort(key=lambda s: s.target_size[0] * s.target_size[1], reverse=True)
+    return tuple(presets)
+
+
+def preset_folder(settings):
+    """Subfolder of the output folder a fan-out preset is written to"""
+    return f"{settings.resolution}-{settings.orientation}"
+
+
+def open_image_for_presets(path, presets, memory_budget=None):
+    """Open path once, decoded at the smallest scale any of the presets needs"""
+    banded = _open_banded(path, presets, memory_budget)
+    if banded is not None:
+        return banded
+    image = Image.open(path)
+    original_size = image.size
+    scale = min(decode_scale(original_size, settings) for settings in presets)
+    return _decode_reduced(image, scale), original_size
+
+
+def render_presets(image, presets):
+    """Render every preset from one decoded image, in the order given.
+
+    Presets sharing an orientation and crop position are downscaled in a
+    cascade: the largest is rendered from the image, and each smaller one
+    from the previous output instead of the full crop. Each step resamples
+    exactly its own crop box (mapped into the previous output), so presets
+    whose ratio is a pixel off 16:9 still line up with a direct render.
+    """
+    groups = {}
+    for settings in presets:
+        groups.setdefault((settings.orientation, settings.crop_x, settings.crop_y), []).append(settings)
+
+    rendered = {}
+    for group in groups.values():
+        group.sort(key=lambda s: s.target_size[0], reverse=True)
+        source, source_box = image, (0, 0) + image.size
+        for settings in group:
+            box = crop_box(image.size, settings.target_size, settings.crop_x, settings.crop_y)
+            output = resample(source, settings.target_size, settings.strategy,
+                              _map_box(box, source_box, source.size))
+            rendered[settings] = output
+            # Only cascade from real downscales; an upscaled output would blur the next one
+            if output.width < box[2] - box[0]:
+                source, source_box = output, box
+    return [rendered[settings] for settings in presets]
+
+
+def _map_box(box, source_box, source_size):
+    """box in image coordinates, as float coordinates inside a resized copy of source_box"""
+    scale_x = source_size[0] / (source_box[2] - source_box[0])
+    scale_y = source_size[1] / (source_box[3] - source_box[1])
+    left = max(0.0, (box[0] - source_box[0]) * scale_x)
+    top = max(0.0, (box[1] - source_box[1]) * scale_y)
+    right = min(float(source_size[0]), (box[2] - source_box[0]) * scale_x)
+    bottom = min(float(source_size[1]), (box[3] - source_box[1]) * scale_y)
+    return (left, top, right, bottom)
+
+
+def make_proxy(image, bounds):
+    """Downscaled copy of image that still covers bounds in both directions.
+
+    Any target-ratio crop of the proxy spans its full width or full height,
+    so a proxy covering the canvas never needs upscaling to fill it.
+    """
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or image.mode == 'P' else 'RGB')
+    width, height = image.size
+    scale = max(bounds[0] / width, bounds[1] / height)
+    if scale >= 1:
+        return image
+    size = (max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale)))
+    return resample(image, size, PROXY_STRATEGY)
+
+
+def render_preview(proxy, settings, display_size, strategy=PREVIEW_STRATEGY):
+    """Crop a proxy with the settings and scale it to the on-screen size"""
+    box = crop_box(proxy.size, settings.target_size, settings.crop_x, settings.crop_y)
+    return resample(proxy, display_size, strategy, box)
+
+
+def prepare_for_format(image, output_format):
+    """Convert modes the output format can't store"""
+    if output_format == "JPEG" and image.mode not in ('RGB', 'L', 'CMYK'):
+        # JPEG doesn't support transparency, flatten onto white
+        rgb_image = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        if image.mode in ('RGBA', 'LA'):
+            rgb_image.paste(image, mask=image.split()[-1])
+        else:
+            rgb_image.paste(image.convert('RGB'))
+        return rgb_image
+    return image
+
+
+def encode(image, fp, settings):
+    """Write image to a path or file object with the settings' format options.
+
+    With settings.max_bytes set this runs fit_to_budget() and returns its
+    SearchTrace; otherwise it returns None.
+    """
+    image = prepare_for_format(image, settings.output_format)
+    if settings.max_bytes is not None:
+        data, trace = fit_to_budget(image, settings)
+        if hasattr(fp, 'write'):
+            fp.write(data)
+        else:
+            with open(fp, 'wb') as f:
+                f.write(data)
+        return trace
+    image.save(fp, format=settings.output_format, **settings.save_options())
+    return None
+
+
+@dataclass
+class SearchTrace:
+    """How fit_to_budget() got to its output: every candidate and the time spent"""
+    max_bytes: int
+    quality: int = None
+    method: int = None
+    size: int = None
+    # (quality, method, bytes) in the order they were encoded
+    candidates: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def encodes(self):
+        return len(self.candidates)
+
+    def summary(self):
+        method = f" m{self.method}" if self.method is not None else ""
+        return (f"q{self.quality}{method}, {format_size(self.size)} of {format_size(self.max_bytes)} "
+                f"in {self.encodes} encodes, {self.elapsed * 1000:.0f} ms")
+
+
+def _model_x(output_format, quality):
+    """Quality on the axis log size is roughly linear in"""
+    if output_format == "JPEG":
+        # libjpeg's quality-to-quantization-table scaling, in percent
+        scale = 5000 / quality if quality < 50 else 200 - 2 * quality
+        return -math.log(max(scale, 1))
+    return float(quality)
+
+
+def _model_quality(output_format, x):
+    if output_format == "JPEG":
+        scale = math.exp(-x)
+        return 5000 / scale if scale > 100 else (200 - scale) / 2
+    return x
+
+
+def _encode_candidate(image, settings, quality, method):
+    buffer = BytesIO()
+    options = settings.save_options(quality)
+    if method is not None:
+        options['method'] = method
+    image.save(buffer, format=settings.output_format, **options)
+    return buffer.getvalue()
+
+
+def _guess_quality(output_format, fit, miss, max_bytes):
+    """Quality expected to land on max_bytes, given the fitting and missing candidates.
+
+    With both measured the model's slope is fitted between them; with
+    only a miss the format's prior slope is used.
+    """
+    slope = SIZE_MODEL_SLOPE[output_format]
+    x_miss = _model_x(output_format, miss[0])
+    log_miss = math.log(miss[1])
+    if fit is not None:
+        run = x_miss - _model_x(output_format, fit[0])
+        if run > 0 and fit[1] < miss[1]:
+            slope = (log_miss - math.log(fit[1])) / run
+    x = x_miss - (log_miss - math.log(max_bytes)) / slope
+    return int(math.floor(_model_quality(output_format, x)))
+
+
+def fit_to_budget(image, settings):
+    """Encode image at the highest quality whose output fits settings.max_bytes.
+
+    image is the already rendered output, so every candidate reuses the
+    same resized pixels. The first candidate is the settings' own quality;
+    if that's too big, a size model guesses the quality that fits, and
+    later guesses are fitted to the measured sizes while a [fits, too big]
+    bracket narrows. At most MAX_SEARCH_ENCODES encodes are spent. Returns
+    (encoded bytes, SearchTrace); raises ValueError if nothing fits.
+    """
+    start = time.perf_counter()
+    max_bytes = settings.max_bytes
+    webp = settings.output_format == "WEBP"
+    method = settings.save_options()['method'] if webp else None
+    trace = SearchTrace(max_bytes=max_bytes)
+    best = None
+    fit = None  # (quality, bytes) of the best candidate that fits
+    miss = None  # (quality, bytes) of the lowest candidate that doesn't
+    quality = max(MIN_SEARCH_QUALITY, min(100, settings.jpeg_quality))
+
+    while trace.encodes < MAX_SEARCH_ENCODES:
+        data = _encode_candidate(image, settings, quality, method)
+        trace.candidates.append((quality, method, len(data)))
+        if len(data) <= max_bytes:
+            fit, best = (quality, len(data)), (data, quality, method)
+        else:
+            miss = (quality, len(data))
+
+        if miss is None:
+            break  # The ceiling quality fits
+        low = fit[0] + 1 if fit else MIN_SEARCH_QUALITY
+        high = miss[0] - 1
+        if low > high:
+            break  # Neighbouring qualities bracket the budget
+
+        if fit is None:
+            # Aim a little under the budget so a fitting candidate turns up
+            # early, and well under it if this is the last chance
+            last = trace.encodes == MAX_SEARCH_ENCODES - 1
+            aim = max_bytes * (0.85 if last else 0.97)
+            quality = _guess_quality(settings.output_format, fit, miss, aim)
+        else:
+            quality = _guess_quality(settings.output_format, fit, miss, max_bytes)
+        quality = max(low, min(high, quality))
+
+    # Slower WEBP compression may squeeze in the first quality that missed
+    if (webp and method < WEBP_SMALLEST_METHOD and miss is not None
+            and trace.encodes < MAX_SEARCH_ENCODES and (fit is None or miss[0] == fit[0] + 1)):
+        data = _encode_candidate(image, settings, miss[0], WEBP_SMALLEST_METHOD)
+        trace.candidates.append((miss[0], WEBP_SMALLEST_METHOD, len(data)))
+        if len(data) <= max_bytes:
+            best = (data, miss[0], WEBP_SMALLEST_METHOD)
+
+    trace.elapsed = time.perf_counter() - start
+    if best is None:
+        smallest = min(size for _, _, size in trace.candidates)
+        raise ValueError(f"Can't fit {format_size(max_bytes)}: the smallest of "
+                         f"{trace.encodes} tries was {format_size(smallest)}")
+    data, trace.quality, trace.method = best
+    trace.size = len(data)
+    return data, trace
+
+
+def encoded_size(image, settings):
+    """Bytes the rendered output would take, by encoding it into memory"""
+    buffer = BytesIO()
+    encode(render(image, settings), buffer, settings)
+    return buffer.tell()
+
+
+def format_size(num_bytes):
+    """Human-readable file size"""
+    if num_bytes < 1024:
+        return f"{num_bytes:.0f} B"
+    elif num_bytes < 1024 * 1024:
+        return f"{num_bytes / 1024:.1f} KB"
+    else:
+        return f"{num_bytes / (1024 * 1024):.2f} MB"
+
+
+def export(image, output_path, settings, traces=None, profile=None):
+    """Render an already opened image and save it to output_path.
+
+    With settings.max_bytes set, the quality search's SearchTrace is
+    appended to traces if a list is given. Stage timings go to profile if
+    one is given.
+    """
+    with stage(profile, "resize"):
+        rendered = render(image, settings)
+    return _save(rendered, output_path, settings, traces, profile)
+
+
+def _save(rendered, output_path, settings, traces, profile=None):
+    # Write under a unique name and rename, so the output is never half there
+    # and an existing output is replaced rather than rewritten: hardlinks to
+    # it (see outputstore) keep their contents
+    tmp_path = f"{output_path}.{os.urandom(8).hex()}.tmp"
+    try:
+        if profile is None:
+            trace = encode(rendered, tmp_path, settings)
+        else:
+            # Encode into memory first so encoding and disk writes are timed apart
+            buffer = BytesIO()
+            with profile.stage("encode"):
+                trace = encode(rendered, buffer, settings)
+            with profile.stage("write"), open(tmp_path, 'wb') as f:
+                f.write(buffer.getbuffer())
+            profile.bytes_written += buffer.tell()
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if trace is not None and traces is not None:
+        traces.append(trace)
+    return output_path
+
+
+def process(path, output_folder, settings, traces=None, memory_budget=None, profile=None):
+    """Decode, crop, resize and encode one file; returns the output path"""
+    os.makedirs(output_folder, exist_ok=True)
+    output_path = os.path.join(output_folder, output_filename(path, settings))
+    rendered = render_banded(path, settings, memory_budget, profile)
+    if rendered is not None:
+        return _save(rendered, output_path, settings, traces, profile)
+    # Decoding here rather than lazily in render() keeps it in the load stage
+    with stage(profile, "load"):
+        image, _ = open_image(path, settings, memory_budget)
+        image.load()
+    with image:
+        return export(image, output_path, settings, traces, profile)
+
+
+def preset_output_path(path, output_folder, settings, relative_dir=""):
+    return os.path.join(output_folder, preset_folder(settings), relative_dir,
+                        output_filename(path, settings))
+
+
+def export_presets(image, path, output_folder, presets, relative_dir="", traces=None,
+                   profile=None):
+    """Render an opened image at every preset and save each into its preset subfolder"""
+    output_paths = []
+    with stage(profile, "resize"):
+        renders = render_presets(image, presets)
+    for settings, rendered in zip(presets, renders):
+        output_path = preset_output_path(path, output_folder, settings, relative_dir)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        output_paths.append(_save(rendered, output_path, settings, traces, profile))
+    return output_paths
+
+
+def process_presets(path, output_folder, presets, relative_dir="", traces=None,
+                    memory_budget=None, profile=None):
+    """Decode and crop one file once and write every preset; returns the output paths"""
+    with stage(profile, "load"):
+        image, _ = open_image_for_presets(path, presets, memory_budget)
+        image.load()
+    with image:
+        return export_presets(image, path, output_folder, presets, relative_dir, traces,
+                              profile)
@@ -0,0 +1,163 @@
+"""Background output-size estimation.
+
+Estimates run on a single worker thread. Every submit() makes earlier
+requests stale: queued ones are cancelled and a running one has its
+result ignored, so the caller only ever sees the newest settings.
+
+By default the size is predicted from a grid of output-resolution tiles
+instead of encoding the whole output; pass exact=True to encode it all.
+"""
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from PIL import Image
+
+import engine
+
+# Output pixels sampled per prediction: a SAMPLE_GRID x SAMPLE_GRID grid
+# of SAMPLE_TILE-sized tiles rendered at the target resolution
+SAMPLE_TILE = 128
+SAMPLE_GRID = 4
+
+# Real encoded size / tile extrapolation, per format. Refit with
+# `python benchmark.py estimate --fit` when encoder settings change.
+CALIBRATION = {"JPEG": 0.985, "PNG": 0.958, "WEBP": 0.918}
+
+
+def _encode_len(image, settings):
+    buffer = BytesIO()
+    engine.encode(image, buffer, settings)
+    return buffer.tell()
+
+
+@lru_cache(maxsize=64)
+def _container_overhead(settings, mode):
+    """Bytes a tiny flat image costs, i.e. headers and tables paid once per file"""
+    return _encode_len(Image.new(mode, (8, 8)), settings)
+
+
+def sample_tiles(image, settings):
+    """Tiles of the rendered output, resampled straight from the source crop"""
+    target_width, target_height = settings.target_size
+    left, top, right, bottom = engine.crop_box(image.size, settings.target_size,
+                                               settings.crop_x, settings.crop_y)
+    scale_x = (right - left) / target_width
+    scale_y = (bottom - top) / target_height
+    cell_width = target_width / SAMPLE_GRID
+    cell_height = target_height / SAMPLE_GRID
+    # LANCZOS reads 3 output pixels either side
+    margin = 3 * max(scale_x, scale_y, 1)
+
+    for row in range(SAMPLE_GRID):
+        for col in range(SAMPLE_GRID):
+            # Tile centred in its grid cell, in output coordinates
+            x = int(cell_width * col + (cell_width - SAMPLE_TILE) / 2)
+            y = int(cell_height * row + (cell_height - SAMPLE_TILE) / 2)
+            box = (left + x * scale_x, top + y * scale_y,
+                   left + (x + SAMPLE_TILE) * scale_x, top + (y + SAMPLE_TILE) * scale_y)
+
+            # Crop first (with room for the filter) so modes Pillow converts
+            # before resizing, like RGBA, only convert the tile's region
+            region = (max(0, math.floor(box[0] - margin)), max(0, math.floor(box[1] - margin)),
+                      min(image.width, math.ceil(box[2] + margin)),
+                      min(image.height, math.ceil(box[3] + margin)))
+            local_box = (box[0] - region[0], box[1] - region[1],
+                         box[2] - region[0], box[3] - region[1])
+            yield engine.resample(image.crop(region), (SAMPLE_TILE, SAMPLE_TILE),
+                                  settings.strategy, local_box)
+
+
+def predict_size(image, settings):
+    """Predicted output bytes, extrapolated from encoding a grid of sample tiles"""
+    target_width, target_height = settings.target_size
+    sampled_pixels = SAMPLE_GRID * SAMPLE_GRID * SAMPLE_TILE * SAMPLE_TILE
+
+    # The size a max file size search settles on depends on the whole
+    # output, and the search is bounded anyway, so run it
+    if settings.max_bytes is not None:
+        return engine.encoded_size(image, settings)
+
+    # Small outputs aren't worth sampling
+    if (target_width * target_height <= 2 * sampled_pixels
+            or min(settings.target_size) < SAMPLE_TILE * SAMPLE_GRID):
+        return engine.encoded_size(image, settings)
+
+    overhead, payload = extrapolate_payload(image, settings)
+    return int(overhead + CALIBRATION[settings.output_format] * payload)
+
+
+def extrapolate_payload(image, settings):
+    """(per-file overhead, uncalibrated payload bytes for the full output)"""
+    target_width, target_height = settings.target_size
+    sampled_pixels = SAMPLE_GRID * SAMPLE_GRID * SAMPLE_TILE * SAMPLE_TILE
+
+    tiles = list(sample_tiles(image, settings))
+    overhead = _container_overhead(settings, engine.prepare_for_format(tiles[0], settings.output_format).mode)
+    payload = sum(max(0, _encode_len(tile, settings) - overhead) for tile in tiles)
+    return overhead, payload * target_width * target_height / sampled_pixels
+
+
+class SizeEstimator:
+    def __init__(self, exact=False, cache_size=256):
+        self.exact = exact
+        self.cache_size = cache_size
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="size-estimate")
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._pending = None
+        self._cache = OrderedDict()
+
+    def submit(self, image, settings, key=None):
+        """Queue an estimate for image rendered with settings; returns a Future of bytes.
+
+        key identifies the image (e.g. its path) so repeated requests for
+        the same image and settings are answered from the cache.
+        """
+        cache_key = (key, settings, self.exact) if key is not None else None
+        with self._lock:
+            self._cancel_locked()
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                future = Future()
+                future.set_result(self._cache[cache_key])
+                return future
+
+        # Finish lazy decoding here so the worker thread only reads pixels
+        image.load()
+        with self._lock:
+            generation = self._generation
+            self._pending = self._executor.submit(self._run, generation, image, settings, cache_key)
+            return self._pending
+
+    def cancel(self):
+        with self._lock:
+            self._cancel_locked()
+
+    def _cancel_locked(self):
+        self._generation += 1
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+
+    def _run(self, generation, image, settings, cache_key):
+        if generation != self._generation:
+            raise CancelledError()
+        if self.exact:
+            size = engine.encoded_size(image, settings)
+        else:
+            size = predict_size(image, settings)
+
+        if cache_key is not None:
+            with self._lock:
+                self._cache[cache_key] = size
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return size
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
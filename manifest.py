@@ -0,0 +1,111 @@
+"""Job manifest for resumable, incremental batch runs.
+
+The manifest lives in the output folder as JSON lines, one per finished
+image: the source fingerprint (size and mtime), a hash of the settings
+and the output path (or paths, for a multi-preset fan-out). Lines are appended and flushed as each image
+finishes, so an interrupted run loses at most the images in flight, and
+a rerun skips every input whose source, settings and output are unchanged.
+"""
+import hashlib
+import json
+import os
+import threading
+from dataclasses import asdict
+
+MANIFEST_NAME = ".ssresizer-manifest.jsonl"
+
+
+def settings_hash(settings):
+    """Short stable hash of everything in settings (or a fan-out's presets) that affects the output"""
+    if isinstance(settings, (list, tuple)):
+        payload = json.dumps([_settings_fields(preset) for preset in settings], sort_keys=True)
+    else:
+        payload = json.dumps(_settings_fields(settings), sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _settings_fields(settings):
+    # Unset optional fields are left out, so adding one doesn't change old hashes
+    return {name: value for name, value in asdict(settings).items() if value is not None}
+
+
+def fingerprint(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class Manifest:
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.path = os.path.join(output_folder, MANIFEST_NAME)
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._lines = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Torn last line from a crash
+                    self._entries[entry["source"]] = entry
+                    self._lines += 1
+        except FileNotFoundError:
+            return
+        # Reruns append a line per image; compact once the file is mostly stale
+        if self._lines > 2 * len(self._entries) + 100:
+            self.compact()
+
+    def is_current(self, path, settings):
+        """True if path was already processed with settings and its output still exists"""
+        entry = self._entries.get(os.path.abspath(path))
+        if entry is None or entry["settings"] != settings_hash(settings):
+            return False
+        try:
+            if entry["fingerprint"] != fingerprint(path):
+                return False
+        except OSError:
+            return False
+        outputs = entry["output"]
+        if isinstance(outputs, str):
+            outputs = [outputs]
+        return all(os.path.exists(os.path.join(self.output_folder, output)) for output in outputs)
+
+    def pending(self, paths, settings):
+        """The paths that are new, changed, or were processed with other settings"""
+        return [p for p in paths if not self.is_current(p, settings)]
+
+    def record(self, path, output_path, settings):
+        """Mark path as done; a fan-out passes its presets and the list of output paths"""
+        if isinstance(output_path, (list, tuple)):
+            output = [os.path.relpath(p, self.output_folder) for p in output_path]
+        else:
+            output = os.path.relpath(output_path, self.output_folder)
+        entry = {
+            "source": os.path.abspath(path),
+            "fingerprint": fingerprint(path),
+            "settings": settings_hash(settings),
+            "output": output,
+        }
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            self._entries[entry["source"]] = entry
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self._lines += 1
+
+    def compact(self):
+        """Rewrite the manifest with one line per source"""
+        with self._lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in self._entries.values():
+                    f.write(json.dumps(entry) + "\n")
+            os.replace(tmp_path, self.path)
+            self._lines = len(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
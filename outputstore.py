@@ -0,0 +1,179 @@
+"""Content-addressed store of finished outputs, shared across folders and runs.
+
+Outputs are keyed by a hash of the source file's bytes and of the settings
+(manifest.settings_hash), so the same image under another name, in another
+folder or in another project's run is only decoded, resized and encoded
+once. Later requests hardlink the stored output into place, or copy it
+where a link can't be made (another filesystem). The store lives under the
+XDG cache directory and is trimmed to a size limit, least recently used
+first.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+
+import engine
+from manifest import settings_hash
+
+# Default size limit of the store
+STORE_MB = 2048
+
+
+def default_store_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ssresizer", "outputs")
+
+
+def source_digest(path):
+    """sha1 of path's bytes, read in chunks"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class Reuse:
+    """Outputs one job took from the store instead of rendering them"""
+    outputs: int = 0
+    linked: int = 0
+    bytes: int = 0
+    # CPU time the stored outputs originally took to render
+    cpu_seconds: float = 0.0
+
+
+class OutputStore:
+    """Plain attributes only, so worker processes get it pickled with their job"""
+
+    def __init__(self, directory=None, max_bytes=STORE_MB * 1024 * 1024):
+        self.directory = directory or default_store_dir()
+        self.max_bytes = max_bytes
+
+    def entry_path(self, digest, settings):
+        key = hashlib.sha1(f"{digest}|{settings_hash(settings)}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key[:2],
+                            key + engine.OUTPUT_EXTENSIONS[settings.output_format])
+
+    def process(self, path, output_folder, settings, relative_dir="", traces=None,
+                memory_budget=None, profile=None):
+        """engine.process (or process_presets for a tuple of presets) through the store.
+
+        Returns (output path or paths, Reuse or None). Every output must
+        be in the store for a hit; otherwise the image is rendered as usual
+        and each output is added.
+        """
+        fan_out = isinstance(settings, tuple)
+        presets = settings if fan_out else (settings,)
+        if fan_out:
+            outputs = [engine.preset_output_path(path, output_folder, s, relative_dir)
+                       for s in presets]
+        else:
+            outputs = [os.path.join(output_folder, relative_dir,
+                                    engine.output_filename(path, settings))]
+        digest = source_digest(path)
+        entries = [self.entry_path(digest, s) for s in presets]
+
+        reuse = self._restore(entries, outputs)
+        if reuse is not None:
+            return (outputs if fan_out else outputs[0]), reuse
+
+        start = time.process_time()
+        if fan_out:
+            output = engine.process_presets(path, output_folder, settings, relative_dir, traces,
+                                            memory_budget, profile)
+        else:
+            output = engine.process(path, os.path.join(output_folder, relative_dir), settings,
+                                    traces, memory_budget, profile)
+        cpu_seconds = (time.process_time() - start) / len(presets)
+        for entry, output_path in zip(entries, outputs):
+            self._add(output_path, entry, cpu_seconds)
+        return output, None
+
+    def _restore(self, entries, outputs):
+        """Link or copy every entry to its output; None if any is missing"""
+        if not all(os.path.exists(entry) for entry in entries):
+            return None
+        reuse = Reuse()
+        try:
+            for entry, output_path in zip(entries, outputs):
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                # Place under a unique name and rename, so the output is never half there
+                tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+                try:
+                    os.link(entry, tmp_path)
+                    reuse.linked += 1
+                except OSError:
+                    shutil.copyfile(entry, tmp_path)
+                os.replace(tmp_path, output_path)
+                # mtime doubles as the last-used time for eviction
+                os.utime(entry)
+                reuse.outputs += 1
+                reuse.bytes += os.path.getsize(output_path)
+                reuse.cpu_seconds += self._cost(entry)
+        except OSError:
+            return None  # Evicted meanwhile; render instead
+        return reuse
+
+    def _cost(self, entry):
+        try:
+            with open(entry + ".json", encoding="utf-8") as f:
+                return json.load(f)["cpu_seconds"]
+        except (OSError, ValueError, KeyError):
+            return 0.0
+
+    def _add(self, output_path, entry, cpu_seconds):
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            tmp_path = f"{entry}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path + ".json", "w", encoding="utf-8") as f:
+                json.dump({"cpu_seconds": cpu_seconds}, f)
+            os.replace(tmp_path + ".json", entry + ".json")
+            try:
+                os.link(output_path, tmp_path)
+            except OSError:
+                shutil.copyfile(output_path, tmp_path)
+            os.replace(tmp_path, entry)
+        except OSError:
+            pass  # A read-only or full store just means no reuse
+
+    def evict(self):
+        """Delete least recently used outputs until the store fits max_bytes"""
+        entries = []
+        total = 0
+        try:
+            for bucket in os.scandir(self.directory):
+                if not bucket.is_dir():
+                    continue
+                for entry in os.scandir(bucket.path):
+                    if entry.name.endswith((".json", ".tmp")):
+                        continue
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return 0
+
+        removed = 0
+        if total > self.max_bytes:
+            entries.sort()
+            # Go a little under the limit so we don't evict after every batch
+            limit = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total <= limit:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                try:
+                    os.remove(path + ".json")
+                except OSError:
+                    pass
+                total -= size
+                removed += 1
+        return removed
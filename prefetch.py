@@ -0,0 +1,170 @@
+"""Read-ahead decoding for image navigation.
+
+The Prefetcher decodes the images around the current one on background
+threads into a byte-bounded LRU cache, so Skip / Previous / Process & Next
+usually find their image already decoded (with its preview proxy).
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import engine
+
+
+@dataclass
+class DecodedImage:
+    image: object
+    original_size: tuple
+    proxy: object
+    proxy_bounds: tuple
+
+    @property
+    def nbytes(self):
+        total = self.image.width * self.image.height * len(self.image.getbands())
+        if self.proxy is not self.image:
+            total += self.proxy.width * self.proxy.height * len(self.proxy.getbands())
+        return total
+
+
+def load_decoded(path, settings, proxy_bounds, memory_budget=None):
+    """Decode path for settings' target and build its preview proxy"""
+    image, original_size = engine.open_image(path, settings, memory_budget)
+    image.load()
+    proxy = engine.make_proxy(image, proxy_bounds)
+    return DecodedImage(image, original_size, proxy, proxy_bounds)
+
+
+class ImageCache:
+    """Thread-safe LRU cache bounded by the decoded size of its entries"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+            self._entries[key] = entry
+            self.current_bytes += entry.nbytes
+            # Always keep the newest entry, even if it alone is over the limit
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Prefetcher:
+    def __init__(self, ahead=2, behind=1, max_bytes=512 * 1024 * 1024, workers=2,
+                 memory_budget=None):
+        self.ahead = ahead
+        self.behind = behind
+        self.memory_budget = memory_budget
+        self.cache = ImageCache(max_bytes)
+        self.hits = 0
+        self.waits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(path, settings, proxy_bounds):
+        # The decode scale only depends on the target size, not the crop offset
+        return (path, settings.target_size, proxy_bounds)
+
+    def get(self, path, settings, proxy_bounds):
+        """Decoded image for path, from the cache, a running prefetch, or a fresh decode"""
+        key = self.cache_key(path, settings, proxy_bounds)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is not None and not future.cancelled():
+            self.waits += 1
+            try:
+                return future.result()
+            except Exception:
+                pass  # Decode again below so the caller sees the error
+
+        self.misses += 1
+        entry = load_decoded(path, settings, proxy_bounds, self.memory_budget)
+        self.cache.put(key, entry)
+        return entry
+
+    def prefetch_around(self, paths, index, settings, proxy_bounds):
+        """Queue decodes for the next `ahead` and previous `behind` paths, nearest first"""
+        window = []
+        for distance in range(1, max(self.ahead, self.behind) + 1):
+            if distance <= self.ahead and index + distance < len(paths):
+                window.append(paths[index + distance])
+            if distance <= self.behind and index - distance >= 0:
+                window.append(paths[index - distance])
+        keys = {self.cache_key(path, settings, proxy_bounds): path for path in window}
+
+        with self._lock:
+            # Drop queued work that fell out of the window
+            for key, future in list(self._inflight.items()):
+                if key not in keys and future.cancel():
+                    del self._inflight[key]
+
+            for key, path in keys.items():
+                if key in self._inflight or self.cache.get(key) is not None:
+                    continue
+                future = self._executor.submit(self._prefetch, key, path, settings, proxy_bounds)
+                self._inflight[key] = future
+
+    def _prefetch(self, key, path, settings, proxy_bounds):
+        try:
+            entry = load_decoded(path, settings, proxy_bounds, self.memory_budget)
+            self.cache.put(key, entry)
+            return entry
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            for future in self._inflight.values():
+                future.cancel()
+            self._inflight.clear()
+        self.cache.clear()
+
+    def stats(self):
+        lookups = self.hits + self.waits + self.misses
+        return {
+            'hits': self.hits,
+            'waits': self.waits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.waits) / lookups if lookups else 0.0,
+            'evictions': self.cache.evictions,
+            'cached_images': len(self.cache),
+            'cached_mb': self.cache.current_bytes / (1024 * 1024),
+        }
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False)
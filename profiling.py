@@ -0,0 +1,204 @@
+"""Optional per-image stage timings and the batch performance report.
+
+The engine takes a Profile wherever it takes search traces. Without one,
+stage() hands back a shared no-op context and nothing is measured, so
+batches that don't ask for a report pay nothing for it. FrameTimes keeps
+the GUI preview's redraw times the same way.
+"""
+import contextlib
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Pipeline stages in the order they run. The crop isn't a stage of its own:
+# images are resampled straight from the crop box, so it's part of resize
+STAGES = ("load", "resize", "encode", "write")
+
+# Files listed as slowest in the report
+SLOWEST_FILES = 5
+
+# Preview redraws the frame time percentiles cover
+FRAME_WINDOW = 240
+
+_IDLE = contextlib.nullcontext()
+
+
+@dataclass
+class Profile:
+    """Where one input's time went, and how much it read, wrote and held in memory"""
+    path: str
+    # Seconds per stage; a fan-out adds up every preset's encode and write
+    stages: dict = field(default_factory=dict)
+    bytes_read: int = 0
+    bytes_written: int = 0
+    # Peak resident set size in bytes while this input was processed, or None
+    peak_rss: int = None
+
+    @property
+    def total(self):
+        return sum(self.stages.values())
+
+    @property
+    def slowest_stage(self):
+        return max(self.stages, key=self.stages.get) if self.stages else None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+
+def stage(profile, name):
+    """Context timing the named stage into profile, or a no-op without one"""
+    return _IDLE if profile is None else profile.stage(name)
+
+
+def begin(path):
+    """Profile for path, with the peak RSS counter reset where the OS allows it"""
+    _reset_peak_rss()
+    try:
+        bytes_read = os.path.getsize(path)
+    except OSError:
+        bytes_read = 0
+    return Profile(path=path, bytes_read=bytes_read)
+
+
+def finish(profile):
+    profile.peak_rss = _peak_rss()
+    return profile
+
+
+def _reset_peak_rss():
+    """Restart Linux's VmHWM, so the peak read after an input is that input's own"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass  # Elsewhere the peak is the worker's high-water mark so far
+
+
+def _peak_rss():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(profiles, elapsed=None):
+    """Batch summary: per-stage p50/p95/max/total, byte totals, peak RSS and the slowest files"""
+    stages = {}
+    for name in STAGES:
+        times = [p.stages[name] for p in profiles if name in p.stages]
+        if times:
+            stages[name] = {"p50_s": percentile(times, 50), "p95_s": percentile(times, 95),
+                            "max_s": max(times), "total_s": sum(times)}
+    totals = [p.total for p in profiles]
+    peaks = [p.peak_rss for p in profiles if p.peak_rss is not None]
+    slowest = sorted(profiles, key=lambda p: p.total, reverse=True)[:SLOWEST_FILES]
+    return {
+        "images": len(profiles),
+        "elapsed_s": elapsed,
+        "image_p50_s": percentile(totals, 50),
+        "image_p95_s": percentile(totals, 95),
+        "stages": stages,
+        "bytes_read": sum(p.bytes_read for p in profiles),
+        "bytes_written": sum(p.bytes_written for p in profiles),
+        "peak_rss": max(peaks) if peaks else None,
+        "slowest": [{"path": p.path, "total_s": p.total, "stage": p.slowest_stage}
+                    for p in slowest],
+    }
+
+
+def format_summary(summary):
+    """The summary as lines of text, for the GUI's dialog and the CLI's stderr"""
+    from engine import format_size
+
+    lines = [f"{summary['images']} images, {summary['image_p50_s'] * 1000:.0f} ms median, "
+             f"{summary['image_p95_s'] * 1000:.0f} ms p95 per image"]
+    busy = sum(s["total_s"] for s in summary["stages"].values()) or 1.0
+    for name, s in summary["stages"].items():
+        lines.append(f"{name}: {s['p50_s'] * 1000:.0f} ms median, {s['p95_s'] * 1000:.0f} ms p95 "
+                     f"({s['total_s'] / busy:.0%} of the time)")
+    io = f"read {format_size(summary['bytes_read'])}, wrote {format_size(summary['bytes_written'])}"
+    if summary["peak_rss"] is not None:
+        io += f", peak memory {format_size(summary['peak_rss'])}"
+    lines.append(io)
+    if summary["slowest"]:
+        lines.append("slowest: " + ", ".join(
+            f"{os.path.basename(s['path'])} {s['total_s'] * 1000:.0f} ms ({s['stage']})"
+            for s in summary["slowest"]))
+    return lines
+
+
+def write_log(path, profiles, summary):
+    """Write every input's profile to path: CSV rows for a .csv path, else JSON with the summary"""
+    # Imported here: the engine imports this module, and only profiled runs write logs
+    import csv
+    import json
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path"] + [f"{name}_s" for name in STAGES]
+                            + ["total_s", "bytes_read", "bytes_written", "peak_rss"])
+            for p in profiles:
+                writer.writerow([p.path] + [p.stages.get(name, "") for name in STAGES]
+                                + [p.total, p.bytes_read, p.bytes_written,
+                                   "" if p.peak_rss is None else p.peak_rss])
+        return
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "images": [asdict(p) for p in profiles]}, f, indent=2)
+
+
+class FrameTimes:
+    """Render times of the last FRAME_WINDOW preview redraws, and how many events they absorbed"""
+
+    def __init__(self, window=FRAME_WINDOW):
+        self.times = deque(maxlen=window)
+        self.frames = 0
+        # Redraw requests, e.g. crop slider events; more than frames means bursts were coalesced
+        self.requests = 0
+
+    def record(self, seconds):
+        self.times.append(seconds)
+        self.frames += 1
+
+    def summary(self):
+        times = list(self.times)
+        p95 = percentile(times, 95)
+        return {"frames": self.frames, "requests": self.requests,
+                "p50_ms": percentile(times, 50) * 1000, "p95_ms": p95 * 1000,
+                "max_ms": max(times, default=0.0) * 1000,
+                # Frame rate the p95 redraw could sustain
+                "fps": 1 / p95 if p95 else 0.0}
+
+    def format(self):
+        s = self.summary()
+        return (f"preview: {s['frames']} frames for {s['requests']} redraw requests, "
+                f"p50 {s['p50_ms']:.1f} ms, p95 {s['p95_ms']:.1f} ms, max {s['max_ms']:.1f} ms "
+                f"({s['fps']:.0f} fps at p95)")
@@ -0,0 +1,92 @@
+"""Streaming folder scanner.
+
+scan_images() walks a folder with os.scandir and yields image paths as it
+finds them, so callers can start on the first image of a 100k-file NFS
+folder right away and batch runs never hold the whole listing. FolderScan
+runs the same walk on a background thread for the GUI.
+"""
+import os
+import threading
+
+import engine
+
+# Directories with at most this many entries are yielded in sorted order;
+# bigger ones are streamed in directory order after the first sorted chunk
+SORT_LIMIT = 1000
+
+
+def scan_images(folder, recursive=False, exclude=(engine.OUTPUT_FOLDER_NAME,)):
+    """Yield image paths relative to folder, each directory before its subfolders"""
+    pending = [""]
+    while pending:
+        relative_dir = pending.pop()
+        subdirs = []
+        try:
+            with os.scandir(os.path.join(folder, relative_dir)) as entries:
+                chunk = []
+                for entry in entries:
+                    if recursive and entry.name not in exclude and _is_dir(entry):
+                        subdirs.append(os.path.join(relative_dir, entry.name))
+                    elif entry.name.lower().endswith(engine.IMAGE_EXTENSIONS) and _is_file(entry):
+                        if chunk is None:
+                            yield os.path.join(relative_dir, entry.name)
+                            continue
+                        chunk.append(entry.name)
+                        if len(chunk) > SORT_LIMIT:
+                            for name in sorted(chunk):
+                                yield os.path.join(relative_dir, name)
+                            chunk = None
+                for name in sorted(chunk or ()):
+                    yield os.path.join(relative_dir, name)
+        except OSError:
+            continue  # Unreadable subfolder; skip it rather than abort the scan
+        # Visit subfolders in name order
+        pending.extend(sorted(subdirs, reverse=True))
+
+
+def _is_dir(entry):
+    try:
+        return entry.is_dir(follow_symlinks=False)
+    except OSError:
+        return False
+
+
+def _is_file(entry):
+    try:
+        return entry.is_file()
+    except OSError:
+        return False
+
+
+def output_folder_for(relative_path, output_root):
+    """Output folder mirroring relative_path's subfolder under output_root"""
+    return os.path.join(output_root, os.path.dirname(relative_path))
+
+
+class FolderScan:
+    """scan_images() on a background thread, collecting paths into a growing list"""
+
+    def __init__(self, folder, recursive=False):
+        self.folder = folder
+        self.recursive = recursive
+        self.files = []
+        self.done = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            for relative_path in scan_images(self.folder, self.recursive):
+                if self._stop.is_set():
+                    break
+                # list.append is atomic, so readers can index the list while it grows
+                self.files.append(relative_path)
+        finally:
+            self.done = True
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,213 @@
+"""Cost estimates for batch jobs, read from image headers before dispatch.
+
+BatchRunner sends the most expensive images to the workers first, so a few
+huge TIFFs at the end of the folder don't leave one worker running long
+after the others finish. A job's cost is estimated from its header alone
+(format and dimensions, never the pixels): the pixels it decodes, resizes
+and encodes, weighted by per-format costs measured on one core. The
+estimates only need to rank jobs and to group them into cost classes; the
+ETA scales them by the time each class actually takes (see CostTracker).
+"""
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image
+
+import engine
+import tiled
+
+# Inputs costed and sorted at a time. Bigger windows order more of the batch
+# but delay the first job by their header reads
+SCHEDULE_WINDOW = 1024
+# Header reads in flight; they mostly wait on the disk
+HEADER_THREADS = 8
+
+# Milliseconds per decoded megapixel on one core, by source format (the
+# decode of a 12 MP photo-like source; TIFF is LZW)
+DECODE_MS_PER_MP = {"JPEG": 4.0, "PNG": 16.5, "TIFF": 13.3, "WEBP": 12.2, "BMP": 1.1, "GIF": 5.7}
+# Sources whose header can't be read are costed as this many bytes per pixel
+FALLBACK_BYTES_PER_PIXEL = 0.3
+# Crop and resize, per decoded megapixel
+RESIZE_MS_PER_MP = 7.1
+# Balanced-profile encodes, per output megapixel
+ENCODE_MS_PER_MP = {"JPEG": 6.6, "PNG": 262.0, "WEBP": 81.0}
+
+# Cost classes by decoded megapixels, cheapest first
+COST_CLASSES = (("small", 4), ("medium", 16), ("large", 64), ("huge", math.inf))
+
+
+@dataclass
+class JobCost:
+    path: str
+    # Pixels decoded, after JPEG draft scaling
+    decoded_pixels: int
+    # Estimated seconds on one core
+    seconds: float
+    cost_class: str
+
+
+def cost_class(decoded_pixels):
+    megapixels = decoded_pixels / 1e6
+    for name, limit in COST_CLASSES:
+        if megapixels < limit:
+            return name
+    return COST_CLASSES[-1][0]
+
+
+def _header(path):
+    """(size, format) from path's header, or None"""
+    try:
+        try:
+            with Image.open(path) as image:
+                return image.size, image.format
+        except Image.DecompressionBombError:
+            # Past Pillow's limit; read_region() decodes these in bands
+            image = tiled.open_header(path)
+            return (image.size, image.format) if image is not None else None
+    except Exception:
+        # Any plugin error; the worker reports it properly, and a guess must not stop the batch
+        return None
+
+
+def estimate_cost(path, settings):
+    """JobCost of processing path with settings (or a tuple of fan-out presets)"""
+    presets = settings if isinstance(settings, tuple) else (settings,)
+    header = _header(path)
+    if header is None:
+        # Unreadable here; it will fail or decode as an unknown format in the worker
+        try:
+            pixels = os.path.getsize(path) / FALLBACK_BYTES_PER_PIXEL
+        except OSError:
+            pixels = 0
+        size, fmt = None, None
+    else:
+        size, fmt = header
+        pixels = size[0] * size[1]
+
+    decoded = pixels
+    if fmt == "JPEG":
+        # JPEGs decode at the DCT scale the largest preset still covers
+        scale = min(engine.decode_scale(size, preset) for preset in presets)
+        decoded = pixels / (scale * scale)
+    milliseconds = decoded / 1e6 * (DECODE_MS_PER_MP.get(fmt, max(DECODE_MS_PER_MP.values()))
+                                    + RESIZE_MS_PER_MP)
+    for preset in presets:
+        width, height = preset.target_size
+        milliseconds += width * height / 1e6 * ENCODE_MS_PER_MP[preset.output_format]
+    return JobCost(path, int(decoded), milliseconds / 1000, cost_class(decoded))
+
+
+def estimate_costs(paths, settings):
+    """estimate_cost of every path, reading headers in parallel"""
+    with ThreadPoolExecutor(max_workers=HEADER_THREADS) as pool:
+        return list(pool.map(lambda path: estimate_cost(path, settings), paths))
+
+
+def largest_first(paths, settings, window=SCHEDULE_WINDOW, on_costed=None):
+    """Yield (path, JobCost) with each window of paths in descending cost order.
+
+    paths may be a generator; only window of them are held at a time.
+    on_costed gets each window's JobCosts before any of them is yielded.
+    """
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) >= window:
+            yield from _ordered(batch, settings, on_costed)
+            batch = []
+    if batch:
+        yield from _ordered(batch, settings, on_costed)
+
+
+def _ordered(paths, settings, on_costed):
+    costs = estimate_costs(paths, settings)
+    if on_costed is not None:
+        on_costed(costs)
+    for cost in sorted(costs, key=lambda c: c.seconds, reverse=True):
+        yield cost.path, cost
+
+
+@dataclass
+class ClassProgress:
+    """Jobs of one cost class: finished, left, and their measured time per job"""
+    name: str
+    done: int
+    left: int
+    # Mean worker seconds of the finished ones, or None before the first
+    seconds_per_job: float = None
+
+
+class CostTracker:
+    """Remaining time of a batch from the measured cost of each class.
+
+    Each class's measured seconds per estimated second scale its remaining
+    estimates, so a model that's off for, say, huge TIFFs corrects itself
+    after the first one. Not thread-safe; BatchRunner calls it under its lock.
+    """
+
+    def __init__(self):
+        names = [name for name, _ in COST_CLASSES]
+        # Costed but unfinished: [jobs, estimated seconds]
+        self._left = {name: [0, 0.0] for name in names}
+        # Finished: [jobs, measured seconds, estimated seconds]
+        self._done = {name: [0, 0.0, 0.0] for name in names}
+
+    def add(self, cost):
+        left = self._left[cost.cost_class]
+        left[0] += 1
+        left[1] += cost.seconds
+
+    def finish(self, cost, seconds=None):
+        """Take cost off the remaining work; seconds is what it took, None if it didn't run"""
+        left = self._left[cost.cost_class]
+        left[0] -= 1
+        left[1] -= cost.seconds
+        if seconds is not None:
+            done = self._done[cost.cost_class]
+            done[0] += 1
+            done[1] += seconds
+            done[2] += cost.seconds
+
+    @property
+    def jobs_left(self):
+        return sum(jobs for jobs, _ in self._left.values())
+
+    def remaining_seconds(self, workers, uncosted=0):
+        """Wall-clock seconds for the costed jobs left (plus uncosted ones at the mean
+        cost), or None before any job has finished"""
+        measured = sum(done[1] for done in self._done.values())
+        estimated = sum(done[2] for done in self._done.values())
+        if not estimated:
+            return None
+        overall = measured / estimated
+        total = 0.0
+        longest = 0.0
+        jobs = uncosted
+        for name, (left_jobs, left_seconds) in self._left.items():
+            if not left_jobs:
+                continue
+            done = self._done[name]
+            ratio = done[1] / done[2] if done[2] else overall
+            total += max(0.0, left_seconds) * ratio
+            longest = max(longest, left_seconds / left_jobs * ratio)
+            jobs += left_jobs
+        if uncosted:
+            costed = sum(done[0] for done in self._done.values()) + self.jobs_left
+            mean = (estimated + sum(s for _, s in self._left.values())) / costed
+            total += uncosted * mean * overall
+        if not jobs:
+            return 0.0
+        # The last jobs can't be spread over more workers than there are jobs
+        return max(total / min(workers, jobs), longest)
+
+    def classes(self):
+        """ClassProgress of every class that has any jobs"""
+        rows = []
+        for name, _ in COST_CLASSES:
+            done, left = self._done[name], self._left[name]
+            if done[0] or left[0]:
+                rows.append(ClassProgress(name, done[0], left[0],
+                                          done[1] / done[0] if done[0] else None))
+        return rows
@@ -0,0 +1,292 @@
+"""Local HTTP resize service on the headless engine.
+
+    python server.py --root photos/ --port 8765
+
+    GET  /resize?path=trip/1.jpg&resolution=720P&format=WEBP&quality=80
+    POST /resize?resolution=4K&orientation=portrait   (image bytes as the body)
+    GET  /metrics
+
+Query parameters mirror the CLI: resolution, orientation, format, quality,
+crop_x, crop_y, encoder, resample and max_bytes. Paths are resolved under
+--root; without one only uploads are accepted. Identical requests arriving
+while one is rendering wait for that render instead of starting their own,
+and results are kept in an LRU cache bounded by encoded bytes. Binds to
+localhost by default.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import UnidentifiedImageError
+
+import engine
+from batch import default_workers
+from manifest import fingerprint
+from prefetch import ImageCache
+from profiling import percentile
+
+DEFAULT_PORT = 8765
+CACHE_MB = 256
+# Requests whose latency the metrics percentiles cover
+LATENCY_WINDOW = 1000
+MAX_UPLOAD_BYTES = 256 * 1024 * 1024
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+class RequestError(Exception):
+    """A bad request; the message goes back to the client with the status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass
+class RenderedResult:
+    data: bytes
+    content_type: str
+    render_seconds: float
+
+    @property
+    def nbytes(self):
+        return len(self.data)
+
+
+def settings_from_query(query):
+    """ResizeSettings from parsed query parameters; raises RequestError for bad values"""
+    def value(name, default=None):
+        return query[name][-1] if name in query else default
+
+    try:
+        return engine.ResizeSettings(
+            resolution=value("resolution", "1080P").upper(),
+            orientation=value("orientation", "landscape").lower(),
+            output_format=value("format", "JPEG").upper(),
+            jpeg_quality=max(1, min(100, int(value("quality", 85)))),
+            crop_x=max(-100, min(100, int(value("crop_x", 0)))),
+            crop_y=max(-100, min(100, int(value("crop_y", 0)))),
+            max_bytes=int(value("max_bytes")) if "max_bytes" in query else None,
+            resample=value("resample"),
+            encoder=value("encoder"),
+        )
+    except ValueError as e:
+        raise RequestError(400, str(e))
+
+
+class ResizeService:
+    """Renders requests through a bounded thread pool, coalescing and caching results"""
+
+    def __init__(self, root=None, cache_bytes=CACHE_MB * 1024 * 1024, workers=None,
+                 memory_budget=None):
+        self.root = os.path.realpath(root) if root else None
+        self.memory_budget = memory_budget
+        self.cache = ImageCache(cache_bytes)
+        # Pillow releases the GIL while decoding, resizing and encoding
+        self._executor = ThreadPoolExecutor(max_workers=workers or default_workers())
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._started = time.monotonic()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._counts = dict.fromkeys(("requests", "errors", "hits", "misses", "coalesced"), 0)
+        self._render_seconds = 0.0
+
+    def resolve(self, relative_path):
+        """Absolute path of relative_path under root; raises RequestError outside it"""
+        if self.root is None:
+            raise RequestError(403, "no --root configured; upload the image instead")
+        path = os.path.realpath(os.path.join(self.root, relative_path))
+        if os.path.commonpath([path, self.root]) != self.root:
+            raise RequestError(403, f"{relative_path} is outside the root folder")
+        if not os.path.isfile(path):
+            raise RequestError(404, f"{relative_path} not found")
+        return path
+
+    def resize(self, settings, path=None, upload=None):
+        """(RenderedResult, "hit" | "miss" | "coalesced") for a path or uploaded bytes"""
+        if path is not None:
+            # The source's size and mtime are in the key, so edited files render afresh
+            key = (path, tuple(fingerprint(path)), settings)
+        else:
+            key = (hashlib.sha1(upload).hexdigest(), settings)
+
+        with self._lock:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._counts["hits"] += 1
+                return cached, "hit"
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._counts["coalesced"] += 1
+                outcome = "coalesced"
+            else:
+                self._counts["misses"] += 1
+                future = self._executor.submit(self._render, settings, path, upload)
+                self._in_flight[key] = future
+                future.add_done_callback(lambda f: self._finish(key, f))
+                outcome = "miss"
+        return future.result(), outcome
+
+    def _render(self, settings, path, upload):
+        start = time.perf_counter()
+        rendered = engine.render_source(path if path is not None else BytesIO(upload), settings,
+                                        self.memory_budget)
+        buffer = BytesIO()
+        engine.encode(rendered, buffer, settings)
+        return RenderedResult(buffer.getvalue(), CONTENT_TYPES[settings.output_format],
+                              time.perf_counter() - start)
+
+    def _finish(self, key, future):
+        # Cache before leaving _in_flight, so a request never misses both
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if not future.cancelled() and future.exception() is None:
+                self._render_seconds += future.result().render_seconds
+
+    def record(self, seconds, failed=False):
+        with self._lock:
+            self._counts["requests"] += 1
+            if failed:
+                self._counts["errors"] += 1
+            self._latencies.append(seconds)
+
+    def metrics(self):
+        with self._lock:
+            counts = dict(self._counts)
+            latencies = list(self._latencies)
+            in_flight = len(self._in_flight)
+            render_seconds = self._render_seconds
+        lookups = counts["hits"] + counts["misses"] + counts["coalesced"]
+        return {
+            "uptime_s": time.monotonic() - self._started,
+            **counts,
+            "hit_rate": (counts["hits"] + counts["coalesced"]) / lookups if lookups else 0.0,
+            "rendering": in_flight,
+            "render_s": render_seconds,
+            "latency_ms": {name: percentile(latencies, pct) * 1000
+                           for name, pct in (("p50", 50), ("p95", 95), ("p99", 99))},
+            "cache": {"entries": len(self.cache), "bytes": self.cache.current_bytes,
+                      "max_bytes": self.cache.max_bytes, "evictions": self.cache.evictions},
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class ResizeHandler(BaseHTTPRequestHandler):
+    # Set on the handler subclass make_server() builds
+    service = None
+    quiet = False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == "/metrics":
+            self._send(200, "application/json", json.dumps(self.service.metrics()).encode())
+        elif url.path == "/resize":
+            self._resize(parse_qs(url.query))
+        else:
+            self._send(404, "text/plain", b"not found\n")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != "/resize":
+            self._send(404, "text/plain", b"not found\n")
+            return
+        self._resize(parse_qs(url.query), upload=True)
+
+    def _resize(self, query, upload=False):
+        start = time.perf_counter()
+        failed = True
+        try:
+            settings = settings_from_query(query)
+            if upload:
+                length = int(self.headers.get("Content-Length", 0))
+                if not 0 < length <= MAX_UPLOAD_BYTES:
+                    raise RequestError(413 if length else 400, "upload needs a body of at most "
+                                       f"{engine.format_size(MAX_UPLOAD_BYTES)}")
+                result, outcome = self.service.resize(settings, upload=self.rfile.read(length))
+            elif "path" in query:
+                result, outcome = self.service.resize(settings, self.service.resolve(query["path"][-1]))
+            else:
+                raise RequestError(400, "give a path parameter or POST the image")
+            self._send(200, result.content_type, result.data, {"X-Cache": outcome})
+            failed = False
+        except RequestError as e:
+            self._send(e.status, "text/plain", f"{e}\n".encode())
+        except UnidentifiedImageError:
+            self._send(415, "text/plain", b"not an image format this service can read\n")
+        except Exception as e:  # Undecodable uploads, budgets that can't be met, ...
+            self._send(422, "text/plain", f"{e}\n".encode())
+        finally:
+            self.service.record(time.perf_counter() - start, failed)
+
+    def _send(self, status, content_type, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, quiet=False):
+    """HTTP server for service; port 0 picks a free one (see server_address)"""
+    handler = type("Handler", (ResizeHandler,), {"service": service, "quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    # Only the command line needs the CLI's size parser; importing cli up front would load
+    # its archive and watch-folder modules along with server
+    from cli import parse_size
+    parser = argparse.ArgumentParser(description="Serve resized images over local HTTP.")
+    parser.add_argument("--root", help="Folder that path= requests are resolved under")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cache-mb", type=int, default=CACHE_MB,
+                        help=f"Encoded results kept in memory (default: {CACHE_MB})")
+    parser.add_argument("-j", "--jobs", type=int, default=default_workers(),
+                        help="Concurrent renders (default: number of cores)")
+    parser.add_argument("--max-memory", dest="memory_budget", type=parse_size,
+                        help="Decode path= inputs bigger than this in bands, keeping about this "
+                             "much image data in memory per render (default: "
+                             f"{engine.format_size(engine.MEMORY_BUDGET)}; TIFF, PNG and BMP)")
+    parser.add_argument("--quiet", action="store_true", help="Don't log every request")
+    args = parser.parse_args(argv)
+
+    service = ResizeService(args.root, args.cache_mb * 1024 * 1024, args.jobs,
+                            args.memory_budget)
+    server = make_server(service, args.host, args.port, args.quiet)
+    host, port = server.server_address[:2]
+    print(f"serving on http://{host}:{port}/ (metrics at /metrics); Ctrl+C to stop",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""Peak memory of oversized inputs stays under the decode budget.
+
+A small version of `benchmark.py memory`: each case decodes a synthetic
+TIFF and PNG far bigger than the budget in a fresh interpreter and checks
+how far its peak RSS (VmHWM) grew past the interpreter with the modules
+imported.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import benchmark
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 96 MP, 366 MB decoded, against a 128 MB budget; at 1080P the output and its
+# resize stay small next to the budget
+SIZE = (12000, 8000)
+BUDGET_MB = 128
+
+_CASE = """
+import json, sys
+import engine
+
+def peak_mb():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+path, call, budget = sys.argv[1], sys.argv[2], int(sys.argv[3]) * 1024 * 1024
+settings = engine.ResizeSettings(resolution="1080P")
+baseline = peak_mb()
+if call == "render_banded":
+    result = engine.render_banded(path, settings, budget)
+else:
+    result, _ = engine.open_image(path, settings, budget)
+    result.load()
+json.dump({"growth_mb": peak_mb() - baseline, "size": result.size}, sys.stdout)
+"""
+
+pytestmark = pytest.mark.skipif(not os.path.exists("/proc/self/status"),
+                                reason="VmHWM comes from /proc")
+
+
+@pytest.fixture(scope="module", params=["PNG", "TIFF"])
+def oversized(request, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("memory") / f"large.{request.param.lower()}")
+    writers = {"PNG": benchmark._write_large_png, "TIFF": benchmark._write_large_tiff}
+    # Written in another process so this one's peak isn't the writer's
+    benchmark.run_isolated(writers[request.param], path, SIZE)
+    return path
+
+
+@pytest.mark.parametrize("call", ["render_banded", "open_image"])
+def test_peak_rss_under_budget(oversized, call):
+    run = subprocess.run([sys.executable, "-c", _CASE, oversized, call, str(BUDGET_MB)],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    result = json.loads(run.stdout)
+    assert result["size"][0] > 0
+    assert result["growth_mb"] <= BUDGET_MB, result
@@ -0,0 +1,26 @@
+"""Importing an entry point doesn't load what only some runs need.
+
+The fast check behind `benchmark.py startup`, which also times the imports
+against a budget: each entry point is imported in a fresh interpreter and
+none of its STARTUP_FORBIDDEN modules may be loaded.
+"""
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import _IMPORT_PROBE, STARTUP_FORBIDDEN
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module", sorted(STARTUP_FORBIDDEN))
+def test_import_loads_no_forbidden_modules(module):
+    if module == "SSResizer":
+        pytest.importorskip("tkinter")
+    run = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(module=module)],
+                         cwd=ROOT, capture_output=True, text=True, check=True)
+    loaded = set(json.loads(run.stdout)["modules"])
+    assert [name for name in STARTUP_FORBIDDEN[module] if name in loaded] == []
@@ -0,0 +1,236 @@
+"""Persistent on-disk thumbnail cache.
+
+Thumbnails are keyed by source path, mtime and file size and stored as
+small WEBP files under the XDG cache directory, so the uncropped overlay
+(and anything else that needs a thumbnail) is nearly free after first use.
+Inputs over the memory budget are decoded in bands by engine.open_image,
+one at a time, so opening a folder of gigapixel scans stays within it.
+"""
+import hashlib
+import itertools
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image
+
+import engine
+import tiled
+
+# Fits the "Original (Uncropped)" overlay canvas
+THUMBNAIL_SIZE = (200, 150)
+
+# Typical size of one stored thumbnail, for how many a fill can make before evicting
+THUMBNAIL_BYTES = 8 * 1024
+
+# Thumbnails queued per worker ahead of the ones being made
+JOBS_PER_WORKER = 2
+
+
+def default_cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ssresizer", "thumbnails")
+
+
+class ThumbnailCache:
+    def __init__(self, directory=None, max_bytes=100 * 1024 * 1024, size=THUMBNAIL_SIZE, workers=None,
+                 memory_budget=None):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.size = size
+        self.workers = workers or os.cpu_count() or 1
+        self.memory_budget = memory_budget
+        self._executor = None
+        self._lock = threading.Lock()
+        # Held while decoding an input over the memory budget, so workers take turns
+        self._oversized = threading.Lock()
+        # Bumped by cancel_fill(); a fill stops once it no longer matches
+        self._generation = 0
+
+    def cache_path(self, path):
+        """Cache file for path's current contents, or None if path can't be read"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        key = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{self.size[0]}x{self.size[1]}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".webp")
+
+    def get(self, path):
+        """Cached thumbnail for path, or None"""
+        cache_path = self.cache_path(path)
+        if cache_path is None:
+            return None
+        try:
+            with Image.open(cache_path) as thumb:
+                thumb.load()
+        except (OSError, ValueError):
+            return None
+        # mtime doubles as the last-used time for eviction
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return thumb
+
+    def get_or_create(self, path, source=None):
+        """Cached thumbnail for path, creating it (from source if given) on a miss"""
+        thumb = self.get(path)
+        if thumb is None:
+            thumb = self.create(path, source)
+        return thumb
+
+    def create(self, path, source=None):
+        """Make and store a thumbnail of path; source is an already decoded copy of it"""
+        if source is None:
+            info = tiled.probe(path)
+            if info is not None and info[1] > (self.memory_budget or engine.MEMORY_BUDGET):
+                with self._oversized:
+                    thumb = self._decode(path)
+            else:
+                thumb = self._decode(path)
+        else:
+            thumb = source.copy()
+            thumb.thumbnail(self.size, Image.Resampling.LANCZOS)
+        if thumb.mode not in ('RGB', 'RGBA'):
+            thumb = thumb.convert('RGBA' if 'A' in thumb.getbands() or thumb.mode == 'P' else 'RGB')
+
+        cache_path = self.cache_path(path)
+        if cache_path is not None:
+            self._store(thumb, cache_path)
+        return thumb
+
+    def _decode(self, path):
+        # Banded and reduced to the budget if it's over it; otherwise opened lazily, and
+        # thumbnail() uses JPEG draft mode, so this decodes at 1/8 scale when it can
+        image, _ = engine.open_image(path, memory_budget=self.memory_budget)
+        with image:
+            image.thumbnail(self.size, Image.Resampling.LANCZOS)
+            return image.copy()
+
+    def _store(self, thumb, cache_path):
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # Write under a unique name and rename, so readers never see half a file
+            tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+            thumb.save(tmp_path, format='WEBP', quality=80)
+            os.replace(tmp_path, cache_path)
+        except OSError:
+            pass  # A read-only or full cache dir just means no caching
+
+    @property
+    def capacity(self):
+        """About how many thumbnails fit under max_bytes"""
+        return max(1, int(self.max_bytes * 0.9) // THUMBNAIL_BYTES)
+
+    def fill(self, paths, limit=None):
+        """Create missing thumbnails for paths in parallel; returns a Future of the count made.
+
+        paths may be a generator, e.g. one following a folder scan; it is
+        read as workers free up, so only a few jobs are queued at a time,
+        and at most limit paths (capacity by default) are taken from it.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="thumbnails")
+            executor = self._executor
+            generation = self._generation
+        result = Future()
+        # Coordinate from a separate thread so workers never wait on each other
+        threading.Thread(target=self._fill,
+                         args=(paths, limit or self.capacity, executor, generation, result),
+                         daemon=True).start()
+        return result
+
+    def cancel_fill(self):
+        """Stop running fills from queueing more thumbnails"""
+        with self._lock:
+            self._generation += 1
+
+    def _fill(self, paths, limit, executor, generation, result):
+        in_flight = self.workers * JOBS_PER_WORKER
+        slots = threading.Semaphore(in_flight)
+        counted = threading.Lock()
+        created = 0
+
+        def finished(future):
+            nonlocal created
+            if not future.cancelled() and future.exception() is None:
+                with counted:
+                    created += future.result()
+            slots.release()
+
+        try:
+            for path in itertools.islice(paths, limit):
+                # Wait for a free slot so only a bounded number of jobs is queued
+                slots.acquire()
+                if generation != self._generation:
+                    slots.release()
+                    break
+                try:
+                    future = executor.submit(self._fill_one, path)
+                except RuntimeError:
+                    slots.release()  # Shut down
+                    break
+                future.add_done_callback(finished)
+            # Every slot back means every job has finished
+            for _ in range(in_flight):
+                slots.acquire()
+            self.evict()
+        except Exception as e:
+            result.set_exception(e)
+        else:
+            result.set_result(created)
+
+    def _fill_one(self, path):
+        cache_path = self.cache_path(path)
+        if cache_path is None or os.path.exists(cache_path):
+            return 0
+        return self._create_quietly(path)
+
+    def _create_quietly(self, path):
+        try:
+            self.create(path)
+            return 1
+        except Exception:
+            return 0
+
+    def evict(self):
+        """Delete least recently used thumbnails until the cache fits max_bytes"""
+        entries = []
+        total = 0
+        try:
+            for bucket in os.scandir(self.directory):
+                if not bucket.is_dir():
+                    continue
+                for entry in os.scandir(bucket.path):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+        except OSError:
+            return 0
+
+        removed = 0
+        if total > self.max_bytes:
+            entries.sort()
+            # Go a little under the limit so we don't evict on every fill
+            limit = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total <= limit:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+        return removed
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
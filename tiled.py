@@ -0,0 +1,392 @@
+"""Memory-bounded decoding of oversized TIFF, PNG and BMP inputs.
+
+A 30k x 20k scan needs gigabytes to decode whole, and Pillow refuses to
+open it at all past its decompression-bomb limit. read_region() instead
+decodes a region of the file a band of rows at a time, box-reducing each
+band into the result as it goes, so only one band of source rows is ever
+in memory:
+
+- TIFF with several strips or tiles (any compression libtiff reads): each
+  band is decoded from a small in-memory TIFF holding just its strips
+- Uncompressed single-strip TIFF and BMP: rows are read straight from the
+  file
+- Non-interlaced 8-bit PNG: the zlib stream is inflated incrementally and
+  each band's scanlines are re-wrapped as a small PNG
+
+Anything else raises Unsupported and is decoded the normal way.
+"""
+import io
+import math
+import struct
+import zlib
+
+from PIL import Image
+
+# Decoded bytes per pixel in Pillow's memory layout
+_PIXEL_BYTES = {'1': 1, 'L': 1, 'P': 1, 'I;16': 2, 'I;16B': 2, 'I;16L': 2}
+
+# Copies of a band's rows live at once in the worst case (file data,
+# decoded band, mode conversion); a band gets this share of the budget
+_BAND_COPIES = 4
+
+# Modes Image.reduce() can't box-filter, and what to reduce them as
+_REDUCE_AS = {'1': 'L', 'P': 'RGBA', 'I;16': 'I', 'I;16B': 'I', 'I;16L': 'I'}
+
+
+class Unsupported(Exception):
+    """The file's layout can't be decoded in bands"""
+
+
+def pixel_bytes(mode):
+    return _PIXEL_BYTES.get(mode, 4)
+
+
+def open_header(path):
+    """Parse path's header without decoding pixels or Pillow's decompression-bomb check"""
+    with open(path, 'rb') as f:
+        magic = f.read(8)
+    # Plugins are imported on first use; TIFF's pulls in a good part of Pillow
+    if magic[:4] in (b'II*\x00', b'MM\x00*'):
+        from PIL import TiffImagePlugin
+        return TiffImagePlugin.TiffImageFile(path)
+    if magic == b'\x89PNG\r\n\x1a\n':
+        from PIL import PngImagePlugin
+        return PngImagePlugin.PngImageFile(path)
+    if magic[:2] == b'BM':
+        from PIL import BmpImagePlugin
+        return BmpImagePlugin.BmpImageFile(path)
+    return None
+
+
+def probe(path):
+    """(size, decoded bytes) of path, or None if it isn't a format read_region() knows"""
+    try:
+        image = open_header(path)
+    except (OSError, SyntaxError):
+        return None
+    if image is None:
+        return None
+    with image:
+        return image.size, image.width * image.height * pixel_bytes(image.mode)
+
+
+def read_region(path, box, scale=1, budget=512 * 1024 * 1024):
+    """Decode box (left, top, right, bottom) of path, box-reduced by scale.
+
+    budget covers the result, about twice that again for the caller to
+    crop and resize it, and the source bands decoded meanwhile. A band is
+    never less than one strip, tile row or output row, so a very small
+    budget can still be exceeded.
+    """
+    image = open_header(path)
+    if image is None:
+        raise Unsupported(f"{path}: not a TIFF, PNG or BMP file")
+    with image:
+        reader = _reader_for(image)
+        left, top, right, bottom = box
+        mode = _reduce_mode(image)
+        result = Image.new(mode, (math.ceil((right - left) / scale),
+                                  math.ceil((bottom - top) / scale)))
+        band_budget = budget - 3 * result.width * result.height * pixel_bytes(mode)
+        row_bytes = image.width * max(pixel_bytes(image.mode), pixel_bytes(mode))
+        copies = getattr(reader, 'BAND_COPIES', _BAND_COPIES)
+        band_rows = max(scale, band_budget // (copies * row_bytes) // scale * scale)
+
+        out_y = 0
+        next_row = top  # Bands may overlap; each region row is used once
+        carry = None  # Region rows left over from the last band, fewer than scale
+        for y, band in reader.bands(top, bottom, band_rows):
+            if band.mode != mode:
+                if band.mode == 'P':
+                    # Raw rows carry no palette; the header has it
+                    band.putpalette(image.palette)
+                band = band.convert(mode)
+            first = max(next_row, y) - y
+            last = min(bottom, y + band.height) - y
+            next_row = y + last
+            if carry is not None:
+                # Top the carried rows up to one full output row
+                rows = min(scale - carry.height, last - first)
+                carry = _stack(carry, band.crop((left, first, right, first + rows)))
+                first += rows
+                if carry.height < scale:
+                    continue
+                out_y = _paste_reduced(result, out_y, carry, (0, 0) + carry.size, scale)
+                carry = None
+            usable = first + (last - first) // scale * scale
+            if usable > first:
+                out_y = _paste_reduced(result, out_y, band, (left, first, right, usable), scale)
+            if usable < last:
+                carry = band.crop((left, usable, right, last))
+        if carry is not None:
+            _paste_reduced(result, out_y, carry, (0, 0) + carry.size, scale)
+        result.info.update(image.info)
+        return result
+
+
+def _paste_reduced(result, out_y, band, box, scale):
+    """Paste box of band, reduced by scale, into result at out_y; returns the next out_y"""
+    reduced = band.reduce(scale, box) if scale > 1 else band.crop(box)
+    result.paste(reduced, (0, out_y))
+    return out_y + reduced.height
+
+
+def _stack(upper, lower):
+    stacked = Image.new(upper.mode, (upper.width, upper.height + lower.height))
+    stacked.paste(upper, (0, 0))
+    stacked.paste(lower, (0, upper.height))
+    return stacked
+
+
+def _reduce_mode(image):
+    """Mode bands of image are box-reduced in"""
+    if image.mode == 'P' and 'transparency' not in image.info:
+        return 'RGB'
+    return _REDUCE_AS.get(image.mode, image.mode)
+
+
+def _reader_for(image):
+    if image.format == 'TIFF':
+        tags = image.tag_v2
+        if tags.get(284, 1) != 1:
+            raise Unsupported("planar TIFF")
+        strips = len(tags.get(324, tags.get(273, ())))
+        if strips > 1:
+            return _TiffStrips(image)
+        if tags.get(259, 1) == 1:
+            bits = sum(tags.get(258, (8,)))
+            return _RawRows(image, stride=(image.width * bits + 7) // 8)
+        raise Unsupported("compressed TIFF stored as a single strip")
+    if image.format == 'PNG':
+        return _PngRows(image)
+    if image.format == 'BMP':
+        if image.tile[0][0] != 'raw':
+            raise Unsupported("compressed BMP")
+        return _RawRows(image, stride=image.tile[0][3][1])
+    raise Unsupported(image.format)
+
+
+class _RawRows:
+    """Uncompressed rows at a fixed stride, read straight from the file"""
+
+    def __init__(self, image, stride):
+        tile = image.tile[0]
+        self.image = image
+        self.offset = tile[2]
+        self.rawmode = tile[3][0]
+        self.orientation = tile[3][2] if len(tile[3]) > 2 else 1
+        self.stride = stride
+
+    def bands(self, top, bottom, rows):
+        image = self.image
+        with open(image.filename, 'rb') as f:
+            for y in range(top, bottom, rows):
+                count = min(rows, bottom - y)
+                if self.orientation < 0:
+                    # Bottom-up rows: the band starts at the file row of its last image row
+                    first = image.height - (y + count)
+                else:
+                    first = y
+                f.seek(self.offset + first * self.stride)
+                data = f.read(count * self.stride)
+                yield y, Image.frombytes(image.mode, (image.width, count), data, 'raw',
+                                         self.rawmode, self.stride, self.orientation)
+
+
+class _TiffStrips:
+    """TIFF strips or tiles, decoded a group at a time from a minimal in-memory TIFF"""
+
+    # Tags copied into each band's TIFF, besides size and data layout
+    COPIED_TAGS = (258, 259, 262, 266, 277, 284, 317, 320, 338, 339, 347, 530, 531)
+
+    # struct formats of the tag types copied
+    FORMATS = {1: 'B', 3: 'H', 4: 'I', 7: 'B'}
+
+    def __init__(self, image):
+        self.image = image
+        tags = image.tag_v2
+        self.tiled = 322 in tags
+        if self.tiled:
+            self.unit_rows = tags[323]
+            self.per_row = math.ceil(image.width / tags[322])
+            self.offsets, self.counts = tags[324], tags[325]
+        else:
+            self.unit_rows = tags.get(278, image.height)
+            self.per_row = 1
+            self.offsets, self.counts = tags[273], tags[279]
+
+    def bands(self, top, bottom, rows):
+        image = self.image
+        unit_rows = self.unit_rows
+        units = max(1, rows // unit_rows)
+        with open(image.filename, 'rb') as f:
+            first = top // unit_rows
+            last = math.ceil(bottom / unit_rows)
+            for start in range(first, last, units):
+                end = min(start + units, last)
+                y = start * unit_rows
+                height = min(end * unit_rows, image.height) - y
+                indices = range(start * self.per_row, end * self.per_row)
+                buffer = io.BytesIO()
+                buffer.write(self._band_header(height, [self.counts[i] for i in indices]))
+                for i in indices:
+                    f.seek(self.offsets[i])
+                    buffer.write(f.read(self.counts[i]))
+                buffer.seek(0)
+                band = Image.open(buffer)
+                band.load()
+                # The pixels are decoded; drop the compressed copy
+                buffer.close()
+                yield y, band
+
+    def _band_header(self, height, counts):
+        """Header and IFD of a TIFF of height rows whose strips (of counts bytes) follow it"""
+        tags = self.image.tag_v2
+        entries = {256: (4, [self.image.width]), 257: (4, [height])}
+        if self.tiled:
+            entries[322] = (4, [tags[322]])
+            entries[323] = (4, [tags[323]])
+        else:
+            entries[278] = (4, [self.unit_rows])
+        for tag in self.COPIED_TAGS:
+            if tag not in tags:
+                continue
+            kind = tags.tagtype.get(tag, 3)
+            value = tags[tag]
+            if kind == 7:
+                entries[tag] = (7, list(bytes(value)))
+            elif kind in self.FORMATS:
+                entries[tag] = (kind, list(value) if isinstance(value, tuple) else [value])
+        offsets_tag, counts_tag = (324, 325) if self.tiled else (273, 279)
+        entries[offsets_tag] = (4, [0] * len(counts))
+        entries[counts_tag] = (4, counts)
+
+        # Values over 4 bytes go in an area after the IFD, then the strip data
+        packed = {tag: struct.pack('<%d%s' % (len(value), self.FORMATS[kind]), *value)
+                  for tag, (kind, value) in entries.items()}
+        extra_offset = 8 + 2 + 12 * len(entries) + 4
+        extra_size = sum(len(data) + len(data) % 2 for data in packed.values() if len(data) > 4)
+        offset = extra_offset + extra_size
+        offsets = []
+        for count in counts:
+            offsets.append(offset)
+            offset += count
+        packed[offsets_tag] = struct.pack('<%dI' % len(offsets), *offsets)
+
+        ifd = struct.pack('<H', len(entries))
+        extra = b''
+        for tag in sorted(entries):
+            kind, value = entries[tag]
+            data = packed[tag]
+            if len(data) > 4:
+                ifd += struct.pack('<HHII', tag, kind, len(value), extra_offset + len(extra))
+                extra += data + b'\0' * (len(data) % 2)
+            else:
+                ifd += struct.pack('<HHI', tag, kind, len(value)) + data.ljust(4, b'\0')
+        ifd += struct.pack('<I', 0)
+        return b'II*\x00' + struct.pack('<I', 8) + ifd + extra
+
+
+class _PngRows:
+    """Non-interlaced 8-bit PNG scanlines, inflated a band at a time"""
+
+    # The caller's last band is still alive while the next one's scanlines are
+    # inflated, re-wrapped and decoded, on top of the usual copies
+    BAND_COPIES = 6
+
+    # Bytes per pixel of each 8-bit colour type
+    PIXEL_BYTES = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+    # Scanlines are re-wrapped (stored, level 0) in IDAT chunks of this size
+    PIECE_BYTES = 1024 * 1024
+
+    def __init__(self, image):
+        self.image = image
+        with open(image.filename, 'rb') as f:
+            f.seek(8)
+            header = None
+            self.chunks = []
+            while True:
+                length, kind = struct.unpack('>I4s', f.read(8))
+                if kind == b'IDAT':
+                    self.idat_offset = f.tell() - 8
+                    break
+                body = f.read(length + 4)
+                if kind == b'IHDR':
+                    header = body[:length]
+                else:
+                    self.chunks.append(struct.pack('>I4s', length, kind) + body)
+        width, height, depth, color, _, _, interlace = struct.unpack('>IIBBBBB', header)
+        if interlace or depth != 8 or color not in self.PIXEL_BYTES:
+            raise Unsupported("interlaced or non-8-bit PNG")
+        self.header = header
+        self.stride = width * self.PIXEL_BYTES[color] + 1
+
+    def bands(self, top, bottom, rows):
+        """Bands from the top of the file down, since each row's filter refers to the one above.
+
+        After the first band, a band starts with the last row of the one
+        before it.
+        """
+        band_bytes = rows * self.stride
+        inflater = zlib.decompressobj()
+        pending = bytearray()
+        previous = None
+        y = 0
+        with open(self.image.filename, 'rb') as f:
+            f.seek(self.idat_offset)
+            data = b''
+            while y < bottom:
+                if not data:
+                    length, kind = struct.unpack('>I4s', f.read(8))
+                    if kind != b'IDAT':
+                        break
+                    data = f.read(length)
+                    f.seek(4, io.SEEK_CUR)
+                # Never inflate past the band, so pending holds one band at most
+                pending += inflater.decompress(data, band_bytes - len(pending))
+                data = inflater.unconsumed_tail
+                if len(pending) < band_bytes:
+                    continue
+                band_y = y if previous is None else y - 1
+                band, pending = self._decode(pending, previous), bytearray()
+                previous = band.crop((0, band.height - 1, band.width, band.height)).tobytes()
+                if y + rows > top:
+                    yield band_y, band
+                y += rows
+            if pending and y < bottom:
+                yield (y if previous is None else y - 1), self._decode(pending, previous)
+
+    def _decode(self, scanlines, previous):
+        """Decode filtered scanlines, after the unfiltered row above them if there is one"""
+        rows = len(scanlines) // self.stride
+        png = io.BytesIO()
+        png.write(b'\x89PNG\r\n\x1a\n')
+        height = rows if previous is None else rows + 1
+        png.write(_png_chunk(b'IHDR', struct.pack('>II', self.image.width, height) + self.header[8:]))
+        for chunk in self.chunks:
+            png.write(chunk)
+        # Level 0 just frames the bytes; unfiltering the scanlines is left to Pillow
+        compressor = zlib.compressobj(0)
+        if previous is not None:
+            png.write(_png_chunk(b'IDAT', compressor.compress(b'\0' + previous)))
+        with memoryview(scanlines) as view:
+            for start in range(0, rows * self.stride, self.PIECE_BYTES):
+                end = min(start + self.PIECE_BYTES, rows * self.stride)
+                png.write(_png_chunk(b'IDAT', compressor.compress(view[start:end])))
+        # The re-wrapped copy is all Pillow needs; free the raw one before it decodes
+        del scanlines[:]
+        png.write(_png_chunk(b'IDAT', compressor.flush()))
+        png.write(_png_chunk(b'IEND', b''))
+        png.seek(0)
+        from PIL import PngImagePlugin
+        band = PngImagePlugin.PngImageFile(png)
+        band.load()
+        # The pixels are decoded; drop the re-wrapped copy
+        png.close()
+        return band
+
+
+def _png_chunk(kind, body):
+    return (struct.pack('>I', len(body)) + kind + body
+            + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff))
@@ -0,0 +1,264 @@
+"""Watch-folder ingestion: process images as they land in a folder.
+
+FolderWatcher is an endless iterable of image paths for BatchRunner. New
+and changed files are noticed through inotify on Linux, or by rescanning
+the folder every few seconds elsewhere (and on network mounts, whose
+remote writes inotify never sees). A file is only handed on once its size
+and modification time have stopped changing for a settle period, so
+uploads still being copied in aren't read half-written.
+"""
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import engine
+from manifest import fingerprint
+from scanner import scan_images
+
+# A file must keep the same size and mtime this long before it's processed
+SETTLE_SECONDS = 2.0
+# Rescan interval without inotify
+POLL_SECONDS = 2.0
+# With inotify, a full rescan this often still catches anything it missed
+RESCAN_SECONDS = 60.0
+
+# inotify event masks (linux/inotify.h)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_Q_OVERFLOW = 0x4000
+IN_ISDIR = 0x40000000
+_WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal inotify binding over libc; raises OSError where it isn't available"""
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify needs Linux")
+        # Only watch runs need ctypes, so the CLI doesn't import it up front
+        import ctypes
+        import ctypes.util
+        self._ctypes = ctypes
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch descriptor -> folder, relative to the watched root
+        self.folders = {}
+
+    def add_watch(self, path, relative_dir):
+        wd = self._add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(self._ctypes.get_errno(), f"can't watch {path}")
+        self.folders[wd] = relative_dir
+
+    def read(self, timeout):
+        """(relative path, mask) of the events arriving within timeout seconds"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((os.path.join(self.folders.get(wd, ""), name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    """Yield absolute paths of images that appear or change under folder, until stop().
+
+    Images already in the folder when watching starts are yielded too;
+    pair this with a Manifest so the ones already processed are skipped.
+    """
+
+    def __init__(self, folder, recursive=False, settle=SETTLE_SECONDS, poll=False):
+        self.folder = folder
+        self.recursive = recursive
+        self.settle = settle
+        self._inotify = None
+        if not poll:
+            try:
+                self._inotify = _Inotify()
+            except OSError:
+                pass  # No inotify here; poll instead
+        # Relative path -> (fingerprint, when it last changed) of files still settling
+        self._settling = {}
+        # Settled paths waiting to be taken by the consumer
+        self._ready = deque()
+        # Fingerprint of every file handed on, so an unchanged file isn't handed on twice
+        self._handed = {}
+        self._stop = threading.Event()
+
+    @property
+    def backend(self):
+        return "inotify" if self._inotify is not None else "polling"
+
+    @property
+    def settling(self):
+        """Files seen but still being written"""
+        return len(self._settling)
+
+    @property
+    def queued(self):
+        """Settled files not yet taken by the consumer"""
+        return len(self._ready)
+
+    def stop(self):
+        self._stop.set()
+
+    def __iter__(self):
+        try:
+            if self._inotify is not None:
+                self._watch_tree("")
+            self._rescan()
+            last_scan = time.monotonic()
+            while not self._stop.is_set():
+                while self._ready:
+                    yield os.path.join(self.folder, self._ready.popleft())
+                    if self._stop.is_set():
+                        return
+                interval = RESCAN_SECONDS if self._inotify is not None else POLL_SECONDS
+                if time.monotonic() - last_scan >= interval:
+                    self._rescan()
+                    last_scan = time.monotonic()
+                # Wake up often enough to hand settled files on promptly
+                timeout = min(self.settle, interval) / 4 if self._settling else 0.5
+                if self._inotify is not None:
+                    self._on_events(self._inotify.read(timeout))
+                else:
+                    self._stop.wait(timeout)
+                self._check_settled()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+
+    def _watch_tree(self, relative_dir):
+        """Watch relative_dir, and with recursion every folder below it"""
+        pending = [relative_dir]
+        while pending:
+            relative_dir = pending.pop()
+            path = os.path.join(self.folder, relative_dir)
+            try:
+                self._inotify.add_watch(path, relative_dir)
+            except OSError:
+                continue  # Vanished or out of watches; the periodic rescan still covers it
+            if not self.recursive:
+                return
+            try:
+                with os.scandir(path) as entries:
+                    pending.extend(os.path.join(relative_dir, entry.name) for entry in entries
+                                   if entry.name != engine.OUTPUT_FOLDER_NAME
+                                   and entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+
+    def _on_events(self, events):
+        for relative_path, mask in events:
+            if mask & IN_Q_OVERFLOW:
+                self._rescan()  # Events were dropped
+            elif mask & IN_ISDIR:
+                if self.recursive and mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files copied in with the folder may predate its watch
+                    self._watch_tree(relative_path)
+                    for name in scan_images(os.path.join(self.folder, relative_path), True):
+                        self._notice(os.path.join(relative_path, name))
+            elif relative_path.lower().endswith(engine.IMAGE_EXTENSIONS):
+                self._notice(relative_path)
+
+    def _rescan(self):
+        present = set()
+        for relative_path in scan_images(self.folder, self.recursive):
+            present.add(relative_path)
+            self._notice(relative_path)
+        # Forget files that have gone, so a long watch doesn't grow without bound
+        self._handed = {path: handed for path, handed in self._handed.items() if path in present}
+
+    def _notice(self, relative_path):
+        """Start (or restart) the settle timer of a file that may be new or changed"""
+        try:
+            current = fingerprint(os.path.join(self.folder, relative_path))
+        except OSError:
+            self._settling.pop(relative_path, None)
+            return
+        if self._handed.get(relative_path) == current:
+            return
+        settling = self._settling.get(relative_path)
+        if settling is None or settling[0] != current:
+            self._settling[relative_path] = (current, time.monotonic())
+
+    def _check_settled(self):
+        now = time.monotonic()
+        for relative_path, (previous, since) in list(self._settling.items()):
+            try:
+                current = fingerprint(os.path.join(self.folder, relative_path))
+            except OSError:
+                del self._settling[relative_path]  # Deleted or moved away
+                continue
+            if current != previous:
+                self._settling[relative_path] = (current, now)
+            elif now - since >= self.settle:
+                del self._settling[relative_path]
+                self._handed[relative_path] = current
+                self._ready.append(relative_path)
+
+
+@dataclass
+class WatchStats:
+    """Queue depth and throughput of a watch run, for the periodic status line"""
+    backend: str
+    settling: int
+    queued: int
+    in_flight: int
+    completed: int
+    failed: int
+    skipped: int
+    # Images per second since the previous stats, or since the start
+    rate: float
+    taken_at: float
+
+    @property
+    def depth(self):
+        """Files noticed but not finished yet"""
+        return self.settling + self.queued + self.in_flight
+
+    def summary(self):
+        return (f"[{self.backend}] depth {self.depth} ({self.settling} settling, "
+                f"{self.queued} queued, {self.in_flight} running)  •  {self.completed} done, "
+                f"{self.failed} failed, {self.skipped} up to date  •  "
+                f"{self.rate * 60:.1f} img/min")
+
+
+def watch_stats(watcher, runner, previous=None):
+    """WatchStats of a BatchRunner fed by watcher; previous sets the window the rate covers"""
+    progress = runner.progress()
+    now = time.monotonic()
+    if previous is None:
+        rate = progress.rate
+    else:
+        done = progress.completed + progress.failed - previous.completed - previous.failed
+        rate = done / (now - previous.taken_at) if now > previous.taken_at else 0.0
+    return WatchStats(backend=watcher.backend, settling=watcher.settling, queued=watcher.queued,
+                      in_flight=progress.total - progress.finished_count,
+                      completed=progress.completed, failed=progress.failed,
+                      skipped=runner.skipped, rate=rate, taken_at=now)
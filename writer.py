@@ -0,0 +1,82 @@
+"""Background encode/write queue for the GUI's Process & Next.
+
+Each job carries everything it needs (the decoded image, a snapshot of the
+settings, the output path), so the GUI can move on to the next image while
+the resize and encode run on a writer thread. Pillow releases the GIL for
+both, so the UI stays responsive. At most max_pending jobs are held at a
+time; submit() waits for a free slot beyond that, which bounds the decoded
+images kept alive by the queue.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs queued or running before submit() waits
+MAX_PENDING_WRITES = 4
+
+
+class BackgroundWriter:
+    def __init__(self, max_pending=MAX_PENDING_WRITES):
+        self.max_pending = max_pending
+        # One thread keeps writes in click order, so a re-processed image ends up
+        # with its latest settings
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self._slots = threading.Semaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        # (label, exception) of failed jobs, and results of finished ones, until taken
+        self._failures = []
+        self._results = []
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @property
+    def full(self):
+        return self._pending >= self.max_pending
+
+    def submit(self, label, func, *args):
+        """Queue func(*args), waiting for a slot if max_pending jobs are queued already.
+
+        label names the job in failures (usually the source file).
+        """
+        self._slots.acquire()
+        with self._lock:
+            self._pending += 1
+            self._idle.clear()
+        future = self._executor.submit(func, *args)
+        future.add_done_callback(lambda f: self._on_done(label, f))
+        return future
+
+    def _on_done(self, label, future):
+        with self._lock:
+            if future.exception() is not None:
+                self._failures.append((label, future.exception()))
+            else:
+                self._results.append((label, future.result()))
+            self._pending -= 1
+            if not self._pending:
+                self._idle.set()
+        self._slots.release()
+
+    def take_results(self):
+        """(label, result) of jobs finished since the last call"""
+        with self._lock:
+            results, self._results = self._results, []
+        return results
+
+    def take_failures(self):
+        """(label, exception) of jobs failed since the last call"""
+        with self._lock:
+            failures, self._failures = self._failures, []
+        return failures
+
+    def flush(self, timeout=None):
+        """Wait until every queued job has finished; False if timeout ran out first"""
+        return self._idle.wait(timeout)
+
+    def shutdown(self):
+        self.flush()
+        self._executor.shutdown(wait=True)